@@ -6,11 +6,13 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[],
-    hiddenimports=['win32com.client', 'PyPDF2', 'pptx'],
+    # 合併相關的庫在函數內部按需導入，這裡確保它們被打包
+    hiddenimports=['win32com.client', 'PyPDF2', 'pptx', 'lxml.etree'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    # 運行時不需要的標準庫部分，減小單文件程序每次啟動時需要解壓的體積
+    excludes=['tkinter.test', 'unittest', 'pydoc_data', 'lib2to3'],
     noarchive=False,
     optimize=0,
 )
@@ -26,7 +28,8 @@ exe = EXE(
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
+    # UPX 壓縮的 DLL 每次啟動都要解壓，並且容易觸發殺毒軟件掃描，反而拖慢啟動
+    upx=False,
     upx_exclude=[],
     runtime_tmpdir=None,
     console=True,
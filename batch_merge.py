@@ -0,0 +1,235 @@
+import os
+import csv
+import glob
+import json
+import time
+import logging
+from datetime import datetime
+
+from merge_utils import notify, ordered_parallel_map, split_input_spec
+
+FORMAT_ALIASES = {"ppt": "ppt", "pptx": "ppt", "pdf": "pdf"}
+
+
+class ManifestError(ValueError):
+    """任務清單格式錯誤"""
+
+
+def _expand_inputs(patterns, base_dir):
+    """按給定順序展開輸入文件，通配符匹配到的文件按名稱排序
+
+    帶範圍的輸入（如 report.pdf:1-5,9）展開後每個文件都保留該範圍。
+    """
+    files = []
+    for spec in patterns:
+        pattern, ranges = split_input_spec(spec)
+        suffix = f":{ranges}" if ranges else ""
+        path = pattern if os.path.isabs(pattern) else os.path.join(base_dir, pattern)
+        if glob.has_magic(path):
+            files.extend(match + suffix for match in sorted(glob.glob(path)))
+        else:
+            files.append(path + suffix)
+    return files
+
+
+def _normalize_job(raw, index, base_dir):
+    if not isinstance(raw, dict):
+        raise ManifestError(f"第 {index + 1} 個任務不是對象")
+
+    output = raw.get("output")
+    if not output:
+        raise ManifestError(f"第 {index + 1} 個任務缺少 output")
+    if not os.path.isabs(output):
+        output = os.path.join(base_dir, output)
+
+    inputs = raw.get("inputs")
+    if isinstance(inputs, str):
+        inputs = [item.strip() for item in inputs.split(";") if item.strip()]
+    if not inputs:
+        raise ManifestError(f"第 {index + 1} 個任務缺少 inputs")
+
+    # 未指定格式時根據輸出文件的擴展名判斷
+    format_name = (raw.get("format") or os.path.splitext(output)[1].lstrip(".")).lower()
+    if format_name not in FORMAT_ALIASES:
+        raise ManifestError(f"第 {index + 1} 個任務的格式不受支持: {format_name}")
+
+    optimize = None
+    if str(raw.get("optimize_images") or "").lower() in ("1", "true", "yes"):
+        from image_optimize import ImageOptions
+        try:
+            optimize = ImageOptions(
+                int(raw.get("image_dpi") or 150), int(raw.get("jpeg_quality") or 80)
+            )
+        except ValueError as e:
+            raise ManifestError(f"第 {index + 1} 個任務的圖片優化選項無效: {e}")
+
+    isolation = None
+    if str(raw.get("isolate") or "").lower() in ("1", "true", "yes"):
+        from merge_isolation import IsolationConfig
+        quarantine = raw.get("quarantine") or None
+        if quarantine and not os.path.isabs(quarantine):
+            quarantine = os.path.join(base_dir, quarantine)
+        try:
+            isolation = IsolationConfig(
+                float(raw.get("file_timeout") or 120), int(raw.get("file_memory_mb") or 2048), quarantine
+            )
+        except ValueError as e:
+            raise ManifestError(f"第 {index + 1} 個任務的隔離選項無效: {e}")
+
+    checkpoint = None
+    if str(raw.get("checkpoint") or "").lower() in ("1", "true", "yes"):
+        from merge_checkpoint import CheckpointConfig
+        try:
+            checkpoint = CheckpointConfig(
+                int(raw.get("checkpoint_every") or 50), float(raw.get("checkpoint_seconds") or 60)
+            )
+        except ValueError as e:
+            raise ManifestError(f"第 {index + 1} 個任務的檢查點選項無效: {e}")
+
+    return {
+        "id": str(raw.get("id") or index + 1),
+        "format": FORMAT_ALIASES[format_name],
+        "inputs": _expand_inputs(inputs, base_dir),
+        "output": output,
+        "optimize": optimize,
+        "linearize": str(raw.get("linearize") or "").lower() in ("1", "true", "yes"),
+        "isolation": isolation,
+        "checkpoint": checkpoint,
+    }
+
+
+def load_manifest(manifest_path):
+    """讀取任務清單，返回規範化後的任務列表
+
+    JSON 清單為任務數組（或含 "jobs" 鍵的對象），每個任務包含 inputs、output，
+    可選 format 和 id；CSV 清單的列名相同，inputs 中的多個文件用分號分隔。
+    optimize_images 為 true 時合併後壓縮圖片，可用 image_dpi 和 jpeg_quality 調整；
+    同一工作進程中的任務共用重新編碼的結果，相同的圖片只處理一次。
+    linearize 為 true 時PDF輸出線性化（快速網頁查看）。
+    isolate 為 true 時合併前在獨立進程中逐個檢查輸入（file_timeout 秒、file_memory_mb MB 為上限），
+    出錯的文件移到 quarantine 目錄（默認為輸入所在目錄下的 quarantine 文件夾），其餘文件照常合併。
+    checkpoint 為 true 時PDF合併期間定期寫檢查點（可用 checkpoint_every 和 checkpoint_seconds 調整間隔），
+    批量任務中途被終止後再次運行同一清單時，未完成的任務從檢查點繼續。
+    輸入文件後可帶頁碼範圍，如 "report.pdf:1-5,9"，只合併選中的頁面或幻燈片。
+    相對路徑以清單文件所在目錄為基準，inputs 的順序即合併順序。
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    if manifest_path.lower().endswith(".csv"):
+        with open(manifest_path, "r", encoding="utf-8-sig", newline="") as fh:
+            raw_jobs = list(csv.DictReader(fh))
+    else:
+        with open(manifest_path, "r", encoding="utf-8") as fh:
+            data = json.load(fh)
+        raw_jobs = data.get("jobs") if isinstance(data, dict) else data
+        if not isinstance(raw_jobs, list):
+            raise ManifestError("JSON 清單必須是任務數組或含有 jobs 數組的對象")
+
+    return [_normalize_job(raw, index, base_dir) for index, raw in enumerate(raw_jobs)]
+
+
+def merge_inputs(format_name, inputs, output, status_callback=None, trace=None, optimize=None,
+                 linearize=False, isolation=None, checkpoint=None):
+    """按給定順序合併一組文件，返回是否成功
+
+    與界面和命令行共用 merge_backends.run_merge，由後端註冊表選擇最快的可用後端；
+    各後端在常駐進程中只探測一次。傳入 MergeTrace 時記錄各階段的耗時和計數。
+    """
+    from merge_backends import run_merge
+    return run_merge(
+        format_name, inputs, output, status_callback, trace=trace, optimize=optimize,
+        linearize=linearize, isolation=isolation, checkpoint=checkpoint
+    )
+
+
+def run_job(job):
+    """在工作進程中執行一個合併任務，返回包含耗時、各階段耗時和狀態的結果
+
+    庫的導入和 PowerPoint 實例在同一個工作進程的多個任務之間共用。
+    """
+    from merge_trace import MergeTrace
+
+    trace = MergeTrace(job["id"])
+    messages = []
+    started = time.perf_counter()
+    result = {
+        "id": job["id"],
+        "format": job["format"],
+        "output": job["output"],
+        "inputs": len(job["inputs"]),
+        "status": "failed",
+        "error": None,
+    }
+    try:
+        missing = [
+            path for path in job["inputs"] if not os.path.exists(split_input_spec(path)[0])
+        ]
+        inputs = job["inputs"]
+        if missing and job.get("isolation") is not None:
+            # 啟用隔離檢查時缺少的文件可能已被其他任務移到隔離目錄，跳過它們繼續合併
+            messages.append(f"找不到輸入文件，已跳過: {', '.join(missing)}")
+            inputs = [path for path in inputs if path not in missing]
+        elif missing:
+            raise FileNotFoundError(f"找不到輸入文件: {', '.join(missing)}")
+        if merge_inputs(
+            job["format"], inputs, job["output"], messages.append, trace, job.get("optimize"),
+            job.get("linearize", False), job.get("isolation"), job.get("checkpoint")
+        ):
+            result["status"] = "ok"
+            result["output_bytes"] = os.path.getsize(job["output"])
+    except Exception as e:
+        result["error"] = str(e)
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    summary = trace.to_dict()["otherData"]
+    result["stages"] = summary["stages"]
+    result["counters"] = summary["counters"]
+    result["messages"] = messages
+    return result
+
+
+def run_batch(manifest_path, workers=1, report_file=None, status_callback=None):
+    """在一個常駐進程池中執行清單中的全部任務，最後寫出 JSON 報告
+
+    返回報告內容；有任務失敗時 report["failed"] 大於 0。
+    """
+    jobs = load_manifest(manifest_path)
+    if report_file is None:
+        report_file = os.path.splitext(manifest_path)[0] + "_report.json"
+
+    notify(f"共 {len(jobs)} 個任務，使用 {max(workers, 1)} 個工作進程", status_callback)
+    started = time.perf_counter()
+    results = []
+    for job, result, error in ordered_parallel_map(run_job, jobs, workers):
+        if error is not None:
+            # 工作進程本身崩潰時 run_job 無法返回結果
+            result = {
+                "id": job["id"], "format": job["format"], "output": job["output"],
+                "inputs": len(job["inputs"]), "status": "failed", "error": str(error),
+                "seconds": None, "messages": [],
+            }
+        results.append(result)
+        if result["status"] == "ok":
+            notify(f"任務 {result['id']} 完成 ({result['seconds']:.2f} 秒): {result['output']}", status_callback)
+        else:
+            notify(f"任務 {result['id']} 失敗: {result['error']}", status_callback, logging.ERROR)
+
+    failed = sum(1 for result in results if result["status"] != "ok")
+    quarantined = sum(result.get("counters", {}).get("files_quarantined", 0) for result in results)
+    report = {
+        "manifest": os.path.abspath(manifest_path),
+        "finished_at": datetime.now().isoformat(timespec="seconds"),
+        "workers": workers,
+        "total_seconds": round(time.perf_counter() - started, 3),
+        "succeeded": len(results) - failed,
+        "failed": failed,
+        "quarantined": quarantined,
+        "jobs": results,
+    }
+    with open(report_file, "w", encoding="utf-8") as fh:
+        json.dump(report, fh, ensure_ascii=False, indent=2)
+
+    notify(
+        f"批量處理完成: 成功 {report['succeeded']}, 失敗 {failed}, 隔離文件 {quarantined}, "
+        f"總耗時 {report['total_seconds']:.2f} 秒，報告已寫入: {report_file}",
+        status_callback,
+    )
+    return report
@@ -0,0 +1,310 @@
+import os
+import sys
+import json
+import time
+import glob
+import zlib
+import random
+import struct
+import shutil
+import argparse
+import platform
+import tempfile
+import multiprocessing
+from datetime import datetime
+
+# 基準測試結果和生成的語料默認放在 benchmarks 目錄下
+BENCH_DIR = "benchmarks"
+
+# 測試項名稱 -> (merge_backends 中的後端名稱, 是否使用全部CPU核心, 是否使用緩存)
+# 名稱與早期的結果文件保持一致，方便比較；auto 為 run_merge 自動選擇的後端
+BENCH_VARIANTS = {
+    "pypdf2": ("pypdf2", False, False),
+    "streaming": ("pdf-stream", False, False),
+    "pipeline": ("pdf-pipeline", False, False),
+    "parallel": ("pdf-parallel", True, False),
+    "cached": ("pdf-parallel", True, True),
+    "xml": ("pptx-xml", False, False),
+    "xml-parallel": ("pptx-xml", True, False),
+    "com": ("powerpoint-com", False, False),
+    "auto": (None, True, False),
+    "compact-fast": ("pdf-stream", False, False),
+    "compact": ("pdf-stream", False, False),
+    "compact-max": ("pdf-stream", False, False),
+}
+# 緊湊輸出（對象流和交叉引用流）的測試項 -> 壓縮級別，與 streaming 比較輸出大小和寫出耗時
+BENCH_COMPRESS_LEVELS = {"compact-fast": 1, "compact": 6, "compact-max": 9}
+PDF_BACKENDS = ("pypdf2", "streaming", "pipeline", "parallel", "cached", "compact", "auto")
+PPT_BACKENDS = ("xml", "xml-parallel", "auto", "com")
+
+
+def _image_pixels(size_kb, seed):
+    """返回隨機 RGB 像素數據及其寬高；隨機數據幾乎不可壓縮，壓縮後大小接近 size_kb"""
+    side = max(int((size_kb * 1024 / 3) ** 0.5), 1)
+    size = side * side * 3
+    pixels = random.Random(seed).getrandbits(size * 8).to_bytes(size, "little")
+    return pixels, side, side
+
+
+def _png_bytes(pixels, width, height):
+    def chunk(tag, data):
+        body = tag + data
+        return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body) & 0xFFFFFFFF)
+
+    stride = width * 3
+    raw = b"".join(b"\x00" + pixels[row * stride:(row + 1) * stride] for row in range(height))
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(raw, 6))
+        + chunk(b"IEND", b"")
+    )
+
+
+def write_synthetic_pdf(path, pages, image=None, label=""):
+    """直接寫出一個簡單的PDF：每頁一段文字，可選地在每頁引用同一張圖片"""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # 頁面樹在確定頁面對象編號後填入
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    image_ref = b""
+    if image is not None:
+        pixels, width, height = image
+        data = zlib.compress(pixels, 6)
+        objects.append(
+            b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceRGB "
+            b"/BitsPerComponent 8 /Filter /FlateDecode /Length %d >>\nstream\n%s\nendstream"
+            % (width, height, len(data), data)
+        )
+        image_ref = b" /XObject << /Im1 %d 0 R >>" % len(objects)
+
+    kids = []
+    for page in range(pages):
+        text = f"{label} page {page + 1}".encode("latin-1", "replace")
+        content = b"BT /F1 24 Tf 72 720 Td (%s) Tj ET" % text
+        if image is not None:
+            content += b"\nq 300 0 0 300 72 300 cm /Im1 Do Q"
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content))
+        content_num = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents %d 0 R "
+            b"/Resources << /Font << /F1 3 0 R >>%s >> >>" % (content_num, image_ref)
+        )
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Count %d /Kids [%s] >>" % (
+        len(kids), b" ".join(b"%d 0 R" % kid for kid in kids)
+    )
+
+    with open(path, "wb") as fh:
+        fh.write(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+        offsets = []
+        for num, body in enumerate(objects, 1):
+            offsets.append(fh.tell())
+            fh.write(b"%d 0 obj\n%s\nendobj\n" % (num, body))
+        xref_pos = fh.tell()
+        fh.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        fh.write(b"".join(b"%010d 00000 n \n" % offset for offset in offsets))
+        fh.write(
+            b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+            % (len(objects) + 1, xref_pos)
+        )
+
+
+def write_synthetic_pptx(path, slides, image=None, label=""):
+    """用 python-pptx 生成演示文稿：每張幻燈片一個標題，可選地插入圖片"""
+    import io
+    from pptx import Presentation
+    from pptx.util import Inches
+
+    presentation = Presentation()
+    layout = presentation.slide_layouts[5]
+    picture = _png_bytes(*image) if image is not None else None
+    for index in range(slides):
+        slide = presentation.slides.add_slide(layout)
+        slide.shapes.title.text = f"{label} slide {index + 1}"
+        if picture is not None:
+            slide.shapes.add_picture(io.BytesIO(picture), Inches(1), Inches(2), Inches(4), Inches(4))
+    presentation.save(path)
+
+
+def generate_corpus(corpus_dir, format_name, files, pages, image_kb=0, duplicate_ratio=0.0, seed=0):
+    """生成合成語料並寫出 corpus.json 描述，已存在時直接復用
+
+    duplicate_ratio 為使用同一張共享圖片的文件比例，其餘文件各自使用不同的圖片，
+    用於衡量媒體/流去重的效果。
+    """
+    meta_path = os.path.join(corpus_dir, "corpus.json")
+    if os.path.exists(meta_path):
+        with open(meta_path, "r", encoding="utf-8") as fh:
+            return json.load(fh)
+
+    os.makedirs(corpus_dir, exist_ok=True)
+    rng = random.Random(seed)
+    shared = _image_pixels(image_kb, seed) if image_kb else None
+    extension = "pdf" if format_name == "pdf" else "pptx"
+    writer = write_synthetic_pdf if format_name == "pdf" else write_synthetic_pptx
+    total_bytes = 0
+    for index in range(files):
+        image = None
+        if image_kb:
+            image = shared if rng.random() < duplicate_ratio else _image_pixels(image_kb, seed + index + 1)
+        path = os.path.join(corpus_dir, f"{index:05d}.{extension}")
+        writer(path, pages, image, label=f"file {index + 1}")
+        total_bytes += os.path.getsize(path)
+
+    meta = {
+        "format": format_name,
+        "files": files,
+        "pages_per_file": pages,
+        "total_pages": files * pages,
+        "image_kb": image_kb,
+        "duplicate_ratio": duplicate_ratio,
+        "seed": seed,
+        "input_bytes": total_bytes,
+    }
+    with open(meta_path, "w", encoding="utf-8") as fh:
+        json.dump(meta, fh, indent=2)
+    return meta
+
+
+def _run_backend(backend, format_name, inputs, output_file, cache_dir, result_queue):
+    """在獨立進程中執行一次合併，使內存峰值只反映這一次運行"""
+    from merge_utils import peak_rss_mb
+
+    try:
+        if backend not in BENCH_VARIANTS:
+            raise ValueError(f"未知的後端: {backend}")
+        name, parallel, cached = BENCH_VARIANTS[backend]
+        jobs = (os.cpu_count() or 1) if parallel else 1
+        cache = None
+        if cached:
+            from merge_cache import MergeCache
+            cache = MergeCache(cache_dir)
+
+        # 與界面和命令行走同一個合併流程，測到的就是實際使用的代碼
+        from merge_backends import run_merge, probe_backends
+        from merge_trace import MergeTrace
+        probe_backends()
+        started = time.perf_counter()
+        trace = MergeTrace()
+        if not run_merge(
+            format_name, inputs, output_file, jobs=jobs, cache=cache, backend=name, trace=trace,
+            compress_level=BENCH_COMPRESS_LEVELS.get(backend)
+        ):
+            raise RuntimeError("合併失敗")
+        seconds = time.perf_counter() - started
+        # 寫出耗時包括複製對象和最後寫出頁面樹、交叉引用表
+        totals = trace.stage_totals()
+        write_seconds = sum(totals[stage][1] for stage in ("copy", "write") if stage in totals)
+        result_queue.put({
+            "seconds": seconds, "write_seconds": write_seconds, "peak_rss_mb": peak_rss_mb(),
+        })
+    except Exception as e:
+        result_queue.put({"error": f"{type(e).__name__}: {e}"})
+
+
+def run_benchmark(backend, corpus_dir, meta, work_dir, warm=False):
+    """執行一次基準測試並返回結果記錄
+
+    warm 為 True 時先運行一次預熱（用於衡量增量緩存命中後的耗時）。
+    """
+    extension = "pdf" if meta["format"] == "pdf" else "pptx"
+    inputs = sorted(glob.glob(os.path.join(corpus_dir, f"*.{extension}")))
+    output_file = os.path.join(work_dir, f"{backend}.{extension}")
+    cache_dir = os.path.join(work_dir, "cache")
+
+    context = multiprocessing.get_context()
+    runs = 2 if warm else 1
+    for _ in range(runs):
+        result_queue = context.Queue()
+        process = context.Process(
+            target=_run_backend,
+            args=(backend, meta["format"], inputs, output_file, cache_dir, result_queue),
+        )
+        process.start()
+        result = result_queue.get()
+        process.join()
+
+    record = {
+        "backend": backend,
+        **{key: meta[key] for key in ("format", "files", "pages_per_file", "image_kb", "duplicate_ratio")},
+        "input_mb": round(meta["input_bytes"] / (1024 * 1024), 3),
+    }
+    if "error" in result:
+        record["error"] = result["error"]
+        return record
+    record.update({
+        "seconds": round(result["seconds"], 4),
+        "write_seconds": round(result["write_seconds"], 4),
+        "pages_per_sec": round(meta["total_pages"] / result["seconds"], 1) if result["seconds"] else None,
+        "peak_rss_mb": round(result["peak_rss_mb"], 1) if result["peak_rss_mb"] is not None else None,
+        "output_mb": round(os.path.getsize(output_file) / (1024 * 1024), 3),
+    })
+    return record
+
+
+def _int_list(value):
+    return [int(item) for item in value.split(",") if item]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='合併後端的基準測試')
+    parser.add_argument('--format', type=str, default='pdf', choices=['pdf', 'ppt'], help='語料格式')
+    parser.add_argument('--files', type=_int_list, default=[10, 100], help='文件數量，逗號分隔 (默認: 10,100)')
+    parser.add_argument('--pages', type=_int_list, default=[5], help='每個文件的頁數/幻燈片數，逗號分隔')
+    parser.add_argument('--image-kb', type=int, default=64, help='每個文件嵌入圖片的大小，0 表示不嵌入')
+    parser.add_argument('--dup', type=float, default=0.5, help='使用同一張共享圖片的文件比例 (0-1)')
+    parser.add_argument('--backends', type=str, default=None,
+                        help=f'逗號分隔的後端列表 (PDF: {",".join(PDF_BACKENDS)}; PPT: {",".join(PPT_BACKENDS)})')
+    parser.add_argument('--repeat', type=int, default=1, help='每個組合重複運行的次數')
+    parser.add_argument('--results', type=str, default=os.path.join(BENCH_DIR, 'results.jsonl'),
+                        help='結果追加寫入的 JSON Lines 文件')
+    args = parser.parse_args()
+
+    default_backends = PDF_BACKENDS if args.format == 'pdf' else PPT_BACKENDS[:3]
+    backends = args.backends.split(",") if args.backends else list(default_backends)
+    run_info = {
+        "run_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+    os.makedirs(os.path.dirname(args.results) or ".", exist_ok=True)
+    print(f"{'後端':<14}{'文件':>7}{'頁數':>7}{'秒':>10}{'寫出秒':>10}{'頁/秒':>10}{'內存MB':>9}{'輸出MB':>9}")
+    with open(args.results, "a", encoding="utf-8") as results:
+        for files in args.files:
+            for pages in args.pages:
+                corpus_dir = os.path.join(
+                    BENCH_DIR, "corpus",
+                    f"{args.format}-f{files}-p{pages}-img{args.image_kb}-dup{args.dup:g}",
+                )
+                meta = generate_corpus(corpus_dir, args.format, files, pages, args.image_kb, args.dup)
+                for backend in backends:
+                    for _ in range(args.repeat):
+                        work_dir = tempfile.mkdtemp(prefix="bench_")
+                        try:
+                            record = run_benchmark(
+                                backend, corpus_dir, meta, work_dir, warm=backend == "cached"
+                            )
+                        finally:
+                            shutil.rmtree(work_dir, ignore_errors=True)
+                        record.update(run_info)
+                        results.write(json.dumps(record, ensure_ascii=False) + "\n")
+                        results.flush()
+                        if "error" in record:
+                            print(f"{backend:<14}{files:>7}{pages:>7}  失敗: {record['error']}")
+                            continue
+                        print(
+                            f"{backend:<14}{files:>7}{pages:>7}{record['seconds']:>10.3f}"
+                            f"{record['write_seconds']:>10.3f}{record['pages_per_sec'] or 0:>10.1f}{record['peak_rss_mb'] or 0:>9.1f}"
+                            f"{record['output_mb']:>9.2f}"
+                        )
+    print(f"結果已追加到: {args.results}")
+    return 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,324 @@
+import os
+import re
+import json
+import hashlib
+import logging
+import zipfile
+from datetime import datetime
+from contextlib import nullcontext
+
+from merge_utils import notify, check_cancelled, ordered_parallel_map, split_input_spec, select_pages
+
+# 索引文件保存在 docs 文件夾中，不會被 *.pdf / *.ppt* 匹配到
+INDEX_NAME = ".merge_index.json"
+# 記錄的字段變化時遞增，舊索引整體重建
+INDEX_VERSION = 1
+# 自定義順序文件，每行一個文件名，# 開頭為註釋
+ORDER_FILE = "order.txt"
+# 可選的輸入順序
+ORDERS = {
+    "name": "文件名",
+    "natural": "自然排序",
+    "date": "修改時間",
+    "custom": "自定義（order.txt）",
+}
+# 演示文稿的標題和幻燈片列表所在的部件
+_NS_DC = "http://purl.org/dc/elements/1.1/"
+_NS_P = "http://schemas.openxmlformats.org/presentationml/2006/main"
+_OLE_MAGIC = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+
+
+def _natural_key(path):
+    """自然排序鍵："slide2" 排在 "slide10" 前面，不區分大小寫"""
+    name = os.path.basename(split_input_spec(path)[0]).casefold()
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", name)], path
+
+
+def _mtime(path):
+    # 排序時已被刪除的文件排在最前，合併時按出錯的文件處理
+    try:
+        return os.path.getmtime(split_input_spec(path)[0])
+    except OSError:
+        return 0.0
+
+
+def _read_order_file(docs_dir):
+    try:
+        with open(os.path.join(docs_dir, ORDER_FILE), "r", encoding="utf-8-sig") as fh:
+            lines = [line.strip() for line in fh]
+    except OSError:
+        return []
+    return [line.lower() for line in lines if line and not line.startswith("#")]
+
+
+def order_inputs(files, order="name", docs_dir="docs"):
+    """按指定方式排列輸入文件（可以帶頁碼範圍），結果與文件系統返回的順序無關
+
+    name     按路徑排序（默認，與之前的行為相同）
+    natural  按文件名自然排序，文件名中的數字按數值比較
+    date     按修改時間從早到晚，時間相同時按文件名
+    custom   按 docs 文件夾中 order.txt 列出的文件名順序，未列出的文件按自然排序排在後面
+    """
+    if order not in ORDERS:
+        raise ValueError(f"未知的排序方式: {order}（可選 {', '.join(ORDERS)}）")
+    if order == "name":
+        return sorted(files)
+    if order == "natural":
+        return sorted(files, key=_natural_key)
+    if order == "date":
+        return sorted(files, key=lambda path: (_mtime(path), _natural_key(path)))
+    positions = {name: index for index, name in reversed(list(enumerate(_read_order_file(docs_dir))))}
+    return sorted(
+        files,
+        key=lambda path: (
+            positions.get(os.path.basename(split_input_spec(path)[0]).lower(), len(positions)),
+            _natural_key(path),
+        ),
+    )
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _pdf_info(path, info):
+    from PyPDF2 import PdfReader
+    from pdf_stream import open_mapped_pdf
+
+    with open_mapped_pdf(path) as stream:
+        reader = PdfReader(stream)
+        info["encrypted"] = bool(reader.is_encrypted)
+        if reader.is_encrypted and not reader.decrypt(""):
+            # 需要密碼的文件無法讀取頁數，合併時也會失敗
+            info["error"] = "需要密碼才能打開"
+            return
+        info["pages"] = len(reader.pages)
+        metadata = reader.metadata
+        title = str(metadata.get("/Title") or "").strip() if metadata else ""
+        info["title"] = title or None
+
+
+def _pptx_info(path, info):
+    from lxml import etree
+    from pptx_merge import _ZipPackage
+
+    package = _ZipPackage(path)
+    try:
+        pres = etree.fromstring(package.read(package.main_partname()))
+        info["pages"] = sum(1 for _ in pres.iter(f"{{{_NS_P}}}sldId"))
+        if package.has_part("/docProps/core.xml"):
+            core = etree.fromstring(package.read("/docProps/core.xml"))
+            info["title"] = (core.findtext(f"{{{_NS_DC}}}title") or "").strip() or None
+    finally:
+        package.close()
+
+
+def read_file_info(path):
+    """工作進程入口：讀取一個輸入文件的內容哈希、頁數（或幻燈片數）、標題和加密狀態
+
+    無法解析的文件不拋出異常，原因記錄在 error 中。
+    """
+    stat = os.stat(path)
+    info = {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": _file_sha256(path),
+        "pages": None,
+        "title": None,
+        "encrypted": False,
+        "error": None,
+    }
+    extension = os.path.splitext(path)[1].lower()
+    try:
+        if extension == ".pdf":
+            _pdf_info(path, info)
+        elif zipfile.is_zipfile(path):
+            _pptx_info(path, info)
+        elif extension == ".ppt":
+            # 舊的二進制格式只有 PowerPoint 能讀取，不統計幻燈片數
+            pass
+        else:
+            with open(path, "rb") as fh:
+                header = fh.read(len(_OLE_MAGIC))
+            if header == _OLE_MAGIC:
+                # 設置了打開密碼的 .pptx 被加密後保存在 OLE 複合文檔中，不再是 ZIP 包
+                info["encrypted"] = True
+                info["error"] = "需要密碼才能打開"
+            else:
+                info["error"] = "不是有效的演示文稿"
+    except Exception as e:
+        info["error"] = str(e) or type(e).__name__
+    return info
+
+
+class DocsIndex:
+    """輸入文件夾的持久索引
+
+    按文件記錄大小、修改時間、內容哈希、頁數（或幻燈片數）、標題、加密狀態和解析錯誤，
+    保存在 docs 文件夾的 .merge_index.json 中。刷新時只重新讀取大小或修改時間變化了的文件，
+    合併之前就能知道預計的頁數、輸出大小和耗時，並提前發現無法合併的文件。
+    """
+
+    def __init__(self, docs_dir="docs", index_path=None):
+        self.docs_dir = docs_dir
+        self.index_path = index_path or os.path.join(docs_dir, INDEX_NAME)
+        self.base_dir = os.path.dirname(os.path.abspath(self.index_path))
+        self.refreshed = 0
+        self._entries = self._load()
+
+    def _load(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as fh:
+                data = json.load(fh)
+            if data.get("version") == INDEX_VERSION:
+                return data["files"]
+        except (OSError, ValueError, KeyError):
+            pass
+        return {}
+
+    def _key(self, path):
+        # 相對於索引文件的路徑，整個文件夾移動或改名後索引仍然有效
+        return os.path.relpath(os.path.abspath(path), self.base_dir).replace(os.sep, "/")
+
+    def entry(self, path):
+        """返回文件的索引記錄，未索引時返回 None"""
+        return self._entries.get(self._key(path))
+
+    def refresh(self, files, jobs=1, status_callback=None, cancel_event=None, trace=None):
+        """更新指定文件的記錄，返回按輸入順序排列的記錄列表
+
+        files 可以帶頁碼範圍；大小和修改時間未變的文件直接使用已有的記錄，
+        其餘文件在進程池中並行讀取。
+        """
+        paths = list(dict.fromkeys(split_input_spec(spec)[0] for spec in files))
+        refreshed = 0
+        stale = []
+        missing = set()
+        for path in paths:
+            entry = self.entry(path)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                missing.add(path)
+                continue
+            if entry is None or entry["size"] != stat.st_size or entry["mtime_ns"] != stat.st_mtime_ns:
+                stale.append(path)
+
+        if stale:
+            notify(f"正在更新文件索引: {len(stale)} 個新增或修改的文件", status_callback)
+            with trace.span("index") if trace is not None else nullcontext():
+                results = ordered_parallel_map(read_file_info, stale, jobs)
+                try:
+                    for path, info, error in results:
+                        check_cancelled(cancel_event)
+                        if error is not None:
+                            notify(f"無法讀取文件 {path}: {error}", status_callback, logging.ERROR)
+                            continue
+                        info["indexed_at"] = datetime.now().isoformat(timespec="seconds")
+                        self._entries[self._key(path)] = info
+                        refreshed += 1
+                finally:
+                    results.close()
+            self.refreshed += refreshed
+            if trace is not None:
+                trace.count("files_indexed", refreshed)
+        return [
+            None if path in missing else self.entry(path)
+            for path in (split_input_spec(spec)[0] for spec in files)
+        ]
+
+    def save(self):
+        """刪除已不存在的文件的記錄並寫回索引"""
+        from merge_cache import _atomic_write
+
+        for key in [key for key in self._entries if not os.path.exists(os.path.join(self.base_dir, key))]:
+            del self._entries[key]
+        data = {"version": INDEX_VERSION, "files": self._entries}
+        os.makedirs(self.base_dir, exist_ok=True)
+        _atomic_write(self.index_path, json.dumps(data, ensure_ascii=False, indent=1).encode("utf-8"))
+
+
+def validate_inputs(files, entries):
+    """根據索引記錄找出合併時會失敗的輸入，返回 [(輸入, 原因)]"""
+    problems = []
+    for spec, entry in zip(files, entries):
+        ranges = split_input_spec(spec)[1]
+        if entry is None:
+            problems.append((spec, "找不到文件"))
+        elif entry["error"]:
+            problems.append((spec, entry["error"]))
+        elif ranges is not None and entry["pages"] is not None:
+            try:
+                if not select_pages(ranges, entry["pages"]):
+                    problems.append((spec, "範圍中沒有選中任何頁"))
+            except ValueError as e:
+                problems.append((spec, str(e)))
+    return problems
+
+
+def _selected_pages(spec, entry):
+    """範圍選中的頁數，無法確定時返回 None"""
+    if entry is None or entry["pages"] is None:
+        return None
+    try:
+        return len(select_pages(split_input_spec(spec)[1], entry["pages"]))
+    except ValueError:
+        return 0
+
+
+def preview_lines(format_name, files, entries, jobs=1, details=True):
+    """根據索引記錄估計合併結果，返回可以直接顯示的文本行
+
+    輸出大小按選中頁數佔全部頁數的比例折算輸入大小（不計跨文件去重），
+    耗時按會被選中的合併後端的預計吞吐量估算。
+    """
+    from merge_backends import select_backend, FORMAT_LABELS
+    from merge_utils import is_remote_path
+
+    unit = "頁" if format_name == "pdf" else "張"
+    lines = []
+    total_pages = 0
+    unknown_pages = 0
+    input_bytes = 0
+    output_bytes = 0
+    for spec, entry in zip(files, entries):
+        selected = _selected_pages(spec, entry)
+        if selected is not None:
+            total_pages += selected
+        elif entry is not None and not entry["error"]:
+            # 無法讀取的文件由 validate_inputs 列出，這裡只統計能合併但頁數未知的文件（如 .ppt）
+            unknown_pages += 1
+        if entry is not None and not entry["error"]:
+            input_bytes += entry["size"]
+            fraction = selected / entry["pages"] if selected is not None and entry["pages"] else 1
+            output_bytes += entry["size"] * fraction
+        if details:
+            if entry is None:
+                lines.append(f"  {spec}  （未索引）")
+                continue
+            pages = "?" if selected is None else str(selected)
+            flags = []
+            if entry["encrypted"]:
+                flags.append("已加密")
+            if entry["error"]:
+                flags.append(f"無法讀取: {entry['error']}")
+            title = f"  《{entry['title']}》" if entry["title"] else ""
+            suffix = f"  [{'; '.join(flags)}]" if flags else ""
+            lines.append(f"  {spec}  {pages} {unit}  {entry['size'] / (1024 * 1024):.2f} MB{title}{suffix}")
+
+    pages_text = f"{total_pages} {unit}" + (f"（另有 {unknown_pages} 個文件頁數未知）" if unknown_pages else "")
+    lines.append(
+        f"共 {len(files)} 個 {FORMAT_LABELS[format_name]} 文件, 預計 {pages_text}, "
+        f"輸入 {input_bytes / (1024 * 1024):.1f} MB, 預計輸出約 {output_bytes / (1024 * 1024):.1f} MB"
+    )
+    backend = select_backend(format_name, files, jobs=jobs)
+    if backend is not None and files:
+        remote = is_remote_path(split_input_spec(files[0])[0])
+        throughput = backend.expected_throughput(jobs, len(files), remote)
+        seconds = input_bytes / (1024 * 1024) / throughput
+        lines.append(f"預計使用 {backend.label}，耗時約 {seconds:.1f} 秒（{throughput:.0f} MB/s）")
+    return lines
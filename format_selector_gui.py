@@ -1,20 +1,37 @@
+import time
+
+# 記錄解釋器開始執行本模塊的時間，用於統計啟動耗時
+_START_TIME = time.perf_counter()
+
 import os
 import sys
 import traceback
 import logging
-import glob
-import argparse
+import queue
+import threading
+import importlib
 from datetime import datetime
 import tkinter as tk
 from tkinter import ttk, messagebox
 import io
 
-# 設置標準輸出的編碼為UTF-8
-sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
-sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
+_IMPORTS_DONE = time.perf_counter()
+
+# 設置標準輸出的編碼為UTF-8（無控制台的打包程序中 stdout 為 None）
+if sys.stdout is not None:
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+if sys.stderr is not None:
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
+
+# 合併時才需要的庫，窗口顯示之後在後台線程中預先導入
+PRELOAD_MODULES = ("PyPDF2", "pdf_stream", "pptx_merge", "merge_cache", "merge_backends", "win32com.client")
 
 # 設置日誌
 def setup_logging():
+    # 已經配置過時直接返回，避免重複創建日誌文件
+    if logging.getLogger().handlers:
+        return logging.getLogger('格式選擇器')
+    
     # 確保logs目錄存在
     logs_dir = "logs"
     if not os.path.exists(logs_dir):
@@ -38,236 +55,75 @@ def setup_logging():
     logger.info(f"日誌文件已創建: {os.path.abspath(log_file)}")
     return logger
 
-# 創建日誌記錄器
-logger = setup_logging()
+# 日誌記錄器的處理器在窗口首次繪製之後才由 setup_logging 配置，
+# 這樣窗口可以更早顯示，進程池的工作進程導入本模塊時也不會各自創建日誌文件
+logger = logging.getLogger('格式選擇器')
 
-# 從merge_files.py整合的函數
-def generate_ppt(output_file, status_callback=None):
-    """生成PPT文件並保存到指定路徑"""
-    # 確保輸出目錄存在
-    output_dir = os.path.dirname(output_file)
-    if output_dir and not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-    
-    try:
-        # 嘗試使用高級方法（需要 Windows 和 PowerPoint）
-        import win32com.client
-        
-        # 獲取 docs 文件夾中的所有 PPT 文件
-        ppt_files = glob.glob("docs/*.ppt*")
-        
-        if not ppt_files:
-            msg = "docs 文件夾中沒有找到 PPT 文件"
-            if status_callback:
-                status_callback(msg)
-            logger.warning(msg)
-            return False
-        
-        # 啟動 PowerPoint 應用程序
-        ppt_app = win32com.client.Dispatch("PowerPoint.Application")
-        
-        # 使用第一個文件作為基礎，而不是創建新的空演示文稿
-        msg = f"正在使用第一個文件作為基礎: {ppt_files[0]}"
-        if status_callback:
-            status_callback(msg)
-        logger.info(msg)
-        
-        base_path = os.path.abspath(ppt_files[0])
-        merged_presentation = ppt_app.Presentations.Open(base_path)
-        
-        # 遍歷剩餘的 PPT 文件並合併
-        for ppt_file in ppt_files[1:]:
-            msg = f"正在處理: {ppt_file}"
-            if status_callback:
-                status_callback(msg)
-            logger.info(msg)
-            
-            try:
-                # 打開當前 PPT 文件
-                abs_path = os.path.abspath(ppt_file)
-                current_presentation = ppt_app.Presentations.Open(abs_path)
-                
-                # 獲取幻燈片數量
-                slide_count = current_presentation.Slides.Count
-                
-                # 複製所有幻燈片到合併的演示文稿
-                for i in range(1, slide_count + 1):
-                    current_presentation.Slides(i).Copy()
-                    merged_presentation.Slides.Paste()
-                
-                # 關閉當前演示文稿而不保存
-                current_presentation.Close()
-            except Exception as e:
-                msg = f"處理文件 {ppt_file} 時出錯: {e}"
-                if status_callback:
-                    status_callback(msg)
-                logger.error(msg)
-        
-        # 保存合併後的 PPT 到指定路徑
-        output_abs_path = os.path.abspath(output_file)
-        merged_presentation.SaveAs(output_abs_path)
-        merged_presentation.Close()
-        
-        # 關閉 PowerPoint 應用程序
-        ppt_app.Quit()
-        msg = f"已成功合併所有 PPT 文件到: {output_file}"
-        if status_callback:
-            status_callback(msg)
-        logger.info(msg)
-        return True
-        
-    except ImportError as e:
-        msg = f"導入錯誤: {e}"
-        if status_callback:
-            status_callback(msg)
-        logger.error(msg)
-        
-        # 如果無法導入 win32com，則使用 python-pptx（功能有限）
+def preload_modules():
+    """在後台線程中預先導入合併所需的庫並探測可用的合併後端，點擊生成時無需再等待"""
+    for name in PRELOAD_MODULES:
+        started = time.perf_counter()
         try:
-            from pptx import Presentation
-            
-            # 獲取 docs 文件夾中的所有 PPT 文件
-            ppt_files = glob.glob("docs/*.ppt*")
-            
-            if not ppt_files:
-                msg = "docs 文件夾中沒有找到 PPT 文件"
-                if status_callback:
-                    status_callback(msg)
-                logger.warning(msg)
-                return False
-            
-            # 創建一個新的演示文稿
-            merged_ppt = Presentation()
-            
-            # 遍歷所有 PPT 文件並合併
-            for ppt_file in ppt_files:
-                msg = f"正在處理: {ppt_file}"
-                if status_callback:
-                    status_callback(msg)
-                logger.info(msg)
-                
-                try:
-                    # 打開當前 PPT 文件
-                    current_ppt = Presentation(ppt_file)
-                    
-                    # 複製每一張幻燈片到新的演示文稿
-                    for slide in current_ppt.slides:
-                        # 複製幻燈片布局
-                        slide_layout = merged_ppt.slide_layouts[0]  # 使用默認布局
-                        new_slide = merged_ppt.slides.add_slide(slide_layout)
-                        
-                        # 複製所有形狀
-                        for shape in slide.shapes:
-                            # 這裡我們只能複製基本元素，複雜元素可能需要更詳細的處理
-                            if shape.has_text_frame:
-                                for paragraph in shape.text_frame.paragraphs:
-                                    for run in paragraph.runs:
-                                        text_shape = new_slide.shapes.add_textbox(
-                                            shape.left, shape.top, shape.width, shape.height
-                                        )
-                                        text_frame = text_shape.text_frame
-                                        p = text_frame.add_paragraph()
-                                        p.text = run.text
-                                        # 注意：這裡沒有複製格式，如果需要可以添加更多代碼
-                except Exception as e:
-                    msg = f"處理文件 {ppt_file} 時出錯: {e}"
-                    if status_callback:
-                        status_callback(msg)
-                    logger.error(msg)
-            
-            # 保存合併後的 PPT 到指定路徑
-            merged_ppt.save(output_file)
-            msg = f"已成功合併所有 PPT 文件到: {output_file}"
-            if status_callback:
-                status_callback(msg)
-            logger.info(msg)
-            
-            msg = "注意：使用 python-pptx 合併可能會丟失一些格式和效果"
-            if status_callback:
-                status_callback(msg)
-            logger.warning(msg)
-            return True
-            
+            importlib.import_module(name)
         except ImportError:
-            msg = "錯誤：需要安裝 python-pptx 庫才能合併 PPT 文件"
-            if status_callback:
-                status_callback(msg)
-            logger.error(msg)
-            
-            msg = "請運行: pip install python-pptx"
-            if status_callback:
-                status_callback(msg)
-            logger.info(msg)
-            return False
+            continue
+        except Exception as e:
+            logger.warning(f"預加載 {name} 失敗: {e}")
+            continue
+        logger.info(f"已預加載 {name} ({(time.perf_counter() - started) * 1000:.0f} ms)")
+    
+    from merge_backends import probe_backends
+    for backend, reason in probe_backends():
+        if reason is None:
+            logger.info(f"合併後端可用: {backend.label}")
+        else:
+            logger.info(f"合併後端不可用: {backend.label}（{reason}）")
 
-def generate_pdf(output_file, status_callback=None):
-    """生成PDF文件並保存到指定路徑"""
-    # 確保輸出目錄存在
-    output_dir = os.path.dirname(output_file)
-    if output_dir and not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+def launch_time():
+    """返回本次啟動的時間戳；單文件打包時以負責解壓的引導進程為準"""
+    from merge_utils import process_start_time
     
-    try:
-        from PyPDF2 import PdfMerger
-        
-        # 獲取 docs 文件夾中的所有 PDF 文件
-        pdf_files = glob.glob("docs/*.pdf")
-        
-        if not pdf_files:
-            msg = "docs 文件夾中沒有找到 PDF 文件"
-            if status_callback:
-                status_callback(msg)
-            logger.warning(msg)
-            return False
-        
-        # 創建 PDF 合併器
-        merger = PdfMerger()
-        
-        # 遍歷所有 PDF 文件並合併
-        for pdf_file in pdf_files:
-            msg = f"正在處理: {pdf_file}"
-            if status_callback:
-                status_callback(msg)
-            logger.info(msg)
-            
-            try:
-                merger.append(pdf_file)
-            except Exception as e:
-                msg = f"處理文件 {pdf_file} 時出錯: {e}"
-                if status_callback:
-                    status_callback(msg)
-                logger.error(msg)
-        
-        # 保存合併後的 PDF 到指定路徑
-        merger.write(output_file)
-        merger.close()
-        msg = f"已成功合併所有 PDF 文件到: {output_file}"
-        if status_callback:
-            status_callback(msg)
-        logger.info(msg)
-        return True
-        
-    except ImportError:
-        msg = "錯誤：需要安裝 PyPDF2 庫才能合併 PDF 文件"
-        if status_callback:
-            status_callback(msg)
-        logger.error(msg)
-        
-        msg = "請運行: pip install PyPDF2"
-        if status_callback:
-            status_callback(msg)
-        logger.info(msg)
-        return False
+    meipass = getattr(sys, '_MEIPASS', None)
+    if meipass and os.path.basename(meipass).startswith("_MEI"):
+        return process_start_time(os.getppid())
+    return process_start_time()
 
 class FormatSelectorApp:
+    # 界面每隔多少毫秒處理一次進度消息
+    POLL_INTERVAL_MS = 100
+    
     def __init__(self, root):
         self.root = root
         self.root.title("文件格式選擇器")
-        self.root.geometry("400x350")
+        self.root.geometry("400x705")
         self.root.resizable(False, False)
         
         # 設置格式變量
         self.format_var = tk.StringVar(value="ppt")
+        self.streaming_var = tk.BooleanVar(value=False)
+        self.mixed_var = tk.BooleanVar(value=False)
+        self.parallel_var = tk.BooleanVar(value=False)
+        self.cache_var = tk.BooleanVar(value=True)
+        self.optimize_var = tk.BooleanVar(value=False)
+        self.linearize_var = tk.BooleanVar(value=False)
+        self.isolate_var = tk.BooleanVar(value=False)
+        self.ranges_var = tk.StringVar(value="")
+        self.order_var = tk.StringVar(value="")
+        self.watch_var = tk.BooleanVar(value=False)
+        self.lag_var = tk.StringVar(value="")
+        
+        # 監視模式下正在運行的 FolderWatcher，用於顯示輸出落後的程度
+        self.watcher = None
+        
+        # 增量緩存在多次點擊之間共用，首次使用時創建
+        self.cache = None
+        
+        # 合併在後台工作線程中執行，進度消息經隊列傳回界面線程
+        self.events = queue.Queue()
+        self.tasks = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.worker = threading.Thread(target=self.worker_loop, name="merge-worker", daemon=True)
+        self.worker.start()
         
         # 創建界面元素
         self.create_widgets()
@@ -275,7 +131,13 @@ class FormatSelectorApp:
         # 居中窗口
         self.center_window()
         
-        logger.info("Tkinter界面已初始化")
+        # 定時處理工作線程發來的事件，限制界面重繪頻率
+        self.root.after(self.POLL_INTERVAL_MS, self.poll_events)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        
+        # 窗口首次顯示後再配置日誌和預加載合併庫
+        self.window_created = time.perf_counter()
+        self.root.bind("<Map>", self.on_first_map)
     
     def create_widgets(self):
         # 標題標籤
@@ -310,6 +172,94 @@ class FormatSelectorApp:
         )
         self.pdf_radio.pack(anchor="w", padx=20, pady=(5, 10))
         
+        # 合併選項框架
+        options_frame = ttk.LabelFrame(self.root, text="選項")
+        options_frame.pack(fill="x", padx=50, pady=(0, 10))
+        
+        # 流式合併選項（僅對PDF生效）
+        self.streaming_check = ttk.Checkbutton(
+            options_frame,
+            text="低內存模式（PDF流式合併）",
+            variable=self.streaming_var
+        )
+        self.streaming_check.pack(anchor="w", padx=20, pady=(10, 0))
+        
+        # 混合輸入（僅對PDF生效）：docs 中的演示文稿用 LibreOffice 轉換後一起合併
+        self.mixed_check = ttk.Checkbutton(
+            options_frame,
+            text="PDF包含演示文稿（需要 LibreOffice）",
+            variable=self.mixed_var
+        )
+        self.mixed_check.pack(anchor="w", padx=20)
+        
+        # 並行處理選項
+        self.parallel_check = ttk.Checkbutton(
+            options_frame,
+            text=f"並行處理（{os.cpu_count() or 1} 個CPU核心）",
+            variable=self.parallel_var
+        )
+        self.parallel_check.pack(anchor="w", padx=20)
+        
+        # 增量緩存選項
+        self.cache_check = ttk.Checkbutton(
+            options_frame,
+            text="增量緩存（只重新處理變化的文件）",
+            variable=self.cache_var
+        )
+        self.cache_check.pack(anchor="w", padx=20)
+        
+        # 圖片優化選項：縮小到 150 DPI 並轉換為 JPEG
+        self.optimize_check = ttk.Checkbutton(
+            options_frame,
+            text="壓縮圖片（150 DPI，減小輸出文件）",
+            variable=self.optimize_var
+        )
+        self.optimize_check.pack(anchor="w", padx=20)
+        
+        # 線性化選項（僅對PDF生效）：首頁寫在文件開頭，網頁中可以邊下載邊顯示
+        self.linearize_check = ttk.Checkbutton(
+            options_frame,
+            text="快速網頁查看（PDF線性化）",
+            variable=self.linearize_var
+        )
+        self.linearize_check.pack(anchor="w", padx=20)
+        
+        # 隔離檢查選項：損壞、卡住或佔用過多內存的文件移到 docs/quarantine，不影響其他文件
+        self.isolate_check = ttk.Checkbutton(
+            options_frame,
+            text="隔離檢查（損壞文件移到 quarantine）",
+            variable=self.isolate_var
+        )
+        self.isolate_check.pack(anchor="w", padx=20)
+        
+        # 頁碼範圍，如 report.pdf:1-5,9; deck.pptx:3-12，留空表示合併全部頁面
+        ranges_label = ttk.Label(options_frame, text="頁碼範圍（如 report.pdf:1-5,9）：")
+        ranges_label.pack(anchor="w", padx=20, pady=(5, 0))
+        self.ranges_entry = ttk.Entry(options_frame, textvariable=self.ranges_var)
+        self.ranges_entry.pack(fill="x", padx=20, pady=(0, 5))
+        
+        # 文件順序：文件名、自然排序、修改時間或 docs/order.txt 中的自定義順序
+        from docs_index import ORDERS
+        order_frame = ttk.Frame(options_frame)
+        order_frame.pack(fill="x", padx=20, pady=(0, 5))
+        ttk.Label(order_frame, text="文件順序：").pack(side="left")
+        self.order_combo = ttk.Combobox(
+            order_frame,
+            textvariable=self.order_var,
+            values=list(ORDERS.values()),
+            state="readonly"
+        )
+        self.order_combo.pack(side="left", fill="x", expand=True)
+        self.order_var.set(ORDERS["name"])
+        
+        # 監視模式：docs 文件夾有變化時自動增量更新同一個輸出文件
+        self.watch_check = ttk.Checkbutton(
+            options_frame,
+            text="監視 docs 文件夾，自動更新輸出",
+            variable=self.watch_var
+        )
+        self.watch_check.pack(anchor="w", padx=20, pady=(0, 10))
+        
         # 狀態文本框
         self.status_text = tk.Text(
             self.root,
@@ -318,7 +268,11 @@ class FormatSelectorApp:
             wrap="word",
             state="normal"
         )
-        self.status_text.pack(padx=50, pady=15, fill="x")
+        self.status_text.pack(padx=50, pady=(15, 0), fill="x")
+        
+        # 監視模式下顯示輸出是否為最新
+        self.lag_label = ttk.Label(self.root, textvariable=self.lag_var)
+        self.lag_label.pack(padx=50, anchor="w")
         
         # 添加滾動條
         scrollbar = ttk.Scrollbar(self.status_text)
@@ -326,17 +280,55 @@ class FormatSelectorApp:
         self.status_text.config(yscrollcommand=scrollbar.set)
         scrollbar.config(command=self.status_text.yview)
         
+        # 按鈕框架
+        button_frame = ttk.Frame(self.root)
+        button_frame.pack(pady=15)
+        
         # 生成按鈕
         self.generate_button = ttk.Button(
-            self.root,
+            button_frame,
             text="生成文件",
             command=self.on_generate_click
         )
-        self.generate_button.pack(pady=15)
+        self.generate_button.pack(side="left", padx=5)
+        
+        # 取消按鈕，僅在生成過程中可用
+        self.cancel_button = ttk.Button(
+            button_frame,
+            text="取消",
+            command=self.on_cancel_click,
+            state="disabled"
+        )
+        self.cancel_button.pack(side="left", padx=5)
         
         # 初始化狀態信息
         self.update_status("準備就緒。請選擇格式並點擊「生成文件」按鈕。")
     
+    def on_first_map(self, event):
+        if event.widget is not self.root:
+            return
+        self.root.unbind("<Map>")
+        # 等待本輪繪製完成後再記錄首次繪製時間
+        self.root.after_idle(self.finish_startup)
+    
+    def finish_startup(self):
+        first_paint = time.perf_counter()
+        first_paint_wall = time.time()
+        setup_logging()
+        
+        timings = (
+            f"模塊導入 {(_IMPORTS_DONE - _START_TIME) * 1000:.0f} ms, "
+            f"創建窗口 {(self.window_created - _IMPORTS_DONE) * 1000:.0f} ms, "
+            f"首次繪製 {(first_paint - _START_TIME) * 1000:.0f} ms"
+        )
+        launched = launch_time()
+        if launched is not None:
+            timings += f", 從進程啟動起共 {(first_paint_wall - launched) * 1000:.0f} ms"
+        logger.info(f"啟動耗時: {timings}")
+        logger.info("Tkinter界面已初始化")
+        
+        threading.Thread(target=preload_modules, name="preload", daemon=True).start()
+    
     def center_window(self):
         self.root.update_idletasks()
         width = self.root.winfo_width()
@@ -354,8 +346,186 @@ class FormatSelectorApp:
         self.status_text.insert("end", f"{message}\n")
         self.status_text.see("end")
         self.status_text.config(state="disabled")
-        # 更新界面
-        self.root.update()
+    
+    def post_status(self, message):
+        """供工作線程使用的狀態回調，只把消息放入隊列，不直接操作界面"""
+        self.events.put(("status", message))
+    
+    def poll_events(self):
+        """取出隊列中積累的全部事件，狀態消息合併為一次界面更新"""
+        messages = []
+        finished = []
+        while True:
+            try:
+                kind, payload = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "status":
+                messages.append(payload)
+            else:
+                finished.append((kind, payload))
+        
+        if messages:
+            self.update_status("\n".join(messages))
+        for kind, payload in finished:
+            self.on_task_finished(kind, payload)
+        
+        watcher = self.watcher
+        if watcher is not None:
+            self.lag_var.set(watcher.describe_lag())
+        
+        self.root.after(self.POLL_INTERVAL_MS, self.poll_events)
+    
+    def worker_loop(self):
+        """後台工作線程：依次執行隊列中的合併任務，收到 None 時退出"""
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                break
+            self.run_task(task)
+        
+        # PowerPoint 的 COM 實例屬於本線程，需要在這裡關閉
+        try:
+            from ppt_com import release_com_backend
+            release_com_backend()
+        except ImportError:
+            pass
+    
+    def run_task(self, task):
+        from merge_utils import MergeCancelled
+        from merge_trace import MergeTrace
+        from merge_backends import discover_inputs, run_merge
+        
+        format_type = task["format_type"]
+        output_file = task["output_file"]
+        if task["watch"]:
+            self.run_watch(task)
+            return
+        trace = MergeTrace(format_type)
+        try:
+            # 與命令行、批量模式共用同一個合併流程，由後端註冊表選擇最快的可用後端
+            files = discover_inputs(
+                format_type, ranges=task["ranges"], trace=trace, mixed=task["mixed"], order=task["order"]
+            )
+            success = run_merge(
+                format_type, files, output_file, self.post_status,
+                jobs=task["jobs"], cache=task["cache"], cancel_event=self.cancel_event,
+                trace=trace, streaming=task["streaming"] and format_type == "pdf",
+                optimize=task["optimize"], linearize=task["linearize"] and format_type == "pdf",
+                isolation=task["isolation"]
+            )
+            self.report_trace(trace, task)
+            self.events.put(("success" if success else "failure", task))
+        except MergeCancelled:
+            # 已處理完的文件由 run_merge 保存到緩存中，下次可以直接使用
+            logger.info(f"用戶取消了{format_type.upper()}文件的生成")
+            self.events.put(("cancelled", task))
+        except Exception as e:
+            error_details = traceback.format_exc()
+            logger.error(f"發生異常: {str(e)}\n{error_details}")
+            task["error"] = str(e)
+            self.events.put(("error", task))
+    
+    def run_watch(self, task):
+        """監視 docs 文件夾並持續更新輸出，直到用戶取消或關閉窗口"""
+        from watch_merge import FolderWatcher
+        
+        self.watcher = FolderWatcher(
+            task["format_type"], task["output_file"], cache=task["cache"], jobs=task["jobs"],
+            ranges=task["ranges"], status_callback=self.post_status, order=task["order"]
+        )
+        try:
+            self.watcher.run(self.cancel_event)
+            self.events.put(("stopped", task))
+        except Exception as e:
+            error_details = traceback.format_exc()
+            logger.error(f"發生異常: {str(e)}\n{error_details}")
+            task["error"] = str(e)
+            self.events.put(("error", task))
+        finally:
+            self.watcher = None
+    
+    def report_trace(self, trace, task):
+        """把耗時摘要顯示在狀態欄，並把完整的追蹤記錄寫入 logs 目錄"""
+        trace.report(self.post_status)
+        trace_file = os.path.join(
+            "logs", f"trace_{os.path.splitext(os.path.basename(task['output_file']))[0]}.json"
+        )
+        try:
+            trace.write_json(trace_file)
+            logger.info(f"追蹤文件已寫入: {trace_file}")
+        except OSError as e:
+            logger.warning(f"無法寫入追蹤文件: {e}")
+    
+    def on_task_finished(self, kind, task):
+        """在界面線程中處理任務結果"""
+        format_type = task["format_type"]
+        output_file = task["output_file"]
+        output_dir = task["output_dir"]
+        
+        # 啟用生成按鈕
+        self.generate_button.config(state="normal")
+        self.cancel_button.config(state="disabled")
+        
+        # 檢查執行結果
+        if kind == "success":
+            logger.info(f"文件生成成功: {output_file}")
+            self.update_status(f"{format_type.upper()}文件已生成成功！")
+            self.update_status(f"文件位置：{output_file}")
+            
+            # 詢問是否打開文件所在的文件夾
+            answer = messagebox.askyesno(
+                "生成成功",
+                f"{format_type.upper()}文件已生成成功！\n\n文件位置：{output_file}\n\n是否打開文件所在的文件夾？"
+            )
+            
+            if answer:
+                try:
+                    os.startfile(output_dir)
+                    logger.info(f"已打開文件夾: {output_dir}")
+                except Exception as e:
+                    logger.error(f"打開文件夾失敗: {str(e)}")
+                    self.update_status(f"打開文件夾時發生錯誤: {str(e)}")
+                    self.update_status("請手動瀏覽到以下位置查看文件:")
+                    self.update_status(output_dir)
+        elif kind == "cancelled":
+            self.update_status("已取消生成，未保存輸出文件。")
+        elif kind == "stopped":
+            self.lag_var.set("")
+            self.update_status(f"已停止監視，最後一次更新的輸出文件保留在：{output_file}")
+        elif kind == "failure":
+            logger.error(f"生成失敗")
+            self.update_status(f"生成失敗")
+            self.update_status("請檢查logs目錄下的日誌文件以獲取詳細錯誤信息")
+            
+            messagebox.showerror(
+                "生成失敗",
+                f"生成{format_type.upper()}文件失敗！\n\n請檢查logs目錄下的日誌文件以獲取詳細信息。"
+            )
+        else:
+            self.update_status(f"發生錯誤: {task['error']}")
+            self.update_status("詳細錯誤信息已寫入日誌文件，請查看logs目錄")
+            
+            messagebox.showerror(
+                "錯誤",
+                f"處理過程中發生錯誤！\n\n錯誤信息：{task['error']}\n\n詳細錯誤信息已寫入日誌文件，請查看logs目錄。"
+            )
+    
+    def on_cancel_click(self):
+        logger.info("用戶請求取消生成")
+        self.cancel_event.set()
+        self.cancel_button.config(state="disabled")
+        if self.watcher is not None:
+            self.update_status("正在停止監視...")
+        else:
+            self.update_status("正在取消，將在當前文件處理完成後停止...")
+    
+    def on_close(self):
+        # 通知工作線程取消當前任務並退出，最多等待片刻以便關閉 PowerPoint
+        self.cancel_event.set()
+        self.tasks.put(None)
+        self.worker.join(timeout=5)
+        self.root.destroy()
     
     def on_generate_click(self):
         try:
@@ -365,7 +535,6 @@ class FormatSelectorApp:
             
             # 禁用生成按鈕
             self.generate_button.config(state="disabled")
-            self.root.update()
             
             # 獲取腳本路徑
             if getattr(sys, 'frozen', False):
@@ -393,52 +562,54 @@ class FormatSelectorApp:
             
             # 構建輸出文件路徑
             timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-            output_file = os.path.join(output_dir, f"output_{timestamp}.{format_type}")
+            # 各合併後端寫出的都是 OOXML 格式的演示文稿
+            extension = "pptx" if format_type == "ppt" else format_type
+            watch = self.watch_var.get()
+            if watch:
+                # 監視模式持續更新同一個文件，重新開始監視時繼續使用
+                output_file = os.path.join(output_dir, f"output_watch.{extension}")
+            else:
+                output_file = os.path.join(output_dir, f"output_{timestamp}.{extension}")
             logger.info(f"輸出文件路徑: {output_file}")
             
             # 切換到腳本目錄，確保相對路徑正確
             os.chdir(script_dir)
             
-            # 直接調用合併函數，而不是使用subprocess
-            success = False
-            if format_type == "ppt":
-                success = generate_ppt(output_file, self.update_status)
-            elif format_type == "pdf":
-                success = generate_pdf(output_file, self.update_status)
+            # 在交給工作線程之前檢查範圍格式，格式錯誤時直接提示
+            from merge_utils import apply_range_specs
+            from image_optimize import ImageOptions
+            from merge_isolation import IsolationConfig
+            from docs_index import ORDERS
+            ranges = self.ranges_var.get().strip() or None
+            apply_range_specs([], ranges)
             
-            # 啟用生成按鈕
-            self.generate_button.config(state="normal")
+            jobs = (os.cpu_count() or 1) if self.parallel_var.get() else 1
+            cache = None
+            # 監視模式依靠緩存只重新處理變化的文件，總是啟用
+            if self.cache_var.get() or watch:
+                if self.cache is None:
+                    from merge_cache import MergeCache
+                    self.cache = MergeCache(os.path.join(script_dir, "cache"))
+                cache = self.cache
             
-            # 檢查執行結果
-            if success:
-                logger.info(f"文件生成成功: {output_file}")
-                self.update_status(f"{format_type.upper()}文件已生成成功！")
-                self.update_status(f"文件位置：{output_file}")
-                
-                # 詢問是否打開文件所在的文件夾
-                answer = messagebox.askyesno(
-                    "生成成功",
-                    f"{format_type.upper()}文件已生成成功！\n\n文件位置：{output_file}\n\n是否打開文件所在的文件夾？"
-                )
-                
-                if answer:
-                    try:
-                        os.startfile(output_dir)
-                        logger.info(f"已打開文件夾: {output_dir}")
-                    except Exception as e:
-                        logger.error(f"打開文件夾失敗: {str(e)}")
-                        self.update_status(f"打開文件夾時發生錯誤: {str(e)}")
-                        self.update_status("請手動瀏覽到以下位置查看文件:")
-                        self.update_status(output_dir)
-            else:
-                logger.error(f"生成失敗")
-                self.update_status(f"生成失敗")
-                self.update_status("請檢查logs目錄下的日誌文件以獲取詳細錯誤信息")
-                
-                messagebox.showerror(
-                    "生成失敗",
-                    f"生成{format_type.upper()}文件失敗！\n\n請檢查logs目錄下的日誌文件以獲取詳細信息。"
-                )
+            # 交給後台工作線程執行，結果通過事件隊列返回
+            self.cancel_event.clear()
+            self.cancel_button.config(state="normal")
+            self.tasks.put({
+                "format_type": format_type,
+                "output_file": output_file,
+                "output_dir": output_dir,
+                "streaming": self.streaming_var.get(),
+                "mixed": self.mixed_var.get(),
+                "jobs": jobs,
+                "cache": cache,
+                "ranges": ranges,
+                "order": next(key for key, label in ORDERS.items() if label == self.order_var.get()),
+                "watch": watch,
+                "optimize": ImageOptions() if self.optimize_var.get() else None,
+                "linearize": self.linearize_var.get(),
+                "isolation": IsolationConfig() if self.isolate_var.get() else None,
+            })
                 
         except Exception as e:
             error_details = traceback.format_exc()
@@ -448,6 +619,7 @@ class FormatSelectorApp:
             
             # 啟用生成按鈕
             self.generate_button.config(state="normal")
+            self.cancel_button.config(state="disabled")
             
             messagebox.showerror(
                 "錯誤",
@@ -461,6 +633,7 @@ def main():
         root.mainloop()
     except Exception as e:
         error_details = traceback.format_exc()
+        setup_logging()
         logger.error(f"程序啟動時發生嚴重錯誤: {str(e)}\n{error_details}")
         
         # 嘗試顯示錯誤對話框
@@ -477,4 +650,8 @@ def main():
             input("\n按Enter鍵退出...")
 
 if __name__ == "__main__":
+    import multiprocessing
+    
+    # 打包後的可執行文件啟動工作進程時需要
+    multiprocessing.freeze_support()
     main() 
\ No newline at end of file
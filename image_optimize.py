@@ -0,0 +1,593 @@
+import io
+import os
+import math
+import mmap
+import zlib
+import hashlib
+import logging
+import posixpath
+import threading
+import zipfile
+
+from merge_utils import notify, ordered_parallel_map, check_cancelled, remove_partial_output
+
+# PPTX 幻燈片尺寸的單位：每英寸 914400 EMU
+EMU_PER_INCH = 914400
+# 同一進程中重新編碼結果的內存緩存上限，批量模式下多個任務共用
+MEMO_MAX_BYTES = 64 * 1024 * 1024
+
+# PDF 圖片可以處理的顏色空間，其他（如 Indexed、DeviceN）保持原樣
+_PDF_MODES = {"/DeviceRGB": "RGB", "/DeviceGray": "L"}
+_ICC_MODES = {3: "RGB", 1: "L"}
+
+
+class ImageOptions:
+    """圖片優化選項
+
+    dpi          圖片的最大分辨率；顯示尺寸按圖片所在頁面（幻燈片）的大小上限估算，
+                 即圖片鋪滿整頁時的分辨率，實際顯示更小的圖片會保留更多像素
+    jpeg_quality 重新編碼 JPEG 時的質量 (1-95)
+    png_to_jpeg  把沒有透明通道的無損圖片轉換為 JPEG
+    """
+
+    def __init__(self, dpi=150, jpeg_quality=80, png_to_jpeg=True):
+        if dpi <= 0:
+            raise ValueError("目標分辨率必須大於 0")
+        if not 1 <= jpeg_quality <= 95:
+            raise ValueError("JPEG 質量必須在 1 到 95 之間")
+        self.dpi = dpi
+        self.jpeg_quality = jpeg_quality
+        self.png_to_jpeg = png_to_jpeg
+
+    @property
+    def variant(self):
+        return f"{self.dpi}-{self.jpeg_quality}-{int(self.png_to_jpeg)}"
+
+    def __repr__(self):
+        return (
+            f"ImageOptions(dpi={self.dpi}, jpeg_quality={self.jpeg_quality}, "
+            f"png_to_jpeg={self.png_to_jpeg})"
+        )
+
+
+class _ResultMemo:
+    """按圖片哈希保存重新編碼結果，超過上限時丟棄最早的條目"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._items = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            return self._items.get(key)
+
+    def put(self, key, result):
+        size = len(result["data"]) if result.get("data") else 0
+        with self._lock:
+            if key in self._items:
+                return
+            self._items[key] = result
+            self._bytes += size
+            for old_key in list(self._items):
+                if self._bytes <= self.max_bytes:
+                    break
+                old = self._items.pop(old_key)
+                self._bytes -= len(old["data"]) if old.get("data") else 0
+
+
+_memo = _ResultMemo(MEMO_MAX_BYTES)
+
+
+def recompress_image(job):
+    """工作進程入口：按要求縮小並重新編碼一張圖片
+
+    job 為 (來源, 數據, 像素上限, JPEG質量, 是否轉換無損圖片)；來源為 "file" 時數據是
+    完整的圖片文件，為 "raw" 時數據是 (模式, 寬, 高, 像素)。
+    返回 {"format": "jpeg" | "png" | "raw", "data", "width", "height", "mode"}，
+    結果不比原圖小時 data 為 None。
+    """
+    from PIL import Image
+
+    source, payload, limit, quality, png_to_jpeg = job
+    if source == "raw":
+        mode, width, height, pixels = payload
+        image = Image.frombytes(mode, (width, height), pixels)
+        original_size = None
+        lossy = False
+    else:
+        image = Image.open(io.BytesIO(payload))
+        image.load()
+        original_size = len(payload)
+        lossy = image.format == "JPEG"
+
+    has_alpha = image.mode in ("RGBA", "LA", "PA") or (
+        image.mode == "P" and "transparency" in image.info
+    )
+    scale = min(1.0, limit / max(image.size)) if limit else 1.0
+    to_jpeg = not has_alpha and (lossy or png_to_jpeg) and image.mode in ("RGB", "L", "P", "CMYK")
+    if scale >= 1.0 and not to_jpeg:
+        return {"data": None}
+
+    if scale < 1.0:
+        size = (max(1, round(image.size[0] * scale)), max(1, round(image.size[1] * scale)))
+        if image.mode == "P":
+            image = image.convert("RGBA" if has_alpha else "RGB")
+        image = image.resize(size, Image.LANCZOS)
+
+    out = io.BytesIO()
+    if to_jpeg:
+        if image.mode not in ("RGB", "L", "CMYK"):
+            image = image.convert("RGB")
+        image.save(out, "JPEG", quality=quality, optimize=True)
+        result_format = "jpeg"
+    elif source == "raw":
+        out.write(zlib.compress(image.tobytes(), 6))
+        result_format = "raw"
+    else:
+        image.save(out, "PNG", optimize=True)
+        result_format = "png"
+    data = out.getvalue()
+    if original_size is not None and len(data) >= original_size:
+        data = None
+    return {
+        "format": result_format,
+        "data": data,
+        "width": image.size[0],
+        "height": image.size[1],
+        "mode": image.mode,
+    }
+
+
+class _Optimizer:
+    """收集需要處理的圖片，按哈希去重後交給工作進程，並匯總前後大小"""
+
+    def __init__(self, options, jobs=1, cache=None, status_callback=None, cancel_event=None,
+                 trace=None):
+        self.options = options
+        self.jobs = jobs
+        self.cache = cache
+        self.status_callback = status_callback
+        self.cancel_event = cancel_event
+        self.trace = trace
+        self.images = 0
+        self.optimized = 0
+        self.bytes_before = 0
+        self.bytes_after = 0
+        self.encoded = 0
+        self.reused = 0
+
+    def _key(self, digest, limit):
+        return f"image-{digest}-{self.options.variant}-{limit}"
+
+    def run(self, requests):
+        """requests 為 [(標識, 來源, 數據, 像素上限, 原始大小)]，返回 {標識: 結果}
+
+        內容和像素上限都相同的圖片只重新編碼一次；結果先在進程內共用，
+        傳入 MergeCache 時也保存到磁盤緩存中，下次合併時直接使用。
+        """
+        results = {}
+        todo = {}
+        waiting = {}
+        for ident, source, payload, limit, size in requests:
+            self.images += 1
+            self.bytes_before += size
+            raw = payload if source == "file" else payload[3]
+            digest = hashlib.sha256(raw).hexdigest()
+            if source == "raw":
+                digest = hashlib.sha256(
+                    f"{digest}-{payload[0]}-{payload[1]}x{payload[2]}".encode("ascii")
+                ).hexdigest()
+            key = self._key(digest, limit)
+            waiting.setdefault(key, []).append((ident, size))
+            if key in todo:
+                continue
+            cached = _memo.get(key)
+            if cached is None and self.cache is not None:
+                cached = self.cache.get(key)
+                if cached is not None:
+                    _memo.put(key, cached)
+            if cached is not None:
+                results[key] = cached
+                self.reused += 1
+                continue
+            todo[key] = (source, payload, limit, self.options.jpeg_quality, self.options.png_to_jpeg)
+
+        items = list(todo.items())
+        self.encoded += len(items)
+        encoded = ordered_parallel_map(_recompress_item, items, min(self.jobs, len(items)))
+        try:
+            for (key, _), result, error in encoded:
+                check_cancelled(self.cancel_event)
+                if error is not None:
+                    notify(f"無法處理圖片: {error}", self.status_callback, logging.WARNING)
+                    result = {"data": None}
+                results[key] = result
+                _memo.put(key, result)
+                if self.cache is not None:
+                    self.cache.put(key, result)
+        finally:
+            encoded.close()
+
+        by_ident = {}
+        for key, idents in waiting.items():
+            result = results.get(key, {"data": None})
+            for ident, size in idents:
+                if result.get("data") and len(result["data"]) < size:
+                    by_ident[ident] = result
+                    self.optimized += 1
+                    self.bytes_after += len(result["data"])
+                else:
+                    self.bytes_after += size
+        return by_ident
+
+    def report(self, output_file, size_before):
+        size_after = os.path.getsize(output_file)
+        if self.trace is not None:
+            self.trace.count("images", self.images)
+            self.trace.count("images_optimized", self.optimized)
+            self.trace.count("images_reused", self.reused)
+            self.trace.count("image_bytes_before", self.bytes_before)
+            self.trace.count("image_bytes_after", self.bytes_after)
+        saved = size_before - size_after
+        notify(
+            f"圖片優化: {self.images} 張圖片，替換 {self.optimized} 張"
+            f"（重新編碼 {self.encoded} 張，使用已有結果 {self.reused} 張），"
+            f"圖片 {self.bytes_before / (1024 * 1024):.2f} MB -> {self.bytes_after / (1024 * 1024):.2f} MB",
+            self.status_callback,
+        )
+        notify(
+            f"文件大小: {size_before / (1024 * 1024):.2f} MB -> {size_after / (1024 * 1024):.2f} MB"
+            f"（減少 {saved / max(size_before, 1) * 100:.0f}%）",
+            self.status_callback,
+        )
+        return {
+            "images": self.images,
+            "images_optimized": self.optimized,
+            "image_bytes_before": self.bytes_before,
+            "image_bytes_after": self.bytes_after,
+            "bytes_before": size_before,
+            "bytes_after": size_after,
+        }
+
+
+def _recompress_item(item):
+    return recompress_image(item[1])
+
+
+def _pixel_limit(width_inches, height_inches, dpi):
+    return math.ceil(max(width_inches, height_inches) * dpi)
+
+
+def _pdf_image_request(obj, limit):
+    """返回交給 recompress_image 的 (來源, 數據)，不能安全處理的圖片返回 None"""
+    from PyPDF2.generic import ArrayObject
+
+    if obj.get("/ImageMask") or "/Mask" in obj or "/Decode" in obj:
+        return None
+    if obj.get("/BitsPerComponent") != 8:
+        return None
+    color_space = obj.get("/ColorSpace")
+    if color_space is not None:
+        color_space = color_space.get_object()
+    if isinstance(color_space, ArrayObject):
+        if len(color_space) != 2 or color_space[0] != "/ICCBased":
+            return None
+        mode = _ICC_MODES.get(color_space[1].get_object().get("/N"))
+    else:
+        mode = _PDF_MODES.get(color_space)
+    if mode is None:
+        return None
+
+    filters = obj.get("/Filter")
+    if isinstance(filters, ArrayObject):
+        filters = filters[0] if len(filters) == 1 else None
+    if filters == "/DCTDecode":
+        return "file", obj._data
+    if filters == "/FlateDecode" or filters is None:
+        pixels = obj.get_data()
+        width, height = obj["/Width"], obj["/Height"]
+        if len(pixels) != width * height * len(mode):
+            return None
+        return "raw", (mode, width, height, pixels)
+    return None
+
+
+def _collect_pdf_images(reader, dpi):
+    """返回 {(對象編號, 代數): 像素上限}，同一圖片出現在多頁時取最大的上限"""
+    from PyPDF2.generic import IndirectObject
+
+    images = {}
+    for page in reader.pages:
+        box = page.mediabox
+        limit = _pixel_limit(float(box.width) / 72, float(box.height) / 72, dpi)
+        stack = [page.get("/Resources")]
+        visited = set()
+        while stack:
+            resources = stack.pop()
+            resources = resources.get_object() if resources is not None else None
+            if not resources:
+                continue
+            xobjects = resources.get("/XObject")
+            if xobjects is None:
+                continue
+            for ref in xobjects.get_object().values():
+                if not isinstance(ref, IndirectObject):
+                    continue
+                ident = (ref.idnum, ref.generation)
+                obj = ref.get_object()
+                subtype = obj.get("/Subtype")
+                if subtype == "/Image":
+                    images[ident] = max(images.get(ident, 0), limit)
+                elif subtype == "/Form" and ident not in visited:
+                    visited.add(ident)
+                    stack.append(obj.get("/Resources"))
+    return images
+
+
+def _write_image_object(out, num, generation, obj, result):
+    """按重新編碼的結果寫出圖片對象，保留原字典中的其他條目（如 SMask、ColorSpace）"""
+    from PyPDF2.generic import NameObject
+
+    replaced = {"/Filter", "/DecodeParms", "/Length", "/Width", "/Height", "/BitsPerComponent"}
+    buf = io.BytesIO()
+    buf.write(b"%d %d obj\n<<" % (num, generation))
+    for key, value in obj.items():
+        if key in replaced:
+            continue
+        buf.write(b"\n")
+        NameObject(key).write_to_stream(buf, None)
+        buf.write(b" ")
+        value.write_to_stream(buf, None)
+    filter_name = b"/DCTDecode" if result["format"] == "jpeg" else b"/FlateDecode"
+    buf.write(
+        b"\n/Width %d\n/Height %d\n/BitsPerComponent 8\n/Filter %s\n/Length %d\n>>\nstream\n"
+        % (result["width"], result["height"], filter_name, len(result["data"]))
+    )
+    out.write(buf.getvalue())
+    out.write(result["data"])
+    out.write(b"\nendstream\nendobj\n")
+
+
+def _object_offsets(reader, data):
+    """返回按位置排序的 [(偏移量, 對象編號, 代數)]，文件結構不是單個交叉引用表時返回 None"""
+    if reader.xref_objStm or "/Prev" in reader.trailer or "/XRefStm" in reader.trailer:
+        return None
+    objects = []
+    for generation, entries in reader.xref.items():
+        free = reader.xref_free_entry.get(generation, {})
+        for num, offset in entries.items():
+            if free.get(num):
+                continue
+            header = b"%d %d obj" % (num, generation)
+            if data[offset:offset + len(header)] != header:
+                return None
+            objects.append((offset, num, generation))
+    objects.sort()
+    return objects
+
+
+def _find_startxref(data):
+    position = data.rfind(b"startxref")
+    if position < 0:
+        raise ValueError("找不到 startxref")
+    return int(data[position + 9:position + 40].split()[0])
+
+
+def optimize_pdf(path, options, jobs=1, cache=None, status_callback=None, cancel_event=None,
+                 trace=None):
+    """縮小並重新編碼PDF中的圖片，原地替換 path，返回前後大小的報告
+
+    未修改的對象按字節原樣複製，只有被替換的圖片對象重新寫出，最後重建交叉引用表。
+    只支持單個交叉引用表的文件（本程序各合併後端的輸出都是這種結構），其他文件保持不變。
+    """
+    from PyPDF2 import PdfReader
+    from pdf_stream import open_mapped_pdf
+
+    optimizer = _Optimizer(options, jobs, cache, status_callback, cancel_event, trace)
+    size_before = os.path.getsize(path)
+    temp_file = path + ".optimizing"
+    with open_mapped_pdf(path) as data:
+        if not isinstance(data, (bytes, mmap.mmap)):
+            # 不支持內存映射的文件退回到整個讀入
+            data = data.read()
+        reader = PdfReader(io.BytesIO(data) if isinstance(data, bytes) else data)
+        objects = _object_offsets(reader, data)
+        if objects is None:
+            notify("PDF 使用了增量更新、對象流或損壞的交叉引用表，跳過圖片優化",
+                   status_callback, logging.WARNING)
+            return None
+        xref_pos = _find_startxref(data[max(len(data) - 1024, 0):])
+
+        requests = []
+        found = _collect_pdf_images(reader, options.dpi)
+        for (num, generation), limit in found.items():
+            obj = reader.get_object(num)
+            request = _pdf_image_request(obj, limit)
+            if request is not None:
+                requests.append(((num, generation), request[0], request[1], limit, len(obj._data)))
+        check_cancelled(cancel_event)
+        results = optimizer.run(requests)
+        if not results:
+            return optimizer.report(path, size_before)
+
+        offsets = {}
+        try:
+            with open(temp_file, "wb") as out:
+                out.write(data[:objects[0][0]] if objects else b"")
+                bounds = [offset for offset, _, _ in objects[1:]] + [xref_pos]
+                for (offset, num, generation), end in zip(objects, bounds):
+                    offsets[num] = (out.tell(), generation)
+                    result = results.get((num, generation))
+                    if result is not None:
+                        _write_image_object(out, num, generation, reader.get_object(num), result)
+                        continue
+                    for start in range(offset, end, 1024 * 1024):
+                        out.write(data[start:min(start + 1024 * 1024, end)])
+                _write_xref(out, offsets, reader.trailer)
+        except BaseException:
+            remove_partial_output(temp_file)
+            raise
+    os.replace(temp_file, path)
+    return optimizer.report(path, size_before)
+
+
+def _write_xref(out, offsets, trailer):
+    size = max(int(trailer.get("/Size", 0)), max(offsets, default=0) + 1)
+    free = [num for num in range(1, size) if num not in offsets]
+    next_free = dict(zip([0] + free, free + [0]))
+
+    xref_pos = out.tell()
+    lines = [b"xref\n0 %d\n" % size]
+    for num in range(size):
+        if num in next_free:
+            lines.append(b"%010d 65535 f \n" % next_free[num])
+        else:
+            offset, generation = offsets[num]
+            lines.append(b"%010d %05d n \n" % (offset, generation))
+    out.write(b"".join(lines))
+
+    buf = io.BytesIO()
+    buf.write(b"trailer\n<< /Size %d" % size)
+    for key in ("/Root", "/Info", "/ID"):
+        if key in trailer:
+            buf.write(b" %s " % key.encode("ascii"))
+            trailer.raw_get(key).write_to_stream(buf, None)
+    buf.write(b" >>\nstartxref\n%d\n%%%%EOF\n" % xref_pos)
+    out.write(buf.getvalue())
+
+
+def _slide_size_inches(package):
+    from lxml import etree
+    from pptx_merge import NS_P
+
+    presentation = etree.fromstring(package.read(package.main_partname()))
+    size = presentation.find(f"{{{NS_P}}}sldSz")
+    if size is None:
+        # 默認的 4:3 幻燈片
+        return 10.0, 7.5
+    return int(size.get("cx")) / EMU_PER_INCH, int(size.get("cy")) / EMU_PER_INCH
+
+
+def optimize_pptx(path, options, jobs=1, cache=None, status_callback=None, cancel_event=None,
+                  trace=None):
+    """縮小並重新編碼演示文稿 media 目錄中的圖片，原地替換 path，返回前後大小的報告
+
+    轉換為 JPEG 的圖片改用 .jpeg 擴展名，並同步更新引用它的關係和內容類型。
+    """
+    from lxml import etree
+    from pptx_merge import _ZipPackage, NS_CONTENT_TYPES, NS_PKG_RELS
+
+    optimizer = _Optimizer(options, jobs, cache, status_callback, cancel_event, trace)
+    size_before = os.path.getsize(path)
+    temp_file = path + ".optimizing"
+    package = _ZipPackage(path)
+    try:
+        width, height = _slide_size_inches(package)
+        limit = _pixel_limit(width, height, options.dpi)
+        requests = []
+        for info in package.zip.infolist():
+            partname = "/" + info.filename
+            if not partname.startswith("/ppt/media/"):
+                continue
+            if package.content_type(partname) not in ("image/png", "image/jpeg"):
+                continue
+            requests.append((partname, "file", package.zip.read(info), limit, info.file_size))
+        check_cancelled(cancel_event)
+        results = optimizer.run(requests)
+        if not results:
+            return optimizer.report(path, size_before)
+
+        # 轉換為 JPEG 的 PNG 圖片需要改名
+        renamed = {}
+        for partname, result in list(results.items()):
+            if result["format"] == "jpeg" and not partname.lower().endswith((".jpg", ".jpeg")):
+                new_name = posixpath.splitext(partname)[0] + ".jpeg"
+                if not package.has_part(new_name):
+                    renamed[partname] = new_name
+                else:
+                    del results[partname]
+
+        try:
+            with zipfile.ZipFile(temp_file, "w", zipfile.ZIP_DEFLATED) as out:
+                for info in package.zip.infolist():
+                    check_cancelled(cancel_event)
+                    name = info.filename
+                    partname = "/" + name
+                    if partname in results:
+                        # 圖片已經壓縮過，不再用 deflate 壓縮
+                        out.writestr(
+                            renamed.get(partname, partname).lstrip("/"), results[partname]["data"],
+                            zipfile.ZIP_STORED,
+                        )
+                        continue
+                    blob = package.zip.read(info)
+                    if renamed and name == "[Content_Types].xml":
+                        blob = _rename_content_types(blob, renamed, NS_CONTENT_TYPES)
+                    elif renamed and name.endswith(".rels"):
+                        blob = _rename_rel_targets(blob, name, renamed, NS_PKG_RELS)
+                    out.writestr(info, blob)
+        except BaseException:
+            remove_partial_output(temp_file)
+            raise
+    finally:
+        package.close()
+    os.replace(temp_file, path)
+    return optimizer.report(path, size_before)
+
+
+def _rename_content_types(blob, renamed, namespace):
+    from lxml import etree
+
+    root = etree.fromstring(blob)
+    extensions = {node.get("Extension").lower() for node in root if node.get("Extension")}
+    lowered = {old.lower(): new for old, new in renamed.items()}
+    for node in root:
+        partname = node.get("PartName")
+        if partname and partname.lower() in lowered:
+            node.set("PartName", lowered[partname.lower()])
+            node.set("ContentType", "image/jpeg")
+    if "jpeg" not in extensions:
+        default = etree.Element(f"{{{namespace}}}Default")
+        default.set("Extension", "jpeg")
+        default.set("ContentType", "image/jpeg")
+        root.insert(0, default)
+    return etree.tostring(root, xml_declaration=True, encoding="UTF-8", standalone=True)
+
+
+def _rename_rel_targets(blob, rels_name, renamed, namespace):
+    from lxml import etree
+    from pptx_merge import _resolve_target
+
+    # _rels/xxx.rels 描述的是上一級目錄中的 xxx 部件
+    directory = posixpath.dirname(posixpath.dirname("/" + rels_name))
+    source = posixpath.join(directory, posixpath.basename(rels_name)[:-len(".rels")])
+    root = etree.fromstring(blob)
+    changed = False
+    for node in root:
+        if node.get("TargetMode") == "External":
+            continue
+        target = node.get("Target")
+        new_name = renamed.get(_resolve_target(source, target))
+        if new_name is not None:
+            node.set("Target", posixpath.join(posixpath.dirname(target), posixpath.basename(new_name)))
+            changed = True
+    if not changed:
+        return blob
+    return etree.tostring(root, xml_declaration=True, encoding="UTF-8", standalone=True)
+
+
+def optimize_output(format_name, path, options, jobs=1, cache=None, status_callback=None,
+                    cancel_event=None, trace=None):
+    """對合併輸出執行圖片優化；未安裝 Pillow 時提示並跳過，返回報告或 None"""
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        notify("圖片優化需要 Pillow（pip install Pillow），已跳過", status_callback, logging.WARNING)
+        return None
+    optimize = optimize_pdf if format_name == "pdf" else optimize_pptx
+    if trace is not None:
+        with trace.span("optimize"):
+            return optimize(path, options, jobs, cache, status_callback, cancel_event, trace)
+    return optimize(path, options, jobs, cache, status_callback, cancel_event, trace)
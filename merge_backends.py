@@ -0,0 +1,496 @@
+import os
+import sys
+import glob
+import shutil
+import logging
+import tempfile
+import threading
+
+from merge_utils import (
+    notify, apply_range_specs, check_cancelled, ensure_parent_dir, split_input_spec, select_pages,
+    is_remote_path,
+)
+
+FORMAT_LABELS = {"ppt": "PPT", "pdf": "PDF"}
+# docs 文件夾中各格式的輸入文件
+INPUT_PATTERNS = {"ppt": "*.ppt*", "pdf": "*.pdf"}
+# 輸入在網絡驅動器上時，逐個文件同步讀取的後端被讀取延遲拖慢的倍數
+# （每次打開文件增加 20 ms 延遲時，流式寫入器比流水線慢約 4 倍）
+REMOTE_SLOWDOWN = 4.0
+
+
+class MergeBackend:
+    """合併後端的基類
+
+    format 為輸出格式，extensions 為能讀取的輸入文件擴展名，capabilities 為支持的功能：
+      ranges    支持 "file.pdf:1-5" 形式的頁碼範圍
+      cache     使用 MergeCache 跳過未變化的文件
+      parallel  jobs 大於 1 時在多個進程中處理
+      streaming 邊處理邊寫出，內存佔用與輸入大小無關
+      outlines  保留PDF書籤
+      pipeline  讀取、解析和寫出重疊進行，可按 merge_pipeline.PipelineConfig 配置預讀深度和內存預算
+      compact   把小對象打包進壓縮的對象流並寫出交叉引用流，可按 compress_level 配置壓縮級別
+      resume    按 merge_checkpoint.MergeCheckpoint 寫檢查點，中途退出後從檢查點繼續
+    throughput 為單個進程的預計吞吐量（MB/s），來自 benchmark.py 在合成語料上的測量，
+    只用於比較不同後端的快慢。輸入在網絡驅動器上時，不能把讀取與處理重疊的後端按
+    REMOTE_SLOWDOWN 折算。single_instance 為 True 的後端不能在多個進程中同時合併（如分片輸出）。
+    """
+
+    name = None
+    format = None
+    label = None
+    extensions = ()
+    capabilities = frozenset()
+    throughput = 1.0
+    install_hint = None
+    single_instance = False
+
+    def probe(self):
+        """檢查運行環境，不可用時拋出 ImportError 或 OSError 說明原因"""
+
+    def expected_throughput(self, jobs=1, file_count=1, remote=False):
+        workers = max(min(jobs, file_count), 1) if "parallel" in self.capabilities else 1
+        throughput = self.throughput * workers
+        if remote and workers == 1 and "pipeline" not in self.capabilities:
+            throughput /= REMOTE_SLOWDOWN
+        return throughput
+
+    def accepts(self, path):
+        return os.path.splitext(split_input_spec(path)[0])[1].lower() in self.extensions
+
+    def merge(self, files, output_file, status_callback=None, jobs=1, cache=None,
+              cancel_event=None, trace=None):
+        """按給定順序合併文件，返回是否成功"""
+        raise NotImplementedError
+
+
+class PdfStreamBackend(MergeBackend):
+    name = "pdf-stream"
+    format = "pdf"
+    label = "流式PDF寫入器"
+    extensions = (".pdf",)
+    capabilities = frozenset({"ranges", "streaming", "compact", "resume"})
+    throughput = 30.0
+    install_hint = "pip install PyPDF2"
+
+    def probe(self):
+        import PyPDF2.generic  # noqa: F401
+
+    def merge(self, files, output_file, status_callback=None, jobs=1, cache=None,
+              cancel_event=None, trace=None, compress_level=None, checkpoint=None):
+        from pdf_stream import stream_merge_pdfs
+        return stream_merge_pdfs(
+            files, output_file, status_callback, cancel_event, trace, compress_level, checkpoint
+        )
+
+
+class PdfParallelBackend(PdfStreamBackend):
+    name = "pdf-parallel"
+    label = "並行PDF片段拼接"
+    capabilities = frozenset({"ranges", "streaming", "parallel", "cache", "compact", "resume"})
+    # 單進程時比直接流式寫入多一次片段拼接
+    throughput = 24.0
+
+    def merge(self, files, output_file, status_callback=None, jobs=1, cache=None,
+              cancel_event=None, trace=None, compress_level=None, checkpoint=None):
+        from pdf_stream import parallel_merge_pdfs
+        return parallel_merge_pdfs(
+            files, output_file, jobs, status_callback, cache, cancel_event, trace, compress_level,
+            checkpoint
+        )
+
+
+class PdfPipelineBackend(PdfStreamBackend):
+    name = "pdf-pipeline"
+    label = "流水線PDF合併"
+    capabilities = frozenset({"ranges", "streaming", "pipeline", "compact", "resume"})
+    # 本地磁盤上預讀的數據已在系統緩存中，多出的線程交接略慢於直接流式寫入
+    throughput = 28.0
+
+    def merge(self, files, output_file, status_callback=None, jobs=1, cache=None,
+              cancel_event=None, trace=None, pipeline=None, compress_level=None, checkpoint=None):
+        from pdf_stream import pipelined_merge_pdfs
+        return pipelined_merge_pdfs(
+            files, output_file, status_callback, cancel_event, trace, pipeline, compress_level,
+            checkpoint
+        )
+
+
+class PyPdf2MergerBackend(MergeBackend):
+    name = "pypdf2"
+    format = "pdf"
+    label = "PyPDF2 PdfMerger"
+    extensions = (".pdf",)
+    capabilities = frozenset({"ranges", "outlines"})
+    throughput = 21.0
+    install_hint = "pip install PyPDF2"
+
+    def probe(self):
+        import PyPDF2  # noqa: F401
+
+    def merge(self, files, output_file, status_callback=None, jobs=1, cache=None,
+              cancel_event=None, trace=None):
+        from PyPDF2 import PdfMerger, PdfReader
+        from merge_trace import MergeTrace
+        from pdf_stream import open_mapped_pdf
+
+        trace = trace if trace is not None else MergeTrace()
+        # PdfMerger 在寫出之前保留全部輸入，只適合需要保留書籤的場合
+        merger = PdfMerger()
+        try:
+            for pdf_file in files:
+                check_cancelled(cancel_event)
+                notify(f"正在處理: {pdf_file}", status_callback)
+                path, ranges = split_input_spec(pdf_file)
+                with trace.span("file", file=pdf_file), trace.span("open", file=pdf_file):
+                    try:
+                        pages = None
+                        if ranges is not None:
+                            with open_mapped_pdf(path) as stream:
+                                pages = select_pages(ranges, len(PdfReader(stream).pages))
+                        merger.append(path, pages=pages)
+                        trace.count("input_bytes", os.path.getsize(path))
+                    except Exception as e:
+                        trace.count("files_failed")
+                        notify(f"處理文件 {pdf_file} 時出錯: {e}", status_callback, logging.ERROR)
+
+            trace.count("pages", len(merger.pages))
+            with trace.span("write"):
+                merger.write(output_file)
+        finally:
+            merger.close()
+        trace.count("output_bytes", os.path.getsize(output_file))
+        return True
+
+
+class PptxXmlBackend(MergeBackend):
+    name = "pptx-xml"
+    format = "ppt"
+    label = "PPTX XML合併"
+    extensions = (".pptx",)
+    capabilities = frozenset({"ranges", "parallel", "cache"})
+    throughput = 10.0
+    install_hint = "pip install lxml"
+
+    def probe(self):
+        import pptx_merge  # noqa: F401
+
+    def merge(self, files, output_file, status_callback=None, jobs=1, cache=None,
+              cancel_event=None, trace=None):
+        from pptx_merge import xml_merge_pptx
+        return xml_merge_pptx(
+            files, output_file, status_callback, jobs=jobs, cache=cache,
+            cancel_event=cancel_event, trace=trace
+        )
+
+
+class PowerPointBackend(MergeBackend):
+    name = "powerpoint-com"
+    format = "ppt"
+    label = "PowerPoint (COM)"
+    # 只有 PowerPoint 本身能讀取舊的二進制 .ppt 格式
+    extensions = (".ppt", ".pptx", ".pptm", ".pps", ".ppsx", ".pot", ".potx")
+    capabilities = frozenset({"ranges"})
+    # 啟動和驅動 PowerPoint 的開銷遠大於直接複製部件
+    throughput = 2.0
+    install_hint = "需要 Windows、Microsoft PowerPoint 和 pip install pywin32"
+    # 所有進程共用同一個 PowerPoint 實例
+    single_instance = True
+
+    def probe(self):
+        if sys.platform != "win32":
+            raise OSError("PowerPoint COM 只能在 Windows 上使用")
+        import win32com.client  # noqa: F401
+        import winreg
+        # 只檢查 PowerPoint 是否已註冊，不在探測時啟動它
+        winreg.CloseKey(winreg.OpenKey(winreg.HKEY_CLASSES_ROOT, "PowerPoint.Application"))
+
+    def merge(self, files, output_file, status_callback=None, jobs=1, cache=None,
+              cancel_event=None, trace=None):
+        from ppt_com import get_com_backend
+        # COM 對象屬於調用線程，每個線程使用各自的 PowerPoint 連接
+        return get_com_backend().merge(files, output_file, status_callback, cancel_event, trace)
+
+
+_registry = []
+_probed = None
+_probe_lock = threading.Lock()
+
+
+def register_backend(backend):
+    """註冊一個合併後端，已探測過的結果會在下次使用時重新探測"""
+    global _probed
+    with _probe_lock:
+        _registry.append(backend)
+        _probed = None
+    return backend
+
+
+for _backend_class in (PdfStreamBackend, PdfPipelineBackend, PdfParallelBackend, PyPdf2MergerBackend,
+                       PptxXmlBackend, PowerPointBackend):
+    register_backend(_backend_class())
+
+
+def probe_backends(refresh=False):
+    """探測各後端是否可用，返回 [(後端, 不可用的原因或 None)]
+
+    結果在進程內緩存，只在第一次調用（或 refresh 為 True）時真正導入各個庫。
+    """
+    global _probed
+    with _probe_lock:
+        if _probed is None or refresh:
+            results = []
+            for backend in _registry:
+                try:
+                    backend.probe()
+                    results.append((backend, None))
+                except (ImportError, OSError) as e:
+                    results.append((backend, str(e) or type(e).__name__))
+            _probed = results
+        return list(_probed)
+
+
+def available_backends(format_name=None):
+    return [
+        backend for backend, reason in probe_backends()
+        if reason is None and (format_name is None or backend.format == format_name)
+    ]
+
+
+def get_backend(name, format_name=None):
+    """按名稱返回一個可用的後端，不可用或（傳入 format_name 時）不能生成該格式時拋出 LookupError"""
+    for backend, reason in probe_backends():
+        if backend.name == name:
+            if reason is not None:
+                raise LookupError(f"合併後端 {name} 不可用: {reason}")
+            if format_name is not None and backend.format != format_name:
+                raise LookupError(
+                    f"合併後端 {name} 只能生成 {FORMAT_LABELS[backend.format]} 文件，"
+                    f"不能用於 {FORMAT_LABELS[format_name]} 合併"
+                )
+            return backend
+    raise LookupError(f"未知的合併後端: {name}")
+
+
+def select_backend(format_name, files=(), require=(), jobs=1):
+    """在可用的後端中選出滿足要求且預計最快的一個，沒有可用後端時返回 None
+
+    沒有後端能同時滿足全部要求時，優先保證能讀取全部輸入文件，其次滿足盡量多的 require 中的功能。
+    輸入位於網絡驅動器上時，優先選擇能提前讀取後面文件的後端。
+    """
+    candidates = available_backends(format_name)
+    readable = [b for b in candidates if all(b.accepts(path) for path in files)]
+    # 在能讀取全部輸入的後端中取滿足要求最多的
+    require = set(require)
+    best = max((len(require & b.capabilities) for b in readable), default=0)
+    capable = [b for b in readable if len(require & b.capabilities) == best]
+    pool = capable or candidates
+    if not pool:
+        return None
+    remote = bool(files) and is_remote_path(split_input_spec(files[0])[0])
+    return max(pool, key=lambda b: b.expected_throughput(jobs, len(files), remote))
+
+
+def discover_inputs(format_name, docs_dir="docs", ranges=None, trace=None, mixed=False,
+                    order="name"):
+    """按指定順序列出 docs 文件夾中的輸入文件，並為指定了範圍的文件附加範圍
+
+    order 為 docs_index.ORDERS 中的排序方式，默認按文件名；
+    mixed 為 True 時PDF合併同時包括演示文稿，兩類文件統一排序。
+    """
+    from docs_index import order_inputs
+
+    formats = ["pdf", "ppt"] if mixed and format_name == "pdf" else [format_name]
+
+    def find():
+        files = []
+        for name in formats:
+            files.extend(glob.glob(os.path.join(docs_dir, INPUT_PATTERNS[name])))
+        return order_inputs(files, order, docs_dir)
+
+    if trace is not None:
+        with trace.span("discover"):
+            files = find()
+    else:
+        files = find()
+    return apply_range_specs(files, ranges)
+
+
+def run_merge(format_name, files, output_file, status_callback=None, jobs=1, cache=None,
+              cancel_event=None, trace=None, streaming=False, keep_outlines=False, backend=None,
+              pipeline=None, optimize=None, linearize=False, compress_level=None, isolation=None,
+              checkpoint=None):
+    """GUI、命令行、批量模式和HTTP服務共用的合併流程，返回是否成功
+
+    根據輸入文件和選項選出最快的可用後端（也可以用 backend 指定名稱）；
+    streaming 和 keep_outlines 分別要求流式寫出和保留書籤，cache 只在後端支持時使用。
+    pipeline 為 merge_pipeline.PipelineConfig，傳入時要求使用流水線後端；
+    不傳入時流水線後端（如被自動選中）使用默認配置。
+    optimize 為 image_optimize.ImageOptions，傳入時合併後縮小並重新編碼輸出中的圖片，
+    重新編碼的結果按圖片哈希保存在 cache 中。
+    linearize 為 True 時最後把PDF輸出重寫為線性化（快速網頁查看）格式。
+    compress_level（0-9）傳入時要求緊湊輸出：小對象打包進壓縮的對象流，寫出交叉引用流。
+    PDF 合併的輸入中可以混有演示文稿，先用 LibreOffice 並行轉換為PDF（結果按內容哈希保存在 cache 中），
+    再按原順序與其他PDF一起合併。
+    isolation 為 merge_isolation.IsolationConfig，傳入時先在獨立進程中逐個檢查輸入（有時間和內存上限），
+    出錯、超時或超出內存的文件被移到隔離目錄，不參與合併，最後輸出檢查摘要。
+    checkpoint 為 merge_checkpoint.CheckpointConfig，傳入時要求支持恢復的後端：合併期間按間隔在輸出旁邊
+    寫檢查點，進程崩潰或被終止後用同樣的輸入和選項再次運行時從最後一個檢查點繼續，
+    最終輸出與一次完成的合併逐字節相同；合併成功或取消後檢查點被刪除。
+    """
+    label = FORMAT_LABELS[format_name]
+    if not files:
+        notify(f"docs 文件夾中沒有找到 {label} 文件", status_callback, logging.WARNING)
+        return False
+
+    isolation_report = None
+    if isolation is not None:
+        from merge_isolation import isolate_inputs
+        files, isolation_report = isolate_inputs(
+            format_name, files, isolation, jobs, cache, status_callback, cancel_event, trace
+        )
+        if not files:
+            if cache is not None:
+                cache.save()
+            _report_isolation(isolation_report, trace, status_callback)
+            notify("沒有可以合併的文件", status_callback, logging.WARNING)
+            return False
+
+    # 檢查點按轉換前的輸入計算指紋，轉換結果所在的臨時目錄每次運行都不同
+    source_files = list(files)
+    converted_dir = None
+    if format_name == "pdf":
+        from pptx_convert import is_convertible
+        if any(is_convertible(spec) for spec in files):
+            files, converted_dir = _convert_presentations(
+                files, output_file, jobs, cache, status_callback, cancel_event, trace
+            )
+            if not files:
+                notify("沒有可以合併的文件", status_callback, logging.WARNING)
+                return False
+
+    require = set()
+    if streaming:
+        require.add("streaming")
+    if keep_outlines:
+        require.add("outlines")
+    if pipeline is not None:
+        require.add("pipeline")
+    if compress_level is not None:
+        require.add("compact")
+    if checkpoint is not None:
+        require.add("resume")
+    if cache is not None:
+        require.add("cache")
+    if any(split_input_spec(path)[1] is not None for path in files):
+        require.add("ranges")
+
+    if backend is not None:
+        selected = get_backend(backend, format_name)
+    else:
+        selected = select_backend(format_name, files, require, jobs)
+    if selected is None:
+        if converted_dir is not None:
+            shutil.rmtree(converted_dir, ignore_errors=True)
+        notify(f"沒有可用的 {label} 合併後端", status_callback, logging.ERROR)
+        for candidate, reason in probe_backends():
+            if candidate.format == format_name:
+                notify(f"{candidate.label}: {reason}（{candidate.install_hint}）", status_callback)
+        return False
+
+    # 緩存只是加速手段，後端不支持時直接不用，不需要提示
+    missing = require - selected.capabilities - {"cache"}
+    if missing:
+        notify(f"{selected.label} 不支持: {', '.join(sorted(missing))}，將忽略這些選項",
+               status_callback, logging.WARNING)
+    notify(f"使用合併後端: {selected.label}", status_callback)
+    ensure_parent_dir(output_file)
+
+    use_cache = cache if "cache" in selected.capabilities else None
+    options = {}
+    if "pipeline" in selected.capabilities:
+        options["pipeline"] = pipeline
+    if "compact" in selected.capabilities:
+        options["compress_level"] = compress_level
+    if "resume" in selected.capabilities and checkpoint is not None:
+        from merge_checkpoint import MergeCheckpoint
+        variant = (format_name, selected.name, options.get("compress_level"), len(files))
+        options["checkpoint"] = MergeCheckpoint(output_file, source_files, checkpoint, variant)
+    if linearize and compress_level is not None:
+        notify("線性化的輸出使用傳統交叉引用表，不保留對象流", status_callback, logging.WARNING)
+    # 圖片優化、演示文稿轉換和隔離檢查的結果與後端無關，總是可以使用緩存
+    independent = optimize is not None or converted_dir is not None or isolation is not None
+    save_cache = cache if independent else use_cache
+    try:
+        success = selected.merge(
+            files, output_file, status_callback, jobs=jobs, cache=use_cache,
+            cancel_event=cancel_event, trace=trace, **options
+        )
+        if success and optimize is not None:
+            from image_optimize import optimize_output
+            optimize_output(
+                format_name, output_file, optimize, jobs, cache, status_callback, cancel_event, trace
+            )
+        if success and linearize:
+            from pdf_linearize import linearize_output
+            linearize_output(format_name, output_file, status_callback, cancel_event, trace)
+    finally:
+        # 先刪除轉換結果，保存緩存時不再記錄這些臨時文件的哈希
+        if converted_dir is not None:
+            shutil.rmtree(converted_dir, ignore_errors=True)
+        # 取消或出錯時已處理完的文件也保留在緩存中，下次可以直接使用
+        if save_cache is not None:
+            save_cache.save()
+    if save_cache is not None:
+        notify(save_cache.summary(), status_callback)
+    if isolation_report is not None:
+        _report_isolation(isolation_report, trace, status_callback)
+    if success:
+        notify(f"已成功合併所有 {label} 文件到: {output_file}", status_callback)
+    return success
+
+
+def _convert_presentations(files, output_file, jobs, cache, status_callback, cancel_event, trace):
+    """把輸入中的演示文稿轉換為PDF，返回 (PDF輸入列表, 轉換結果所在的臨時目錄)"""
+    from pptx_convert import convert_mixed_inputs
+
+    ensure_parent_dir(output_file)
+    converted_dir = tempfile.mkdtemp(
+        prefix="converted_", dir=os.path.dirname(os.path.abspath(output_file))
+    )
+    try:
+        files = convert_mixed_inputs(
+            files, converted_dir, jobs, cache, status_callback, cancel_event, trace
+        )
+    except BaseException:
+        shutil.rmtree(converted_dir, ignore_errors=True)
+        if cache is not None:
+            cache.save()
+        raise
+    if not files:
+        shutil.rmtree(converted_dir, ignore_errors=True)
+        return files, None
+    return files, converted_dir
+
+
+def _report_isolation(report, trace, status_callback):
+    """輸出隔離檢查的摘要，合併時仍然出錯的文件數一併列出"""
+    lines = report.summary_lines()
+    failed = trace.counters.get("files_failed", 0) if trace is not None else 0
+    if failed:
+        lines.append(f"合併時另有 {failed} 個文件出錯，已跳過")
+    for line in lines:
+        notify(line, status_callback)
+
+
+def describe_backends():
+    """返回各後端的可用狀態，供 --list-backends 顯示"""
+    lines = []
+    for backend, reason in probe_backends():
+        status = "可用" if reason is None else f"不可用（{reason}）"
+        capabilities = ", ".join(sorted(backend.capabilities)) or "-"
+        lines.append(
+            f"{backend.name:<16}{backend.format:<5}{backend.throughput:>6.1f} MB/s  "
+            f"[{capabilities}]  {status}"
+        )
+    return lines
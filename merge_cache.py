@@ -0,0 +1,164 @@
+import os
+import json
+import time
+import pickle
+import shutil
+import hashlib
+import logging
+import tempfile
+
+logger = logging.getLogger('格式選擇器')
+
+# 中間結果的格式變化時遞增，舊條目會自然失效並被淘汰
+CACHE_VERSION = 3
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+
+def _atomic_write(path, data, sync=False):
+    """寫入臨時文件後替換目標文件；sync 為 True 時替換前先把內容刷到磁盤"""
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(data)
+            if sync:
+                fh.flush()
+                os.fsync(fh.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class MergeCache:
+    """以輸入文件內容哈希為鍵的磁盤緩存
+
+    保存每個輸入文件預處理後的中間結果（PDF 片段、PPTX 幻燈片快照），
+    重新合併時只需處理發生變化的文件。文件哈希按路徑、大小和修改時間
+    記錄，未變化的文件不會被重新讀取；總大小超過上限時按最近最少使用淘汰。
+    """
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.objects_dir = os.path.join(cache_dir, "objects")
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self._index = self._load_index()
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as fh:
+                index = json.load(fh)
+            if index.get("version") == CACHE_VERSION:
+                return index
+        except (OSError, ValueError):
+            pass
+        return {"version": CACHE_VERSION, "files": {}, "entries": {}}
+
+    def file_hash(self, path):
+        """返回文件內容的 SHA-256，大小和修改時間未變時直接使用記錄的值"""
+        abs_path = os.path.abspath(path)
+        stat = os.stat(abs_path)
+        record = self._index["files"].get(abs_path)
+        if record and record["size"] == stat.st_size and record["mtime_ns"] == stat.st_mtime_ns:
+            return record["sha256"]
+
+        digest = hashlib.sha256()
+        with open(abs_path, "rb") as fh:
+            for chunk in iter(lambda: fh.read(1024 * 1024), b""):
+                digest.update(chunk)
+        sha256 = digest.hexdigest()
+        self._index["files"][abs_path] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": sha256,
+        }
+        return sha256
+
+    def key(self, kind, path, variant=None):
+        """返回某類中間結果的緩存鍵；variant 區分同一文件的不同處理方式（如頁碼範圍）"""
+        key = f"{kind}-v{CACHE_VERSION}-{self.file_hash(path)}"
+        return f"{key}-{variant}" if variant else key
+
+    def _value_path(self, key):
+        return os.path.join(self.objects_dir, key + ".pkl")
+
+    def attachment_path(self, key):
+        """條目附帶的數據文件路徑（如PDF片段）"""
+        return os.path.join(self.objects_dir, key + ".bin")
+
+    def get(self, key):
+        """讀取緩存的中間結果，不存在時返回 None"""
+        entry = self._index["entries"].get(key)
+        value_path = self._value_path(key)
+        if entry is None or not os.path.exists(value_path):
+            self.misses += 1
+            return None
+        try:
+            with open(value_path, "rb") as fh:
+                value = pickle.load(fh)
+        except Exception as e:
+            logger.warning(f"緩存條目 {key} 已損壞，將重新生成: {e}")
+            self._remove(key)
+            self.misses += 1
+            return None
+        entry["last_used"] = time.time()
+        self.hits += 1
+        return value
+
+    def put(self, key, value, attachment=None):
+        """寫入中間結果；attachment 為需要一併移入緩存的數據文件"""
+        size = 0
+        if attachment is not None:
+            target = self.attachment_path(key)
+            try:
+                os.replace(attachment, target)
+            except OSError:
+                # 跨磁盤時無法直接重命名
+                shutil.move(attachment, target)
+            size += os.path.getsize(target)
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        _atomic_write(self._value_path(key), data)
+        size += len(data)
+        self._index["entries"][key] = {"size": size, "last_used": time.time()}
+
+    def _remove(self, key):
+        self._index["entries"].pop(key, None)
+        for path in (self._value_path(key), self.attachment_path(key)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    @property
+    def total_bytes(self):
+        return sum(entry["size"] for entry in self._index["entries"].values())
+
+    def _evict(self):
+        total = self.total_bytes
+        if total <= self.max_bytes:
+            return
+        entries = sorted(self._index["entries"].items(), key=lambda item: item[1]["last_used"])
+        for key, entry in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(key)
+            total -= entry["size"]
+            self.evictions += 1
+
+    def save(self):
+        """淘汰超出上限的條目並寫回索引"""
+        self._evict()
+        files = self._index["files"]
+        for path in [path for path in files if not os.path.exists(path)]:
+            del files[path]
+        _atomic_write(self.index_path, json.dumps(self._index, ensure_ascii=False).encode("utf-8"))
+
+    def summary(self):
+        return (
+            f"緩存命中 {self.hits}, 未命中 {self.misses}, 淘汰 {self.evictions}, "
+            f"緩存大小 {self.total_bytes / (1024 * 1024):.1f} MB"
+        )
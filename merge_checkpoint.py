@@ -0,0 +1,146 @@
+import os
+import time
+import pickle
+import hashlib
+import logging
+from datetime import datetime
+
+from merge_utils import notify, split_input_spec
+
+# 檢查點的格式變化時遞增，舊的檢查點不再用於恢復
+CHECKPOINT_VERSION = 1
+# 恢復前核對輸出文件中檢查點位置之前這麼多字節的哈希，確認輸出仍是寫下檢查點時的文件
+TAIL_BYTES = 64 * 1024
+
+
+class CheckpointConfig:
+    """長時間合併的檢查點設置
+
+    every_files    每處理這麼多個輸入寫一次檢查點
+    every_seconds  距上次檢查點超過這麼多秒時，處理完當前輸入後寫一次檢查點
+
+    兩項中先滿足的一項觸發；寫檢查點時先把輸出刷到磁盤，再原子地替換檢查點文件。
+    """
+
+    def __init__(self, every_files=50, every_seconds=60.0):
+        if every_files < 1:
+            raise ValueError("檢查點間隔的文件數至少為 1")
+        if every_seconds <= 0:
+            raise ValueError("檢查點間隔的時間必須大於 0")
+        self.every_files = every_files
+        self.every_seconds = every_seconds
+
+    def __repr__(self):
+        return f"CheckpointConfig(every_files={self.every_files}, every_seconds={self.every_seconds})"
+
+
+def checkpoint_path(output_file):
+    """輸出文件對應的檢查點文件名，如 output.pdf.checkpoint"""
+    return output_file + ".checkpoint"
+
+
+def _input_fingerprint(files, variant):
+    """輸入列表、各輸入的大小和修改時間以及影響輸出的選項的指紋"""
+    digest = hashlib.sha256()
+    digest.update(repr(variant).encode("utf-8"))
+    for spec in files:
+        try:
+            stat = os.stat(split_input_spec(spec)[0])
+            size, mtime = stat.st_size, stat.st_mtime_ns
+        except OSError:
+            size = mtime = -1
+        digest.update(f"\0{spec}\0{size}\0{mtime}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _tail_digest(path, pos):
+    """輸出文件中 pos 之前最後 TAIL_BYTES 字節的哈希，文件比 pos 短時拋出 ValueError"""
+    with open(path, "rb") as fh:
+        fh.seek(0, os.SEEK_END)
+        if fh.tell() < pos:
+            raise ValueError("輸出文件比檢查點記錄的短")
+        start = max(pos - TAIL_BYTES, 0)
+        fh.seek(start)
+        return hashlib.sha256(fh.read(pos - start)).hexdigest()
+
+
+class MergeCheckpoint:
+    """一次合併的檢查點：記錄已處理的輸入數和寫入器狀態，保存在輸出文件旁邊
+
+    輸入列表、各輸入的大小和修改時間以及 variant（格式、後端、壓縮級別等影響輸出的選項）
+    組成指紋，指紋不同的檢查點不會被用於恢復。檢查點只記錄已經刷到磁盤的輸出位置，
+    恢復時輸出文件截斷到該位置後繼續寫出，之後的內容與一次完成的合併逐字節相同。
+    """
+
+    def __init__(self, output_file, files, config, variant=()):
+        self.output_file = output_file
+        self.path = checkpoint_path(output_file)
+        self.config = config
+        self.fingerprint = _input_fingerprint(files, variant)
+        self.saved = 0
+        self._last_processed = 0
+        self._last_time = time.monotonic()
+
+    def load(self, status_callback=None):
+        """返回 (已處理的輸入數, 寫入器狀態, 附加信息)，沒有可以使用的檢查點時返回 None"""
+        try:
+            with open(self.path, "rb") as fh:
+                data = pickle.load(fh)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            notify(f"檢查點文件已損壞，將從頭開始合併: {e}", status_callback, logging.WARNING)
+            return None
+
+        if not isinstance(data, dict) or data.get("version") != CHECKPOINT_VERSION:
+            reason = "檢查點格式不兼容"
+        elif data.get("fingerprint") != self.fingerprint:
+            reason = "輸入文件或合併選項已變化"
+        else:
+            try:
+                if _tail_digest(self.output_file, data["state"]["_pos"]) != data["tail"]:
+                    reason = "輸出文件已被修改"
+                else:
+                    reason = None
+            except (OSError, ValueError):
+                reason = "輸出文件不存在或不完整"
+        if reason is not None:
+            notify(f"{reason}，不使用檢查點 {self.path}，將從頭開始合併", status_callback, logging.WARNING)
+            return None
+
+        self._last_processed = data["processed"]
+        self._last_time = time.monotonic()
+        return data["processed"], data["state"], data.get("extra", {})
+
+    def due(self, processed):
+        """處理完 processed 個輸入後是否應該寫檢查點"""
+        return (
+            processed - self._last_processed >= self.config.every_files
+            or time.monotonic() - self._last_time >= self.config.every_seconds
+        )
+
+    def save(self, processed, state, extra=None):
+        """原子地寫出檢查點；state 為已刷到磁盤的寫入器狀態"""
+        from merge_cache import _atomic_write
+
+        data = {
+            "version": CHECKPOINT_VERSION,
+            "fingerprint": self.fingerprint,
+            "processed": processed,
+            "state": state,
+            "tail": _tail_digest(self.output_file, state["_pos"]),
+            "extra": extra or {},
+            "saved_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        _atomic_write(self.path, pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL), sync=True)
+        self.saved += 1
+        self._last_processed = processed
+        self._last_time = time.monotonic()
+
+    def discard(self):
+        """合併完成或取消後刪除檢查點文件"""
+        try:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+        except OSError as e:
+            notify(f"無法刪除檢查點文件 {self.path}: {e}", level=logging.WARNING)
@@ -1,7 +1,6 @@
 import os
-import glob
 import argparse
-from datetime import datetime
+import logging
 import shutil
 import sys
 import io
@@ -10,322 +9,275 @@ import io
 sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
 
-def merge_ppt_files():
-    # 創建時間戳作為文件名
-    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-    output_filename = f"output/{timestamp}.pptx"
-    
-    # 確保 output 文件夾存在
-    if not os.path.exists("output"):
-        os.makedirs("output")
-    
-    try:
-        # 嘗試使用高級方法（需要 Windows 和 PowerPoint）
-        import win32com.client
-        
-        # 獲取 docs 文件夾中的所有 PPT 文件
-        ppt_files = glob.glob("docs/*.ppt*")
-        
-        if not ppt_files:
-            print("docs 文件夾中沒有找到 PPT 文件")
-            return
-        
-        # 啟動 PowerPoint 應用程序
-        ppt_app = win32com.client.Dispatch("PowerPoint.Application")
-        
-        # 使用第一個文件作為基礎，而不是創建新的空演示文稿
-        print(f"正在使用第一個文件作為基礎: {ppt_files[0]}")
-        base_path = os.path.abspath(ppt_files[0])
-        merged_presentation = ppt_app.Presentations.Open(base_path)
-        
-        # 遍歷剩餘的 PPT 文件並合併
-        for ppt_file in ppt_files[1:]:
-            print(f"正在處理: {ppt_file}")
-            try:
-                # 打開當前 PPT 文件
-                abs_path = os.path.abspath(ppt_file)
-                current_presentation = ppt_app.Presentations.Open(abs_path)
-                
-                # 獲取幻燈片數量
-                slide_count = current_presentation.Slides.Count
-                
-                # 複製所有幻燈片到合併的演示文稿
-                for i in range(1, slide_count + 1):
-                    current_presentation.Slides(i).Copy()
-                    merged_presentation.Slides.Paste()
-                
-                # 關閉當前演示文稿而不保存
-                current_presentation.Close()
-            except Exception as e:
-                print(f"處理文件 {ppt_file} 時出錯: {e}")
-        
-        # 保存合併後的 PPT
-        merged_presentation.SaveAs(os.path.abspath(output_filename))
-        merged_presentation.Close()
-        
-        # 關閉 PowerPoint 應用程序
-        ppt_app.Quit()
-        print(f"已成功合併所有 PPT 文件到: {output_filename}")
-        
-    except ImportError as e:
-        print(f"導入錯誤: {e}")
-        # 如果無法導入 win32com，則使用 python-pptx（功能有限）
-        try:
-            from pptx import Presentation
-            
-            # 獲取 docs 文件夾中的所有 PPT 文件
-            ppt_files = glob.glob("docs/*.ppt*")
-            
-            if not ppt_files:
-                print("docs 文件夾中沒有找到 PPT 文件")
-                return
-            
-            # 創建一個新的演示文稿
-            merged_ppt = Presentation()
-            
-            # 遍歷所有 PPT 文件並合併
-            for ppt_file in ppt_files:
-                print(f"正在處理: {ppt_file}")
-                try:
-                    # 打開當前 PPT 文件
-                    current_ppt = Presentation(ppt_file)
-                    
-                    # 複製每一張幻燈片到新的演示文稿
-                    for slide in current_ppt.slides:
-                        # 複製幻燈片布局
-                        slide_layout = merged_ppt.slide_layouts[0]  # 使用默認布局
-                        new_slide = merged_ppt.slides.add_slide(slide_layout)
-                        
-                        # 複製所有形狀
-                        for shape in slide.shapes:
-                            # 這裡我們只能複製基本元素，複雜元素可能需要更詳細的處理
-                            if shape.has_text_frame:
-                                for paragraph in shape.text_frame.paragraphs:
-                                    for run in paragraph.runs:
-                                        text_shape = new_slide.shapes.add_textbox(
-                                            shape.left, shape.top, shape.width, shape.height
-                                        )
-                                        text_frame = text_shape.text_frame
-                                        p = text_frame.add_paragraph()
-                                        p.text = run.text
-                                        # 注意：這裡沒有複製格式，如果需要可以添加更多代碼
-                except Exception as e:
-                    print(f"處理文件 {ppt_file} 時出錯: {e}")
-            
-            # 保存合併後的 PPT
-            merged_ppt.save(output_filename)
-            print(f"已成功合併所有 PPT 文件到: {output_filename}")
-            print("注意：使用 python-pptx 合併可能會丟失一些格式和效果")
-            
-        except ImportError:
-            print("錯誤：需要安裝 python-pptx 庫才能合併 PPT 文件")
-            print("請運行: pip install python-pptx")
-
-def merge_pdf_files():
-    # 創建時間戳作為文件名
-    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-    output_filename = f"output/{timestamp}.pdf"
-    
-    # 確保 output 文件夾存在
-    if not os.path.exists("output"):
-        os.makedirs("output")
-    
-    try:
-        from PyPDF2 import PdfMerger
-        
-        # 獲取 docs 文件夾中的所有 PDF 文件
-        pdf_files = glob.glob("docs/*.pdf")
-        
-        if not pdf_files:
-            print("docs 文件夾中沒有找到 PDF 文件")
-            return
-        
-        # 創建 PDF 合併器
-        merger = PdfMerger()
-        
-        # 遍歷所有 PDF 文件並合併
-        for pdf_file in pdf_files:
-            print(f"正在處理: {pdf_file}")
-            try:
-                merger.append(pdf_file)
-            except Exception as e:
-                print(f"處理文件 {pdf_file} 時出錯: {e}")
-        
-        # 保存合併後的 PDF
-        merger.write(output_filename)
-        merger.close()
-        print(f"已成功合併所有 PDF 文件到: {output_filename}")
-        
-    except ImportError:
-        print("錯誤：需要安裝 PyPDF2 庫才能合併 PDF 文件")
-        print("請運行: pip install PyPDF2")
-
 def main():
     # 添加命令行參數支持
     parser = argparse.ArgumentParser(description='生成PPT或PDF文件')
     parser.add_argument('--format', type=str, default='ppt', help='輸出格式 (ppt 或 pdf)')
-    parser.add_argument('--output', type=str, default='output.ppt', help='輸出文件名')
+    parser.add_argument('--output', type=str, default=None,
+                        help='輸出文件名 (默認: output.pptx 或 output.pdf)')
+    parser.add_argument('--streaming', action='store_true',
+                        help='PDF 使用流式合併，內存佔用與輸入文件數量和大小無關')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='並行解析文件的工作進程數，0 表示使用全部CPU核心 (默認: 1)')
+    parser.add_argument('--cache-dir', type=str, default=None,
+                        help='增量緩存目錄，未變化的文件直接使用緩存的中間結果')
+    parser.add_argument('--cache-size', type=int, default=1024,
+                        help='緩存大小上限，單位MB (默認: 1024)')
+    parser.add_argument('--manifest', type=str, default=None,
+                        help='批量模式：按 JSON/CSV 任務清單執行多個合併任務，--jobs 為同時執行的任務數')
+    parser.add_argument('--report', type=str, default=None,
+                        help='批量模式的報告文件 (默認: 清單文件名_report.json)')
+    parser.add_argument('--serve', action='store_true',
+                        help='以本地HTTP服務方式運行，--jobs 為同時執行的合併數')
+    parser.add_argument('--port', type=int, default=8765,
+                        help='HTTP服務監聽的端口 (默認: 8765)')
+    parser.add_argument('--max-queue', type=int, default=8,
+                        help='HTTP服務最多排隊等待的請求數，超出時返回503 (默認: 8)')
+    parser.add_argument('--ranges', type=str, default=None,
+                        help='只合併指定的頁面或幻燈片，如 "report.pdf:1-5,9; deck.pptx:3-12"')
+    parser.add_argument('--trace', type=str, default=None,
+                        help='把各階段的耗時和計數寫入 JSON 追蹤文件，可在 chrome://tracing 中查看')
+    parser.add_argument('--profile', type=str, default=None,
+                        help='用 cProfile 分析合併過程，並把分析數據寫入指定文件')
+    parser.add_argument('--keep-outlines', action='store_true',
+                        help='PDF 保留各文件的書籤（使用 PdfMerger，內存佔用較大）')
+    parser.add_argument('--backend', type=str, default=None,
+                        help='指定合併後端，默認自動選擇最快的可用後端（可用 --list-backends 查看）')
+    parser.add_argument('--list-backends', action='store_true',
+                        help='列出全部合併後端及其可用狀態')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='PDF 使用流水線合併：後台預讀後面的文件，讀取、解析和寫出重疊進行（適合網絡驅動器）')
+    parser.add_argument('--prefetch', type=int, default=4,
+                        help='流水線模式下最多提前讀取的文件數 (默認: 4)')
+    parser.add_argument('--prefetch-mb', type=int, default=256,
+                        help='流水線模式下預讀數據佔用的內存上限，單位MB (默認: 256)')
+    parser.add_argument('--write-buffer-mb', type=int, default=8,
+                        help='流水線模式下等待寫入磁盤的數據上限，單位MB (默認: 8)')
+    parser.add_argument('--optimize-images', action='store_true',
+                        help='合併後縮小並重新編碼輸出中的圖片，並報告優化前後的大小')
+    parser.add_argument('--image-dpi', type=int, default=150,
+                        help='圖片優化的目標分辨率，按頁面大小估算 (默認: 150)')
+    parser.add_argument('--jpeg-quality', type=int, default=80,
+                        help='圖片優化時 JPEG 的質量 1-95 (默認: 80)')
+    parser.add_argument('--keep-png', action='store_true',
+                        help='圖片優化時不把無透明通道的無損圖片轉換為 JPEG')
+    parser.add_argument('--mixed', action='store_true',
+                        help='PDF 合併同時包括 docs 中的演示文稿：用 LibreOffice 轉換為PDF後按文件名順序合併')
+    parser.add_argument('--compact', action='store_true',
+                        help='PDF 緊湊輸出：小對象打包進壓縮的對象流，交叉引用表寫成交叉引用流（頁數很多時明顯減小輸出）')
+    parser.add_argument('--compress-level', type=int, default=6, choices=range(10), metavar='0-9',
+                        help='緊湊輸出的壓縮級別，越大輸出越小、寫出越慢 (默認: 6)')
+    parser.add_argument('--linearize', action='store_true',
+                        help='PDF 輸出線性化（快速網頁查看）：首頁和頁面索引寫在文件開頭，網頁中可以邊下載邊顯示')
+    parser.add_argument('--check-linearization', type=str, default=None, metavar='PDF',
+                        help='用 pikepdf 或 qpdf 檢查指定PDF是否正確線性化')
+    parser.add_argument('--isolate', action='store_true',
+                        help='合併前在獨立進程中逐個檢查輸入，出錯、超時或內存超限的文件移到隔離目錄並寫出原因')
+    parser.add_argument('--file-timeout', type=float, default=120,
+                        help='隔離檢查時單個文件的時間上限（秒） (默認: 120)')
+    parser.add_argument('--file-memory-mb', type=int, default=2048,
+                        help='隔離檢查時單個文件的內存上限（MB），0 表示不限制 (默認: 2048)')
+    parser.add_argument('--quarantine', type=str, default=None,
+                        help='隔離目錄 (默認: 輸入所在目錄下的 quarantine 文件夾)')
+    parser.add_argument('--order', type=str, default='name', choices=['name', 'natural', 'date', 'custom'],
+                        help='docs 中文件的合併順序: 文件名、自然排序、修改時間或 docs/order.txt 中的自定義順序 (默認: name)')
+    parser.add_argument('--index', action='store_true',
+                        help='合併前更新 docs 的文件索引，顯示預計頁數、輸出大小和耗時，並跳過無法合併的文件')
+    parser.add_argument('--preview', action='store_true',
+                        help='只更新文件索引並顯示每個文件的頁數、大小、標題和預計的合併結果，不合併')
+    parser.add_argument('--max-pages', type=int, default=None,
+                        help='分片輸出：每個輸出文件最多包含的頁數（幻燈片數），生成 output_part001 等文件和 output_shards.json 清單')
+    parser.add_argument('--max-mb', type=float, default=None,
+                        help='分片輸出：每個輸出文件的預計大小上限（MB）；再次運行時跳過已完成的分片')
+    parser.add_argument('--checkpoint', action='store_true',
+                        help='PDF 合併期間在輸出旁邊定期寫檢查點，進程中途退出後用同樣的命令再次運行時從檢查點繼續')
+    parser.add_argument('--checkpoint-every', type=int, default=50,
+                        help='每處理多少個文件寫一次檢查點 (默認: 50)')
+    parser.add_argument('--checkpoint-seconds', type=float, default=60,
+                        help='距上次檢查點超過多少秒時寫一次檢查點 (默認: 60)')
+    parser.add_argument('--watch', action='store_true',
+                        help='監視 docs 文件夾，文件變化後增量更新 --output，按 Ctrl+C 停止')
+    parser.add_argument('--debounce', type=float, default=2.0,
+                        help='監視模式下文件變化穩定多少秒後再合併 (默認: 2)')
     
     args = parser.parse_args()
     
-    # 根據格式調用不同的處理函數
-    if args.format.lower() == 'ppt':
-        generate_ppt(args.output)
-    elif args.format.lower() == 'pdf':
-        generate_pdf(args.output)
-    else:
+    # 消息由 print 回調顯示，日誌只把沒有經過回調的警告和錯誤輸出到控制台
+    console = logging.StreamHandler(sys.stderr)
+    console.setLevel(logging.WARNING)
+    console.addFilter(lambda record: not getattr(record, "shown", False))
+    logging.getLogger('格式選擇器').addHandler(console)
+    
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    
+    if args.list_backends:
+        from merge_backends import describe_backends
+        for line in describe_backends():
+            print(line)
+        return 0
+    
+    if args.check_linearization:
+        from pdf_linearize import check_linearization
+        ok, message = check_linearization(args.check_linearization)
+        print(message)
+        return 0 if ok else 1
+    
+    if args.serve:
+        from merge_server import serve
+        serve(port=args.port, workers=jobs, max_queue=args.max_queue, status_callback=print)
+        return 0
+    
+    if args.manifest:
+        from batch_merge import run_batch
+        try:
+            report = run_batch(args.manifest, jobs, args.report, print)
+        except (OSError, ValueError) as e:
+            print(f"無法讀取任務清單: {e}")
+            return 1
+        return 1 if report["failed"] else 0
+    
+    if args.ranges:
+        from merge_utils import apply_range_specs
+        try:
+            apply_range_specs([], args.ranges)
+        except ValueError as e:
+            print(f"範圍格式錯誤: {e}")
+            return 1
+    
+    cache = None
+    if args.cache_dir:
+        from merge_cache import MergeCache
+        cache = MergeCache(args.cache_dir, max_bytes=args.cache_size * 1024 * 1024)
+    
+    format_type = args.format.lower()
+    if format_type not in ('ppt', 'pdf'):
         print(f"不支持的格式: {args.format}")
         return 1
+    if args.output is None:
+        # XML 後端寫出的是 OOXML 演示文稿，擴展名必須是 .pptx
+        args.output = 'output.pptx' if format_type == 'ppt' else 'output.pdf'
     
-    print(f"文件已生成: {args.output}")
-    return 0
-
-def generate_ppt(output_file):
-    """生成PPT文件並保存到指定路徑"""
-    # 確保輸出目錄存在
-    output_dir = os.path.dirname(output_file)
-    if output_dir and not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+    if args.watch:
+        from watch_merge import watch_folder
+        # 監視模式總是使用緩存，未變化的文件不會被重新處理
+        if cache is None:
+            from merge_cache import MergeCache
+            cache = MergeCache("cache", max_bytes=args.cache_size * 1024 * 1024)
+        watch_folder(
+            format_type, args.output, status_callback=print, cache=cache, jobs=jobs,
+            ranges=args.ranges, debounce=args.debounce, order=args.order
+        )
+        return 0
+    
+    from contextlib import nullcontext
+    from merge_backends import discover_inputs, run_merge
+    from merge_trace import MergeTrace, profiled
     
-    try:
-        # 嘗試使用高級方法（需要 Windows 和 PowerPoint）
-        import win32com.client
-        
-        # 獲取 docs 文件夾中的所有 PPT 文件
-        ppt_files = glob.glob("docs/*.ppt*")
-        
-        if not ppt_files:
-            print("docs 文件夾中沒有找到 PPT 文件")
-            return
-        
-        # 啟動 PowerPoint 應用程序
-        ppt_app = win32com.client.Dispatch("PowerPoint.Application")
-        
-        # 使用第一個文件作為基礎，而不是創建新的空演示文稿
-        print(f"正在使用第一個文件作為基礎: {ppt_files[0]}")
-        base_path = os.path.abspath(ppt_files[0])
-        merged_presentation = ppt_app.Presentations.Open(base_path)
-        
-        # 遍歷剩餘的 PPT 文件並合併
-        for ppt_file in ppt_files[1:]:
-            print(f"正在處理: {ppt_file}")
-            try:
-                # 打開當前 PPT 文件
-                abs_path = os.path.abspath(ppt_file)
-                current_presentation = ppt_app.Presentations.Open(abs_path)
-                
-                # 獲取幻燈片數量
-                slide_count = current_presentation.Slides.Count
-                
-                # 複製所有幻燈片到合併的演示文稿
-                for i in range(1, slide_count + 1):
-                    current_presentation.Slides(i).Copy()
-                    merged_presentation.Slides.Paste()
-                
-                # 關閉當前演示文稿而不保存
-                current_presentation.Close()
-            except Exception as e:
-                print(f"處理文件 {ppt_file} 時出錯: {e}")
-        
-        # 保存合併後的 PPT 到指定路徑
-        output_abs_path = os.path.abspath(output_file)
-        merged_presentation.SaveAs(output_abs_path)
-        merged_presentation.Close()
-        
-        # 關閉 PowerPoint 應用程序
-        ppt_app.Quit()
-        print(f"已成功合併所有 PPT 文件到: {output_file}")
-        
-    except ImportError as e:
-        print(f"導入錯誤: {e}")
-        # 如果無法導入 win32com，則使用 python-pptx（功能有限）
+    pipeline = None
+    if args.pipeline:
+        from merge_pipeline import PipelineConfig
         try:
-            from pptx import Presentation
-            
-            # 獲取 docs 文件夾中的所有 PPT 文件
-            ppt_files = glob.glob("docs/*.ppt*")
-            
-            if not ppt_files:
-                print("docs 文件夾中沒有找到 PPT 文件")
-                return
-            
-            # 創建一個新的演示文稿
-            merged_ppt = Presentation()
-            
-            # 遍歷所有 PPT 文件並合併
-            for ppt_file in ppt_files:
-                print(f"正在處理: {ppt_file}")
-                try:
-                    # 打開當前 PPT 文件
-                    current_ppt = Presentation(ppt_file)
-                    
-                    # 複製每一張幻燈片到新的演示文稿
-                    for slide in current_ppt.slides:
-                        # 複製幻燈片布局
-                        slide_layout = merged_ppt.slide_layouts[0]  # 使用默認布局
-                        new_slide = merged_ppt.slides.add_slide(slide_layout)
-                        
-                        # 複製所有形狀
-                        for shape in slide.shapes:
-                            # 這裡我們只能複製基本元素，複雜元素可能需要更詳細的處理
-                            if shape.has_text_frame:
-                                for paragraph in shape.text_frame.paragraphs:
-                                    for run in paragraph.runs:
-                                        text_shape = new_slide.shapes.add_textbox(
-                                            shape.left, shape.top, shape.width, shape.height
-                                        )
-                                        text_frame = text_shape.text_frame
-                                        p = text_frame.add_paragraph()
-                                        p.text = run.text
-                                        # 注意：這裡沒有複製格式，如果需要可以添加更多代碼
-                except Exception as e:
-                    print(f"處理文件 {ppt_file} 時出錯: {e}")
-            
-            # 保存合併後的 PPT 到指定路徑
-            merged_ppt.save(output_file)
-            print(f"已成功合併所有 PPT 文件到: {output_file}")
-            print("注意：使用 python-pptx 合併可能會丟失一些格式和效果")
-            
-        except ImportError:
-            print("錯誤：需要安裝 python-pptx 庫才能合併 PPT 文件")
-            print("請運行: pip install python-pptx")
-
-def generate_pdf(output_file):
-    """生成PDF文件並保存到指定路徑"""
-    # 確保輸出目錄存在
-    output_dir = os.path.dirname(output_file)
-    if output_dir and not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+            pipeline = PipelineConfig(
+                args.prefetch, args.prefetch_mb * 1024 * 1024, args.write_buffer_mb * 1024 * 1024
+            )
+        except ValueError as e:
+            print(e)
+            return 1
+    
+    optimize = None
+    if args.optimize_images:
+        from image_optimize import ImageOptions
+        try:
+            optimize = ImageOptions(args.image_dpi, args.jpeg_quality, not args.keep_png)
+        except ValueError as e:
+            print(e)
+            return 1
+    
+    isolation = None
+    if args.isolate:
+        from merge_isolation import IsolationConfig
+        try:
+            isolation = IsolationConfig(args.file_timeout, args.file_memory_mb, args.quarantine)
+        except ValueError as e:
+            print(e)
+            return 1
+    
+    shards = None
+    if args.max_pages is not None or args.max_mb is not None:
+        from merge_shards import ShardConfig
+        try:
+            shards = ShardConfig(
+                args.max_pages, int(args.max_mb * 1024 * 1024) if args.max_mb is not None else None
+            )
+        except ValueError as e:
+            print(e)
+            return 1
     
-    try:
-        from PyPDF2 import PdfMerger
-        
-        # 獲取 docs 文件夾中的所有 PDF 文件
-        pdf_files = glob.glob("docs/*.pdf")
-        
-        if not pdf_files:
-            print("docs 文件夾中沒有找到 PDF 文件")
-            return
-        
-        # 創建 PDF 合併器
-        merger = PdfMerger()
-        
-        # 遍歷所有 PDF 文件並合併
-        for pdf_file in pdf_files:
-            print(f"正在處理: {pdf_file}")
-            try:
-                merger.append(pdf_file)
-            except Exception as e:
-                print(f"處理文件 {pdf_file} 時出錯: {e}")
-        
-        # 保存合併後的 PDF 到指定路徑
-        merger.write(output_file)
-        merger.close()
-        print(f"已成功合併所有 PDF 文件到: {output_file}")
-        
-    except ImportError:
-        print("錯誤：需要安裝 PyPDF2 庫才能合併 PDF 文件")
-        print("請運行: pip install PyPDF2")
+    checkpoint = None
+    if args.checkpoint:
+        from merge_checkpoint import CheckpointConfig
+        try:
+            checkpoint = CheckpointConfig(args.checkpoint_every, args.checkpoint_seconds)
+        except ValueError as e:
+            print(e)
+            return 1
+    
+    trace = MergeTrace(format_type)
+    profiler = profiled(args.profile, print) if args.profile else nullcontext()
+    
+    # 由後端註冊表根據輸入和選項選出最快的可用後端
+    with profiler:
+        files = discover_inputs(
+            format_type, ranges=args.ranges, trace=trace, mixed=args.mixed, order=args.order
+        )
+        if args.index or args.preview:
+            from docs_index import DocsIndex, preview_lines, validate_inputs
+            index = DocsIndex()
+            entries = index.refresh(files, jobs, print, trace=trace)
+            index.save()
+            for line in preview_lines(format_type, files, entries, jobs, details=args.preview):
+                print(line)
+            problems = validate_inputs(files, entries)
+            for spec, reason in problems:
+                print(f"無法合併 {spec}: {reason}")
+            if args.preview:
+                return 1 if problems else 0
+            # 在開始耗時的合併之前跳過已知無法合併的文件
+            skipped = {spec for spec, _ in problems}
+            files = [spec for spec in files if spec not in skipped]
+        options = dict(
+            streaming=args.streaming, keep_outlines=args.keep_outlines, backend=args.backend,
+            pipeline=pipeline, optimize=optimize, linearize=args.linearize,
+            compress_level=args.compress_level if args.compact else None, isolation=isolation,
+            checkpoint=checkpoint
+        )
+        try:
+            if shards is not None:
+                from merge_shards import run_sharded_merge
+                success = run_sharded_merge(
+                    format_type, files, args.output, shards, print, jobs=jobs, cache=cache, trace=trace,
+                    **options
+                )
+            else:
+                success = run_merge(
+                    format_type, files, args.output, print, jobs=jobs, cache=cache, trace=trace, **options
+                )
+        except LookupError as e:
+            print(e)
+            return 1
+    
+    trace.report(print)
+    if args.trace:
+        print(f"追蹤文件已寫入: {trace.write_json(args.trace)}")
+    if not success:
+        return 1
+    if shards is None:
+        print(f"文件已生成: {args.output}")
+    return 0
 
 if __name__ == "__main__":
+    import multiprocessing
+    
+    # 打包後的可執行文件啟動工作進程時需要
+    multiprocessing.freeze_support()
     sys.exit(main()) 
\ No newline at end of file
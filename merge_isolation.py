@@ -0,0 +1,271 @@
+import os
+import time
+import errno
+import shutil
+import logging
+import multiprocessing
+from datetime import datetime
+from contextlib import nullcontext
+from multiprocessing.connection import wait
+
+from merge_utils import notify, check_cancelled, limit_process_memory, split_input_spec
+from pdf_stream import _PdfObjectCopier
+
+# 可以在隔離進程中檢查的輸入，其他格式（如只有 PowerPoint 能讀取的 .ppt）不檢查
+CHECKED_EXTENSIONS = {"pdf": (".pdf",), "ppt": (".pptx",)}
+# 主進程至少每隔這麼久檢查一次取消和超時
+POLL_INTERVAL = 0.5
+# 隔離原因的顯示名稱
+REASON_LABELS = {
+    "timeout": "超時",
+    "memory": "內存超限",
+    "crash": "進程崩潰",
+    "error": "無法解析",
+}
+
+
+class IsolationConfig:
+    """逐個文件隔離檢查的限制
+
+    timeout         單個文件的檢查時間上限（秒）
+    memory_mb       檢查進程的內存上限（MB），0 表示不限制
+    quarantine_dir  檢查失敗的輸入移入的目錄；None 時移到各輸入所在目錄下的 quarantine 文件夾
+    """
+
+    def __init__(self, timeout=120, memory_mb=2048, quarantine_dir=None):
+        if timeout <= 0:
+            raise ValueError("單個文件的時間上限必須大於 0")
+        if memory_mb < 0:
+            raise ValueError("內存上限不能為負數")
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self.quarantine_dir = quarantine_dir
+
+    def __repr__(self):
+        return (
+            f"IsolationConfig(timeout={self.timeout}, memory_mb={self.memory_mb}, "
+            f"quarantine_dir={self.quarantine_dir!r})"
+        )
+
+
+class IsolationReport:
+    """一次隔離檢查的結果，failures 為 [(輸入, 原因, 詳情, 隔離後的路徑或 None)]"""
+
+    def __init__(self):
+        self.passed = 0
+        self.cached = 0
+        self.unchecked = 0
+        self.failures = []
+
+    def summary_lines(self):
+        counts = {}
+        for _, reason, _, _ in self.failures:
+            counts[reason] = counts.get(reason, 0) + 1
+        detail = ", ".join(f"{REASON_LABELS[reason]} {count}" for reason, count in counts.items())
+        lines = [
+            f"隔離檢查: 通過 {self.passed} 個（其中緩存 {self.cached} 個）, "
+            f"未檢查 {self.unchecked} 個, 隔離 {len(self.failures)} 個"
+            + (f"（{detail}）" if detail else "")
+        ]
+        for spec, reason, message, moved_to in self.failures:
+            target = f"，已移到 {moved_to}" if moved_to else "，未能移動"
+            lines.append(f"  {spec}: {REASON_LABELS[reason]} - {message}{target}")
+        return lines
+
+
+class _DiscardingCopier(_PdfObjectCopier):
+    """按合併時的方式遍歷並序列化頁面及其依賴對象，但不寫出任何內容"""
+
+    def _write(self, data):
+        self._pos += len(data)
+
+
+def check_input(format_name, spec):
+    """在當前進程中按合併時的方式完整讀取一個輸入，返回頁數（或幻燈片數），出錯時拋出異常"""
+    if format_name == "pdf":
+        copier = _DiscardingCopier()
+        copier.append(spec)
+        return copier.pages_written
+    from pptx_merge import extract_deck
+    return len(extract_deck(spec).slides)
+
+
+def _check_worker(conn, format_name, spec, memory_bytes):
+    """隔離進程入口：設置內存上限後檢查一個輸入，把結果發回主進程"""
+    try:
+        # 先導入解析用的庫，內存上限只約束文件本身的解析
+        if format_name == "pdf":
+            import PyPDF2  # noqa: F401
+        else:
+            import pptx_merge  # noqa: F401
+        if memory_bytes:
+            limit_process_memory(memory_bytes)
+        result = ("ok", check_input(format_name, spec))
+    except MemoryError:
+        result = ("memory", None)
+    except Exception as e:
+        if isinstance(e, OSError) and e.errno == errno.ENOMEM:
+            result = ("memory", None)
+        else:
+            result = ("error", str(e) or type(e).__name__)
+    try:
+        conn.send(result)
+    finally:
+        conn.close()
+
+
+def _needs_check(format_name, spec):
+    extension = os.path.splitext(split_input_spec(spec)[0])[1].lower()
+    return extension in CHECKED_EXTENSIONS.get(format_name, ())
+
+
+def quarantine_input(path, quarantine_dir, reason, message, config):
+    """把出錯的輸入移到隔離目錄，並在旁邊寫出說明原因的文件，返回移動後的路徑"""
+    os.makedirs(quarantine_dir, exist_ok=True)
+    stem, extension = os.path.splitext(os.path.basename(path))
+    target = os.path.join(quarantine_dir, stem + extension)
+    suffix = 1
+    while os.path.exists(target):
+        target = os.path.join(quarantine_dir, f"{stem}_{suffix}{extension}")
+        suffix += 1
+    shutil.move(path, target)
+    limits = f"每個文件 {config.timeout:g} 秒"
+    if config.memory_mb:
+        limits += f", 內存 {config.memory_mb} MB"
+    with open(target + ".reason.txt", "w", encoding="utf-8") as fh:
+        fh.write(
+            f"文件: {os.path.abspath(path)}\n"
+            f"時間: {datetime.now().isoformat(timespec='seconds')}\n"
+            f"原因: {REASON_LABELS[reason]}\n"
+            f"詳情: {message}\n"
+            f"限制: {limits}\n"
+        )
+    return target
+
+
+def isolate_inputs(format_name, files, config, jobs=1, cache=None, status_callback=None,
+                   cancel_event=None, trace=None):
+    """在獨立進程中逐個檢查輸入，返回 (可以合併的輸入列表, IsolationReport)
+
+    每個文件在各自的進程中按合併時的方式完整讀取一遍，同時運行最多 jobs 個；
+    超過時間上限的進程被終止，內存上限在進程內設置，進程崩潰也不會影響主進程。
+    檢查失敗的文件被移到隔離目錄並附上原因文件，不再參與合併。
+    傳入 MergeCache 時通過檢查的文件按內容哈希記錄，未變化的文件下次不再檢查。
+    """
+    report = IsolationReport()
+    results = list(files)
+    pending = []
+    # 已移到隔離目錄的文件（絕對路徑 -> 隔離後的路徑）
+    moved = {}
+    for index, spec in enumerate(files):
+        if not _needs_check(format_name, spec):
+            report.unchecked += 1
+            continue
+        path, ranges = split_input_spec(spec)
+        key = None
+        if cache is not None:
+            try:
+                key = cache.key("isolation-check", path, ranges)
+            except OSError:
+                key = None
+            if key is not None and cache.get(key) is not None:
+                report.passed += 1
+                report.cached += 1
+                continue
+        pending.append((index, spec, key))
+
+    if pending:
+        notify(
+            f"正在隔離檢查 {len(pending)} 個文件（每個文件 {config.timeout:g} 秒"
+            + (f", 內存 {config.memory_mb} MB" if config.memory_mb else "") + "）",
+            status_callback,
+        )
+        with trace.span("isolate") if trace is not None else nullcontext():
+            failures = _run_checks(format_name, pending, config, jobs, cancel_event)
+        for index, spec, key in pending:
+            failure = failures.get(index)
+            if failure is None:
+                report.passed += 1
+                if key is not None:
+                    cache.put(key, {"checked_at": datetime.now().isoformat(timespec="seconds")})
+                continue
+            reason, message = failure
+            results[index] = None
+            path = os.path.abspath(split_input_spec(spec)[0])
+            if path not in moved and not os.path.exists(path):
+                # 批量模式下同一文件可能已被另一個任務移到隔離目錄
+                notify(f"找不到輸入文件，已跳過: {spec}", status_callback, logging.WARNING)
+                continue
+            moved_to = moved.get(path)
+            if moved_to is None:
+                quarantine_dir = config.quarantine_dir or os.path.join(os.path.dirname(path), "quarantine")
+                try:
+                    moved_to = moved[path] = quarantine_input(path, quarantine_dir, reason, message, config)
+                except OSError as e:
+                    notify(f"無法隔離文件 {path}: {e}", status_callback, logging.ERROR)
+            report.failures.append((spec, reason, message, moved_to))
+            if trace is not None:
+                trace.count("files_quarantined")
+            notify(f"已隔離 {spec}: {REASON_LABELS[reason]} - {message}", status_callback, logging.ERROR)
+    # 同一文件以不同範圍出現多次時，已被移走的文件也不再合併
+    return [
+        spec for spec in results
+        if spec is not None and os.path.abspath(split_input_spec(spec)[0]) not in moved
+    ], report
+
+
+def _run_checks(format_name, pending, config, jobs, cancel_event):
+    """同時運行最多 jobs 個檢查進程，返回 {下標: (原因, 詳情)}，只包含失敗的文件"""
+    context = multiprocessing.get_context()
+    memory_bytes = config.memory_mb * 1024 * 1024
+    queue = list(reversed(pending))
+    running = {}
+    failures = {}
+    try:
+        while queue or running:
+            check_cancelled(cancel_event)
+            while queue and len(running) < max(jobs, 1):
+                index, spec, _ = queue.pop()
+                reader, writer = context.Pipe(duplex=False)
+                process = context.Process(
+                    target=_check_worker, args=(writer, format_name, spec, memory_bytes), daemon=True
+                )
+                process.start()
+                # 只有子進程持有寫端，子進程退出時讀端才能收到 EOF
+                writer.close()
+                running[reader] = (index, process, time.monotonic() + config.timeout)
+
+            now = time.monotonic()
+            timeout = min(min(deadline for _, _, deadline in running.values()) - now, POLL_INTERVAL)
+            for reader in wait(list(running), max(timeout, 0)):
+                index, process, _ = running.pop(reader)
+                try:
+                    status, value = reader.recv()
+                except (EOFError, OSError):
+                    status, value = "crash", None
+                reader.close()
+                process.join()
+                if status == "memory":
+                    failures[index] = ("memory", f"超出內存上限 {config.memory_mb} MB")
+                elif status == "crash":
+                    # 內存耗盡時進程可能來不及發回結果就退出
+                    hint = "，可能超出內存上限" if memory_bytes else ""
+                    failures[index] = ("crash", f"檢查進程異常退出（退出代碼 {process.exitcode}）{hint}")
+                elif status == "error":
+                    failures[index] = ("error", value)
+
+            now = time.monotonic()
+            for reader, (index, process, deadline) in list(running.items()):
+                if now >= deadline:
+                    del running[reader]
+                    process.kill()
+                    process.join()
+                    reader.close()
+                    failures[index] = ("timeout", f"超過 {config.timeout:g} 秒仍未完成")
+    finally:
+        # 取消或出錯時終止仍在運行的檢查進程
+        for reader, (_, process, _) in running.items():
+            process.kill()
+            process.join()
+            reader.close()
+    return failures
@@ -0,0 +1,270 @@
+import os
+import queue
+import threading
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+
+from merge_utils import check_cancelled, split_input_spec
+
+# 預讀時每次讀取的大小，網絡驅動器上大塊順序讀取遠快於按需的小塊隨機讀取
+READ_CHUNK = 4 * 1024 * 1024
+# 後台寫出時積累到這個大小再交給寫出線程，減少線程切換
+WRITE_CHUNK = 1024 * 1024
+_DONE = object()
+
+
+class PipelineConfig:
+    """流水線合併的隊列深度和內存預算
+
+    depth       最多提前讀取多少個文件，也是同時讀取的線程數
+    max_bytes   已讀入內存、尚未寫出的輸入文件總大小上限；超過上限的單個文件不預讀，
+                在寫出階段按需從磁盤讀取
+    write_bytes 等待寫入磁盤的輸出數據上限，寫得比處理慢時處理階段會等待
+    """
+
+    def __init__(self, depth=4, max_bytes=256 * 1024 * 1024, write_bytes=8 * 1024 * 1024):
+        if depth < 1:
+            raise ValueError("預讀深度至少為 1")
+        self.depth = depth
+        self.max_bytes = max_bytes
+        self.write_bytes = write_bytes
+
+    def __repr__(self):
+        return (
+            f"PipelineConfig(depth={self.depth}, max_bytes={self.max_bytes}, "
+            f"write_bytes={self.write_bytes})"
+        )
+
+
+class ByteBudget:
+    """按字節數計數的信號量，預算用完時等待已處理完的文件歸還"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, size, stop_event=None):
+        """佔用 size 字節，返回是否成功；stop_event 被設置時放棄等待
+
+        沒有其他文件佔用預算時總是成功，所以任何不超過上限的文件都不會無限等待。
+        """
+        with self._cond:
+            while self.used and self.used + size > self.limit:
+                if stop_event is not None and stop_event.is_set():
+                    return False
+                self._cond.wait(0.1)
+            self.used += size
+            return True
+
+    def release(self, size):
+        with self._cond:
+            self.used -= size
+            self._cond.notify_all()
+
+
+def read_whole_file(path, trace=None, spec=None):
+    """用大塊順序讀取把整個文件讀入內存"""
+    with trace.span("read", file=spec or path) if trace is not None else nullcontext():
+        chunks = []
+        with open(path, "rb", buffering=0) as fh:
+            while True:
+                chunk = fh.read(READ_CHUNK)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        return b"".join(chunks)
+
+
+class PrefetchedInput:
+    """預讀階段的產出
+
+    data 為文件內容，文件超過預算時為 None；result 為 transform 的返回值；
+    讀取或 transform 失敗時 error 為異常。
+    """
+
+    def __init__(self, spec, path, size, data=None, error=None, budget=None):
+        self.spec = spec
+        self.path = path
+        self.size = size
+        self.data = data
+        self.result = None
+        self.error = error
+        self._budget = budget
+
+    def release(self):
+        """歸還佔用的內存預算，處理完這個文件後調用"""
+        self.data = None
+        self.result = None
+        if self._budget is not None:
+            self._budget.release(self.size)
+            self._budget = None
+
+
+def prefetch_inputs(specs, config, cancel_event=None, trace=None, transform=None):
+    """按輸入順序產出 PrefetchedInput，後台線程提前讀取後面的文件
+
+    最多 config.depth 個文件在讀取或等待處理，已讀入的數據總量不超過 config.max_bytes。
+    transform 在讀取線程中對讀入的數據執行（如解析），結果保存在 result 中，
+    這樣讀取和解析都與調用方的處理重疊。
+    調用方處理完每一項後必須調用其 release()；提前停止迭代時剩餘的讀取會被放棄。
+    """
+    budget = ByteBudget(config.max_bytes)
+    pending = queue.Queue(config.depth)
+    stop = threading.Event()
+
+    def read(spec, path, size):
+        try:
+            item = PrefetchedInput(spec, path, size, read_whole_file(path, trace, spec), budget=budget)
+        except Exception as e:
+            budget.release(size)
+            return PrefetchedInput(spec, path, 0, error=e)
+        if transform is not None:
+            try:
+                item.result = transform(item)
+            except Exception as e:
+                item.error = e
+        return item
+
+    def dispatch(executor):
+        try:
+            for spec in specs:
+                if stop.is_set():
+                    return
+                path = split_input_spec(spec)[0]
+                try:
+                    size = os.path.getsize(path)
+                except OSError as e:
+                    item = PrefetchedInput(spec, path, 0, error=e)
+                else:
+                    if size > config.max_bytes:
+                        # 大文件不預讀，由處理階段直接從磁盤讀取
+                        item = PrefetchedInput(spec, path, size)
+                        if trace is not None:
+                            trace.count("prefetch_skipped")
+                    elif budget.acquire(size, stop):
+                        item = executor.submit(read, spec, path, size)
+                    else:
+                        return
+                while not stop.is_set():
+                    try:
+                        pending.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+        finally:
+            while not stop.is_set():
+                try:
+                    pending.put(_DONE, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+
+    executor = ThreadPoolExecutor(max_workers=config.depth, thread_name_prefix="prefetch")
+    dispatcher = threading.Thread(target=dispatch, args=(executor,), name="prefetch-dispatch", daemon=True)
+    dispatcher.start()
+    try:
+        while True:
+            check_cancelled(cancel_event)
+            item = pending.get()
+            if item is _DONE:
+                break
+            if not isinstance(item, PrefetchedInput):
+                item = item.result()
+            if trace is not None and item.data is not None:
+                trace.count("prefetched_bytes", item.size)
+            yield item
+    finally:
+        stop.set()
+        dispatcher.join()
+        executor.shutdown(wait=True)
+        # 放棄尚未交給調用方的數據
+        while True:
+            try:
+                item = pending.get_nowait()
+            except queue.Empty:
+                break
+            if item is _DONE:
+                continue
+            if not isinstance(item, PrefetchedInput):
+                item = item.result()
+            item.release()
+
+
+class BackgroundWriter:
+    """把寫入交給後台線程的文件包裝，處理階段不必等待磁盤
+
+    小塊寫入先積累到 WRITE_CHUNK 再交出，排隊中的數據不超過 max_bytes。
+    寫出線程中的錯誤在下一次 write 或 close 時拋出。
+    """
+
+    def __init__(self, fh, max_bytes=8 * 1024 * 1024, trace=None):
+        self._fh = fh
+        self._trace = trace
+        self._buffer = []
+        self._buffered = 0
+        self._queue = queue.Queue(max(max_bytes // WRITE_CHUNK, 1))
+        self._error = None
+        self.closed = False
+        self._thread = threading.Thread(target=self._run, name="writer", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            chunk = self._queue.get()
+            try:
+                if chunk is None:
+                    break
+                if self._error is not None:
+                    continue
+                try:
+                    self._fh.write(chunk)
+                except Exception as e:
+                    self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise self._error
+
+    def write(self, data):
+        self._raise_error()
+        self._buffer.append(bytes(data))
+        self._buffered += len(data)
+        if self._buffered >= WRITE_CHUNK:
+            self._hand_off()
+
+    def _hand_off(self):
+        chunk = b"".join(self._buffer)
+        self._buffer = []
+        self._buffered = 0
+        if self._queue.full() and self._trace is not None:
+            with self._trace.span("wait", stage="write"):
+                self._queue.put(chunk)
+        else:
+            self._queue.put(chunk)
+
+    def sync(self):
+        """等待已交出的數據全部寫入文件並刷到磁盤，用於寫檢查點"""
+        self._raise_error()
+        if self._buffer:
+            self._hand_off()
+        self._queue.join()
+        self._raise_error()
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+
+    def close(self):
+        """寫出剩餘數據，等待寫出線程結束並關閉文件"""
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            if self._buffer and self._error is None:
+                self._hand_off()
+            self._queue.put(None)
+            self._thread.join()
+        finally:
+            self._fh.close()
+        self._raise_error()
@@ -0,0 +1,309 @@
+import os
+import json
+import errno
+import shutil
+import socketserver
+import logging
+import tarfile
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from batch_merge import FORMAT_ALIASES, merge_inputs
+from merge_utils import notify
+
+logger = logging.getLogger('格式選擇器')
+
+CHUNK_SIZE = 64 * 1024
+OUTPUT_TYPES = {
+    "pdf": "application/pdf",
+    "ppt": "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+}
+OUTPUT_EXTENSIONS = {"pdf": ".pdf", "ppt": ".pptx"}
+
+
+def _storage_error_status(error):
+    """保存上傳文件失敗時的狀態碼：磁盤已滿為 507，其他（如沒有寫入權限）為 500"""
+    return 507 if error.errno in (errno.ENOSPC, getattr(errno, "EDQUOT", errno.ENOSPC)) else 500
+
+
+class _ChunkedReader:
+    """把 Transfer-Encoding: chunked 的請求體解碼為普通的只讀流"""
+
+    def __init__(self, rfile):
+        self._rfile = rfile
+        self._remaining = 0
+        self._done = False
+
+    def read(self, size=-1):
+        parts = []
+        while not self._done and (size < 0 or size > 0):
+            if self._remaining == 0:
+                line = self._rfile.readline(65537)
+                chunk_size = int(line.split(b";", 1)[0].strip() or b"0", 16)
+                if chunk_size == 0:
+                    # 跳過可選的尾部字段直到空行
+                    while self._rfile.readline(65537) not in (b"\r\n", b"\n", b""):
+                        pass
+                    self._done = True
+                    break
+                self._remaining = chunk_size
+            want = self._remaining if size < 0 else min(size, self._remaining)
+            data = self._rfile.read(want)
+            if not data:
+                raise ConnectionError("請求體在分塊中途結束")
+            parts.append(data)
+            self._remaining -= len(data)
+            if self._remaining == 0:
+                self._rfile.readline(65537)
+            if size > 0:
+                size -= len(data)
+        return b"".join(parts)
+
+
+class _LimitedReader:
+    """只讀取 Content-Length 指定長度的請求體"""
+
+    def __init__(self, rfile, length):
+        self._rfile = rfile
+        self._remaining = length
+
+    def read(self, size=-1):
+        if self._remaining <= 0:
+            return b""
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._rfile.read(size)
+        self._remaining -= len(data)
+        return data
+
+
+class MergeRequestHandler(BaseHTTPRequestHandler):
+    """POST /merge?format=pdf|ppt 上傳 tar 包，響應為合併後的文件
+
+    tar 包中的文件按出現順序合併，邊接收邊寫入臨時目錄；輸出以分塊傳輸流式返回。
+    GET /health 返回當前的隊列狀態。
+    """
+
+    protocol_version = "HTTP/1.1"
+    server_version = "MergeServer/1.0"
+    # 客戶端長時間不發送數據時釋放處理線程
+    timeout = 300
+
+    def log_message(self, format, *args):
+        logger.info("%s - %s" % (self.address_string(), format % args))
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if urlparse(self.path).path != "/health":
+            self._send_json(404, {"error": "not found"})
+            return
+        self._send_json(200, self.server.status())
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/merge":
+            self._send_json(404, {"error": "not found"})
+            return
+
+        query = parse_qs(url.query)
+        format_name = FORMAT_ALIASES.get((query.get("format") or ["pdf"])[0].lower())
+        if format_name is None:
+            self._send_json(400, {"error": "format 只能是 pdf 或 ppt"})
+            return
+
+        # 隊列已滿時在讀取請求體之前拒絕，由客戶端稍後重試
+        if not self.server.try_acquire():
+            self.close_connection = True
+            self._send_json(503, {"error": "合併隊列已滿，請稍後重試"}, {"Retry-After": "5"})
+            return
+        try:
+            self._handle_merge(format_name)
+        finally:
+            self.server.release()
+
+    def _request_body(self):
+        if "chunked" in self.headers.get("Transfer-Encoding", "").lower():
+            return _ChunkedReader(self.rfile)
+        return _LimitedReader(self.rfile, int(self.headers.get("Content-Length") or 0))
+
+    def _receive_inputs(self, work_dir):
+        """以流模式讀取 tar 包，逐個把文件寫入 work_dir，返回按順序排列的路徑"""
+        inputs = []
+        with tarfile.open(fileobj=self._request_body(), mode="r|*") as tar:
+            for member in tar:
+                if not member.isfile():
+                    continue
+                # 只保留文件名並加上序號，防止路徑穿越和重名
+                name = f"{len(inputs):05d}_{os.path.basename(member.name)}"
+                path = os.path.join(work_dir, name)
+                with tar.extractfile(member) as src, open(path, "wb") as dst:
+                    shutil.copyfileobj(src, dst, CHUNK_SIZE)
+                inputs.append(path)
+        return inputs
+
+    def _handle_merge(self, format_name):
+        try:
+            work_dir = tempfile.mkdtemp(prefix="merge_", dir=self.server.work_root)
+        except OSError as e:
+            logger.error(f"無法創建臨時目錄: {e}")
+            self.close_connection = True
+            self._send_json(_storage_error_status(e), {"error": f"無法創建臨時目錄: {e}"})
+            return
+        try:
+            try:
+                inputs = self._receive_inputs(work_dir)
+            except (tarfile.TarError, ValueError, ConnectionError) as e:
+                self.close_connection = True
+                self._send_json(400, {"error": f"無法讀取上傳的 tar 包: {e}"})
+                return
+            except OSError as e:
+                # 磁盤已滿或沒有寫入權限；請求體沒有讀完，連接不能再復用
+                logger.error(f"無法保存上傳的文件: {e}")
+                self.close_connection = True
+                self._send_json(_storage_error_status(e), {"error": f"無法保存上傳的文件: {e}"})
+                return
+            if not inputs:
+                self._send_json(400, {"error": "tar 包中沒有文件"})
+                return
+
+            output_file = os.path.join(work_dir, "merged" + OUTPUT_EXTENSIONS[format_name])
+            messages = []
+            future = self.server.executor.submit(
+                merge_inputs, format_name, inputs, output_file, messages.append
+            )
+            try:
+                success = future.result()
+            except Exception as e:
+                logger.error(f"合併失敗: {e}")
+                self._send_json(500, {"error": str(e), "messages": messages})
+                return
+            if not success or not os.path.exists(output_file):
+                self._send_json(500, {"error": "合併失敗", "messages": messages})
+                return
+
+            self._send_file(output_file, OUTPUT_TYPES[format_name])
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def _send_file(self, path, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        with open(path, "rb") as fh:
+            while True:
+                data = fh.read(CHUNK_SIZE)
+                if not data:
+                    break
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class MergeServer(socketserver.ThreadingMixIn, HTTPServer):
+    """本地合併服務
+
+    workers 為同時執行合併的線程數；max_queue 為在此之外最多排隊的請求數，
+    超出時直接返回 503，避免上傳堆積佔滿磁盤和內存。
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, workers=1, max_queue=8, work_root=None):
+        super().__init__(address, MergeRequestHandler)
+        self.workers = max(workers, 1)
+        self.capacity = self.workers + max(max_queue, 0)
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="merge")
+        self.work_root = work_root or tempfile.gettempdir()
+
+    def try_acquire(self):
+        """為一個請求佔用名額，已達上限時返回 False"""
+        with self._lock:
+            if self.in_flight >= self.capacity:
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def status(self):
+        with self._lock:
+            in_flight = self.in_flight
+        return {"workers": self.workers, "capacity": self.capacity, "in_flight": in_flight}
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=True)
+
+
+def serve(host="127.0.0.1", port=8765, workers=1, max_queue=8, status_callback=None):
+    """啟動本地合併服務，直到按 Ctrl+C 為止"""
+    server = MergeServer((host, port), workers=workers, max_queue=max_queue)
+    notify(
+        f"合併服務已啟動: http://{host}:{server.server_address[1]}/merge "
+        f"({server.workers} 個工作線程, 最多 {server.capacity} 個請求)",
+        status_callback,
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        notify("合併服務已停止", status_callback)
+
+
+def submit_merge(url, input_files, output_file, format_name="pdf", timeout=600):
+    """本地客戶端：把文件打包成 tar 流式上傳到合併服務，並把結果保存到 output_file"""
+    import http.client
+
+    parsed = urlparse(url)
+    connection = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=timeout)
+
+    # 先把 tar 包寫入臨時文件，再以分塊方式上傳，不在內存中拼接整個請求體
+    with tempfile.TemporaryFile() as body:
+        with tarfile.open(fileobj=body, mode="w|") as tar:
+            for path in input_files:
+                tar.add(path, arcname=os.path.basename(path))
+        body.seek(0)
+
+        def chunks():
+            while True:
+                data = body.read(CHUNK_SIZE)
+                if not data:
+                    break
+                yield data
+
+        try:
+            connection.request(
+                "POST", f"/merge?format={format_name}", body=chunks(),
+                headers={"Content-Type": "application/x-tar"}, encode_chunked=True,
+            )
+        except (BrokenPipeError, ConnectionResetError):
+            # 服務端隊列已滿時會在接收請求體之前返回 503 並關閉連接
+            pass
+        response = connection.getresponse()
+
+    try:
+        if response.status != 200:
+            raise RuntimeError(f"合併服務返回 {response.status}: {response.read().decode('utf-8', 'replace')}")
+        with open(output_file, "wb") as fh:
+            shutil.copyfileobj(response, fh, CHUNK_SIZE)
+    finally:
+        connection.close()
+    return output_file
@@ -0,0 +1,359 @@
+import os
+import json
+import hashlib
+import logging
+from datetime import datetime
+
+from merge_utils import (
+    notify, check_cancelled, ensure_parent_dir, ordered_parallel_map, remove_partial_output,
+    split_input_spec, select_pages, format_pages,
+)
+
+# 分片清單的格式變化時遞增，舊清單中的分片不再被視為已完成
+SHARDS_VERSION = 1
+
+
+class ShardConfig:
+    """分片輸出的上限，至少指定一項
+
+    max_pages   每個分片最多包含的頁數（幻燈片數）
+    max_bytes   每個分片的預計大小上限，按選中頁數折算輸入文件大小估計
+
+    能放進一個分片的輸入文件不會被拆分到兩個分片中；單個文件就超過上限時按頁拆分為
+    多個範圍（如 report.pdf:1-500、report.pdf:501-1000），每段單獨成為一個分片。
+    頁數未知的文件無法拆分，仍然單獨成為一個分片。
+    """
+
+    def __init__(self, max_pages=None, max_bytes=None):
+        if max_pages is None and max_bytes is None:
+            raise ValueError("分片輸出需要指定最大頁數或最大大小")
+        if max_pages is not None and max_pages < 1:
+            raise ValueError("每個分片的最大頁數至少為 1")
+        if max_bytes is not None and max_bytes <= 0:
+            raise ValueError("每個分片的最大大小必須大於 0")
+        self.max_pages = max_pages
+        self.max_bytes = max_bytes
+
+    def __repr__(self):
+        return f"ShardConfig(max_pages={self.max_pages}, max_bytes={self.max_bytes})"
+
+
+def shard_path(output_file, number):
+    """第 number 個分片（從 1 開始）的文件名，如 output_part001.pdf"""
+    root, extension = os.path.splitext(output_file)
+    return f"{root}_part{number:03d}{extension}"
+
+
+def manifest_path(output_file):
+    """分片清單的文件名，如 output_shards.json"""
+    return os.path.splitext(output_file)[0] + "_shards.json"
+
+
+def _estimate(spec, entry):
+    """返回 (選中的頁數, 預計字節數)，無法讀取的文件兩者都為 0"""
+    if entry is None or entry["error"]:
+        return 0, 0
+    if entry["pages"] is None:
+        return 0, entry["size"]
+    try:
+        pages = len(select_pages(split_input_spec(spec)[1], entry["pages"]))
+    except ValueError:
+        return 0, 0
+    return pages, entry["size"] * pages // entry["pages"] if entry["pages"] else entry["size"]
+
+
+def _split_oversized(spec, entry, config):
+    """單個文件超過分片上限時按頁拆分，返回 [(範圍輸入, 頁數, 預計字節數), ...]；不需要拆分時返回 None"""
+    file_pages, file_bytes = _estimate(spec, entry)
+    if file_pages < 2:
+        return None
+    limit = file_pages
+    if config.max_pages is not None:
+        limit = min(limit, config.max_pages)
+    if config.max_bytes is not None and entry["size"]:
+        # 與 _estimate 相同按頁數折算，每段至少一頁
+        limit = min(limit, max(1, config.max_bytes * entry["pages"] // entry["size"]))
+    if limit >= file_pages:
+        return None
+    path, ranges = split_input_spec(spec)
+    indices = select_pages(ranges, entry["pages"])
+    parts = []
+    for start in range(0, len(indices), limit):
+        chunk = indices[start:start + limit]
+        parts.append((f"{path}:{format_pages(chunk)}", len(chunk), entry["size"] * len(chunk) // entry["pages"]))
+    return parts
+
+
+def plan_shards(files, entries, config):
+    """按輸入順序把文件分組，返回 [[(輸入, 頁數, 預計字節數), ...], ...]
+
+    超過上限的單個文件先拆分為多個範圍輸入，返回的輸入可能與 files 中的不同。
+    """
+    shards = []
+    current = []
+    pages = size = 0
+    for spec, entry in zip(files, entries):
+        parts = _split_oversized(spec, entry, config)
+        if parts is not None:
+            if current:
+                shards.append(current)
+            # 最後一段可能沒有填滿，之後的文件可以繼續放進這個分片
+            shards.extend([part] for part in parts[:-1])
+            current = [parts[-1]]
+            pages, size = parts[-1][1:]
+            continue
+        file_pages, file_bytes = _estimate(spec, entry)
+        over_pages = config.max_pages is not None and pages + file_pages > config.max_pages
+        over_bytes = config.max_bytes is not None and size + file_bytes > config.max_bytes
+        if current and (over_pages or over_bytes):
+            shards.append(current)
+            current = []
+            pages = size = 0
+        current.append((spec, file_pages, file_bytes))
+        pages += file_pages
+        size += file_bytes
+    if current:
+        shards.append(current)
+    return shards
+
+
+def _fingerprint(format_name, items, entries_by_path, options):
+    """分片內容的指紋：輸入、輸入內容哈希和合併選項都相同時分片不需要重新生成"""
+    digest = hashlib.sha256()
+    digest.update(format_name.encode("utf-8"))
+    for spec, _, _ in items:
+        entry = entries_by_path.get(split_input_spec(spec)[0])
+        digest.update(f"\0{spec}\0{entry['sha256'] if entry else ''}".encode("utf-8"))
+    digest.update(repr(sorted(options.items())).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _load_manifest(path):
+    try:
+        with open(path, "r", encoding="utf-8") as fh:
+            data = json.load(fh)
+        if data.get("version") == SHARDS_VERSION:
+            return data
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _write_manifest(path, manifest):
+    from merge_cache import _atomic_write
+
+    manifest["updated_at"] = datetime.now().isoformat(timespec="seconds")
+    _atomic_write(path, json.dumps(manifest, ensure_ascii=False, indent=1).encode("utf-8"))
+
+
+def _is_complete(shard, previous):
+    """上次運行中已完成且內容未變的分片"""
+    if previous is None or previous.get("status") != "done":
+        return False
+    if previous.get("fingerprint") != shard["fingerprint"]:
+        return False
+    try:
+        return os.path.getsize(shard["path"]) == previous.get("bytes")
+    except OSError:
+        return False
+
+
+def merge_shard(job):
+    """工作進程入口：合併一個分片，返回 (是否成功, 消息列表, 追蹤區間, 計數器)
+
+    job 中帶有 status_callback 時（在當前進程中合併）消息直接發送給它，不再收集。
+    先寫入臨時文件，成功後才替換為分片文件，中斷時不會留下看似完整的分片。
+    """
+    from merge_backends import run_merge
+    from merge_trace import MergeTrace
+
+    trace = MergeTrace(os.path.basename(job["output"]))
+    messages = []
+    root, extension = os.path.splitext(job["output"])
+    partial_file = f"{root}.partial{extension}"
+    status_callback = job.get("status_callback") or messages.append
+
+    def report(message):
+        # 合併結果（如「已成功合併所有 PDF 文件到: ...」）顯示分片的最終文件名，而不是臨時文件
+        if message.endswith(partial_file):
+            message = message[:-len(partial_file)] + job["output"]
+        status_callback(message)
+
+    try:
+        success = run_merge(
+            job["format"], job["inputs"], partial_file, report,
+            jobs=job.get("jobs", 1), cache=job.get("cache"), cancel_event=job.get("cancel_event"),
+            trace=trace, **job["options"]
+        )
+        if success:
+            os.replace(partial_file, job["output"])
+    finally:
+        remove_partial_output(partial_file)
+    return success, messages, trace.export_spans(), dict(trace.counters)
+
+
+def run_sharded_merge(format_name, files, output_file, config, status_callback=None, jobs=1,
+                      cache=None, cancel_event=None, trace=None, index=None, isolation=None,
+                      **options):
+    """把合併結果按頁數或大小分成多個文件，返回是否全部分片都已生成
+
+    先用 docs_index.DocsIndex 讀取各輸入的頁數和大小並按 config 規劃分片，再逐個合併；
+    jobs 大於 1 且後端允許時多個分片在進程池中同時寫出（此時各分片不使用緩存）。
+    每完成一個分片就更新 output_shards.json 清單，其中記錄每個分片包含的輸入及其起始頁；
+    再次運行時輸入和選項都沒有變化的已完成分片直接跳過，中斷後從未完成的分片繼續。
+    options 為 run_merge 的其他選項（如 compress_level、linearize），對每個分片生效。
+    """
+    from docs_index import DocsIndex
+    from merge_backends import FORMAT_LABELS, get_backend, select_backend
+
+    label = FORMAT_LABELS[format_name]
+    if not files:
+        notify(f"docs 文件夾中沒有找到 {label} 文件", status_callback, logging.WARNING)
+        return False
+
+    if isolation is not None:
+        # 分片之前統一檢查，同一個文件不會在多個分片進程中同時被隔離
+        from merge_isolation import isolate_inputs
+        files, report = isolate_inputs(
+            format_name, files, isolation, jobs, cache, status_callback, cancel_event, trace
+        )
+        for line in report.summary_lines():
+            notify(line, status_callback)
+        if not files:
+            notify("沒有可以合併的文件", status_callback, logging.WARNING)
+            return False
+
+    if index is None:
+        index = DocsIndex(os.path.dirname(os.path.abspath(split_input_spec(files[0])[0])))
+    entries = index.refresh(files, jobs, status_callback, cancel_event, trace)
+    index.save()
+    # 拆分後的範圍輸入按文件路徑查找內容哈希
+    entries_by_path = {split_input_spec(spec)[0]: entry for spec, entry in zip(files, entries)}
+
+    # 分片清單中保存相對於清單文件的路徑
+    ensure_parent_dir(output_file)
+    manifest_file = manifest_path(output_file)
+    base_dir = os.path.dirname(os.path.abspath(manifest_file))
+    shards = []
+    for number, items in enumerate(plan_shards(files, entries, config), 1):
+        path = shard_path(output_file, number)
+        contents = []
+        first_page = 1
+        for spec, pages, size in items:
+            contents.append({"input": spec, "first_page": first_page, "pages": pages})
+            first_page += pages
+        shards.append({
+            "file": os.path.relpath(os.path.abspath(path), base_dir),
+            "path": path,
+            "inputs": contents,
+            "pages": first_page - 1,
+            "estimated_bytes": sum(size for _, _, size in items),
+            "fingerprint": _fingerprint(format_name, items, entries_by_path, options),
+            "status": "pending",
+        })
+
+    previous = _load_manifest(manifest_file) or {"shards": []}
+    previous_by_file = {shard["file"]: shard for shard in previous["shards"]}
+    pending = []
+    for shard in shards:
+        old = previous_by_file.pop(shard["file"], None)
+        if _is_complete(shard, old):
+            shard["status"] = "done"
+            shard["bytes"] = old["bytes"]
+        else:
+            pending.append(shard)
+    # 上次運行中多出來的分片已不在新的規劃中
+    for old in previous_by_file.values():
+        remove_partial_output(os.path.join(base_dir, old["file"]))
+
+    manifest = {
+        "version": SHARDS_VERSION,
+        "format": format_name,
+        "output": os.path.relpath(os.path.abspath(output_file), base_dir),
+        "max_pages": config.max_pages,
+        "max_bytes": config.max_bytes,
+        "shards": [{key: value for key, value in shard.items() if key != "path"} for shard in shards],
+    }
+    _write_manifest(manifest_file, manifest)
+
+    skipped = len(shards) - len(pending)
+    notify(
+        f"分片輸出: 共 {len(shards)} 個分片" + (f"，{skipped} 個已完成，跳過" if skipped else ""),
+        status_callback,
+    )
+
+    if options.get("backend"):
+        backend = get_backend(options["backend"], format_name)
+    else:
+        backend = select_backend(format_name, files, jobs=jobs)
+    concurrent = jobs > 1 and len(pending) > 1 and backend is not None and not backend.single_instance
+    jobs_list = []
+    for shard in pending:
+        inputs = [item["input"] for item in shard["inputs"]]
+        job = {"format": format_name, "inputs": inputs, "output": shard["path"], "options": options}
+        if not concurrent:
+            # 在當前進程中逐個合併時，每個分片可以使用全部工作進程、緩存和取消，消息直接顯示
+            job.update(
+                jobs=jobs, cache=cache, cancel_event=cancel_event,
+                status_callback=_prefixed(status_callback, shards.index(shard) + 1),
+            )
+        jobs_list.append(job)
+
+    if concurrent:
+        notify(f"使用 {min(jobs, len(pending))} 個工作進程同時寫出 {len(pending)} 個分片", status_callback)
+        results = ordered_parallel_map(merge_shard, jobs_list, min(jobs, len(pending)))
+    else:
+        results = ((job, *_run_inline(job)) for job in jobs_list)
+
+    failed = 0
+    try:
+        for shard, (job, result, error) in zip(pending, results):
+            check_cancelled(cancel_event)
+            number = shards.index(shard) + 1
+            if error is None:
+                success, messages, spans, counters = result
+                if trace is not None:
+                    trace.merge_spans(spans)
+                    for name, value in counters.items():
+                        trace.count(name, value)
+                for message in messages:
+                    notify(f"[分片 {number}] {message}", status_callback)
+            else:
+                success = False
+                notify(f"[分片 {number}] 合併時出錯: {error}", status_callback, logging.ERROR)
+            entry = manifest["shards"][number - 1]
+            if success:
+                entry["status"] = "done"
+                entry["bytes"] = os.path.getsize(shard["path"])
+                notify(f"已完成分片 {number}/{len(shards)}: {shard['path']}", status_callback)
+            else:
+                entry["status"] = "failed"
+                failed += 1
+            _write_manifest(manifest_file, manifest)
+    finally:
+        if concurrent:
+            results.close()
+
+    notify(
+        f"分片輸出完成: {len(shards) - failed}/{len(shards)} 個分片，清單已寫入: {manifest_file}",
+        status_callback, logging.ERROR if failed else logging.INFO,
+    )
+    return failed == 0
+
+
+def _prefixed(status_callback, number):
+    if status_callback is None:
+        return None
+    return lambda message: status_callback(f"[分片 {number}] {message}")
+
+
+def _run_inline(job):
+    """在當前進程中合併一個分片，返回與 ordered_parallel_map 相同的 (結果, 錯誤)"""
+    from merge_utils import MergeCancelled
+
+    try:
+        return merge_shard(job), None
+    except MergeCancelled:
+        raise
+    except Exception as e:
+        return None, e
@@ -0,0 +1,192 @@
+import os
+import json
+import time
+import logging
+import threading
+import unicodedata
+from contextlib import contextmanager
+from datetime import datetime
+
+from merge_utils import notify
+
+logger = logging.getLogger('格式選擇器')
+
+# 摘要表中各階段的顯示順序，未列出的階段排在後面
+STAGE_ORDER = [
+    "discover", "index", "cache", "isolate", "convert", "read", "open", "parse", "wait", "copy",
+    "checkpoint", "write", "optimize", "linearize", "save",
+]
+# 名稱保持在四個漢字以內，摘要表才能完整顯示在界面的狀態欄中
+STAGE_NAMES = {
+    "discover": "查找文件",
+    "index": "文件索引",
+    "cache": "緩存查詢",
+    "isolate": "隔離檢查",
+    "convert": "轉換文稿",
+    "read": "預讀文件",
+    "open": "打開解析",
+    "parse": "後台解析",
+    "wait": "等待後台",
+    "copy": "複製內容",
+    "checkpoint": "寫檢查點",
+    "write": "寫出",
+    "optimize": "圖片優化",
+    "linearize": "線性化",
+    "save": "保存",
+    "file": "單個文件",
+}
+
+
+def _ljust(text, width):
+    """按顯示寬度左對齊，中文字符佔兩列"""
+    used = sum(2 if unicodedata.east_asian_width(char) in "WF" else 1 for char in text)
+    return text + " " * max(width - used, 0)
+
+
+class MergeTrace:
+    """記錄一次合併中各階段的耗時區間和計數器
+
+    區間按 Chrome trace event 格式保存，write_json 寫出的文件可以直接在
+    chrome://tracing 或 Perfetto 中查看；summary_lines 返回按階段匯總的表格。
+    工作進程中記錄的區間通過 export_spans/merge_spans 併入主進程的記錄。
+    """
+
+    def __init__(self, name="merge"):
+        self.name = name
+        self.started_at = datetime.now().isoformat(timespec="seconds")
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+        self.spans = []
+        self.counters = {}
+
+    @contextmanager
+    def span(self, stage, **attrs):
+        """記錄一個階段的耗時，attrs 會寫入區間的 args，可在區間內繼續補充"""
+        wall = time.time()
+        start = time.perf_counter()
+        try:
+            yield attrs
+        finally:
+            self.add_span(stage, wall, time.perf_counter() - start, attrs)
+
+    def add_span(self, stage, wall, seconds, attrs=None, pid=None):
+        span = (stage, wall, seconds, attrs or {}, pid or os.getpid(), threading.get_ident())
+        with self._lock:
+            self.spans.append(span)
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def export_spans(self):
+        """返回可以跨進程傳遞的區間列表"""
+        with self._lock:
+            return list(self.spans)
+
+    def merge_spans(self, spans):
+        with self._lock:
+            self.spans.extend(spans)
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self._started
+
+    def stage_totals(self):
+        """按階段匯總，返回 {階段: (次數, 總秒數, 最長秒數)}"""
+        totals = {}
+        for stage, _, seconds, _, _, _ in self.export_spans():
+            calls, total, longest = totals.get(stage, (0, 0.0, 0.0))
+            totals[stage] = (calls + 1, total + seconds, max(longest, seconds))
+        return totals
+
+    def summary_lines(self, slowest=3):
+        """返回各階段耗時的摘要表，以及計數器和最慢的幾個文件"""
+        elapsed = self.elapsed
+        totals = self.stage_totals()
+        stages = [stage for stage in STAGE_ORDER if stage in totals]
+        stages += sorted(stage for stage in totals if stage not in STAGE_ORDER and stage != "file")
+
+        lines = [f"耗時統計（共 {elapsed:.2f} 秒）:"]
+        lines.append(f"  {_ljust('階段', 10)}{'次數':>2}{'總計ms':>6}{'最長ms':>6}{'佔比':>3}")
+        for stage in stages:
+            calls, total, longest = totals[stage]
+            share = total / elapsed * 100 if elapsed > 0 else 0.0
+            lines.append(
+                f"  {_ljust(STAGE_NAMES.get(stage, stage), 10)}{calls:>4}{total * 1000:>8.1f}"
+                f"{longest * 1000:>8.1f}{share:>4.0f}%"
+            )
+        if self.counters:
+            lines.append("  " + ", ".join(f"{name}={value}" for name, value in sorted(self.counters.items())))
+
+        files = [span for span in self.export_spans() if span[0] == "file"]
+        files.sort(key=lambda span: span[2], reverse=True)
+        for _, _, seconds, attrs, _, _ in files[:slowest]:
+            lines.append(f"  最慢: {attrs.get('file')} {seconds * 1000:.1f} ms")
+        return lines
+
+    def report(self, status_callback=None):
+        """把摘要表發送到狀態回調和日誌"""
+        for line in self.summary_lines():
+            notify(line, status_callback)
+
+    def to_dict(self):
+        events = []
+        for stage, wall, seconds, attrs, pid, tid in self.export_spans():
+            events.append({
+                "name": attrs.get("file", stage) if stage == "file" else stage,
+                "cat": stage,
+                "ph": "X",
+                "ts": round(wall * 1e6),
+                "dur": round(seconds * 1e6),
+                "pid": pid,
+                "tid": tid,
+                "args": attrs,
+            })
+        events.sort(key=lambda event: event["ts"])
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {
+                "name": self.name,
+                "started_at": self.started_at,
+                "total_seconds": round(self.elapsed, 6),
+                "counters": dict(self.counters),
+                "stages": {
+                    stage: {"calls": calls, "seconds": round(total, 6), "max_seconds": round(longest, 6)}
+                    for stage, (calls, total, longest) in self.stage_totals().items()
+                },
+            },
+        }
+
+    def write_json(self, path):
+        """寫出 JSON 追蹤文件"""
+        output_dir = os.path.dirname(path)
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump(self.to_dict(), fh, ensure_ascii=False, indent=1)
+        return path
+
+
+@contextmanager
+def profiled(output_file=None, status_callback=None, limit=20):
+    """用 cProfile 分析代碼塊，可選把原始數據寫入 output_file（可用 snakeviz 等查看）
+
+    只分析調用所在的線程；並行模式下工作進程中的解析不在分析範圍內。
+    """
+    import io
+    import cProfile
+    import pstats
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        if output_file:
+            profiler.dump_stats(output_file)
+            notify(f"性能分析數據已寫入: {output_file}", status_callback)
+        text = io.StringIO()
+        pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(limit)
+        logger.info(f"性能分析（按累計時間前 {limit} 項）:\n{text.getvalue()}")
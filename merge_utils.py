@@ -0,0 +1,352 @@
+import os
+import re
+import sys
+import logging
+from collections import deque
+
+logger = logging.getLogger('格式選擇器')
+# 沒有配置日誌時不使用 logging 的默認輸出（否則警告和錯誤會在回調之外再打印一次）
+logger.addHandler(logging.NullHandler())
+
+
+def notify(message, status_callback=None, level=logging.INFO):
+    """同時將消息發送到狀態回調和日誌
+
+    已由狀態回調顯示的消息在日誌記錄中標記為 shown，控制台輸出可以據此跳過。
+    """
+    if status_callback:
+        status_callback(message)
+    logger.log(level, message, extra={"shown": bool(status_callback)})
+
+
+class MergeCancelled(Exception):
+    """用戶取消了正在進行的合併"""
+
+
+def check_cancelled(cancel_event):
+    """cancel_event 已被設置時拋出 MergeCancelled"""
+    if cancel_event is not None and cancel_event.is_set():
+        raise MergeCancelled("合併已取消")
+
+
+def remove_partial_output(output_file):
+    """刪除取消或失敗後留下的不完整輸出文件"""
+    try:
+        if os.path.exists(output_file):
+            os.remove(output_file)
+    except OSError as e:
+        logger.warning(f"無法刪除不完整的輸出文件 {output_file}: {e}")
+
+
+# 範圍文本，例如 "1-5,9" 或 "3-"（到最後一頁）
+_RANGES_RE = re.compile(r"^\d+(-\d*)?(,\d+(-\d*)?)*$")
+
+
+def split_input_spec(spec):
+    """把 "report.pdf:1-5,9" 拆分為 (路徑, 範圍文本)，沒有指定範圍時範圍為 None
+
+    只有最後一個冒號之後是合法的範圍時才拆分，Windows 盤符中的冒號不受影響。
+    """
+    path, sep, ranges = spec.rpartition(":")
+    ranges = ranges.replace(" ", "")
+    if sep and path and _RANGES_RE.match(ranges):
+        return path, ranges
+    return spec, None
+
+
+def select_pages(ranges, count):
+    """把範圍文本解析為從 0 開始的頁碼（或幻燈片序號）列表
+
+    按書寫順序排列，倒序範圍（如 "9-5"）按倒序選取，重複的頁只保留第一次。
+    """
+    if ranges is None:
+        return list(range(count))
+    selected = []
+    seen = set()
+    for item in ranges.split(","):
+        start, dash, end = item.partition("-")
+        first = int(start)
+        last = (int(end) if end else count) if dash else first
+        for number in (first, last):
+            if number < 1 or number > count:
+                raise ValueError(f"頁碼 {number} 超出範圍（共 {count} 頁）")
+        step = 1 if last >= first else -1
+        for number in range(first, last + step, step):
+            if number not in seen:
+                seen.add(number)
+                selected.append(number - 1)
+    return selected
+
+
+def format_pages(indices):
+    """select_pages 的逆操作：把從 0 開始的頁碼列表寫成範圍文本，如 [0, 1, 2, 8] -> "1-3,9"
+
+    保持列表中的順序，只有連續遞增的頁碼合併為一個範圍。
+    """
+    parts = []
+    start = end = None
+    for index in indices:
+        if start is not None and index == end + 1:
+            end = index
+            continue
+        if start is not None:
+            parts.append(f"{start + 1}-{end + 1}" if end > start else str(start + 1))
+        start = end = index
+    if start is not None:
+        parts.append(f"{start + 1}-{end + 1}" if end > start else str(start + 1))
+    return ",".join(parts)
+
+
+def apply_range_specs(files, text):
+    """按文件名為輸入文件附加範圍，text 形如 "report.pdf:1-5,9; deck.pptx:3-12"
+
+    未在 text 中出現的文件保持完整合併。
+    """
+    ranges_by_name = {}
+    for entry in re.split(r"[;\n]", text or ""):
+        entry = entry.strip()
+        if not entry:
+            continue
+        name, ranges = split_input_spec(entry)
+        if ranges is None:
+            raise ValueError(f"無法解析範圍: {entry}")
+        ranges_by_name[os.path.basename(name).lower()] = ranges
+    return [
+        f"{path}:{ranges_by_name[os.path.basename(path).lower()]}"
+        if os.path.basename(path).lower() in ranges_by_name else path
+        for path in files
+    ]
+
+
+def ensure_parent_dir(output_file):
+    """確保輸出文件所在的目錄存在"""
+    output_dir = os.path.dirname(output_file)
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+
+def peak_rss_mb():
+    """返回當前進程的內存峰值（MB），無法獲取時返回 None"""
+    if sys.platform == "win32":
+        try:
+            import ctypes
+            from ctypes import wintypes
+
+            class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+                _fields_ = [
+                    ("cb", wintypes.DWORD),
+                    ("PageFaultCount", wintypes.DWORD),
+                    ("PeakWorkingSetSize", ctypes.c_size_t),
+                    ("WorkingSetSize", ctypes.c_size_t),
+                    ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                    ("PagefileUsage", ctypes.c_size_t),
+                    ("PeakPagefileUsage", ctypes.c_size_t),
+                ]
+
+            counters = PROCESS_MEMORY_COUNTERS()
+            counters.cb = ctypes.sizeof(counters)
+            handle = ctypes.windll.kernel32.GetCurrentProcess()
+            if ctypes.windll.psapi.GetProcessMemoryInfo(
+                handle, ctypes.byref(counters), counters.cb
+            ):
+                return counters.PeakWorkingSetSize / (1024 * 1024)
+        except Exception:
+            return None
+        return None
+
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 為單位，macOS 以字節為單位
+    if sys.platform == "darwin":
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+def limit_process_memory(limit_bytes):
+    """限制當前進程可以使用的內存，超出後分配失敗（MemoryError），返回是否設置成功
+
+    Windows 上把進程放進帶內存上限的作業對象，其他系統限制進程的地址空間。
+    """
+    if sys.platform == "win32":
+        try:
+            import ctypes
+            from ctypes import wintypes
+
+            class JOBOBJECT_BASIC_LIMIT_INFORMATION(ctypes.Structure):
+                _fields_ = [
+                    ("PerProcessUserTimeLimit", ctypes.c_int64),
+                    ("PerJobUserTimeLimit", ctypes.c_int64),
+                    ("LimitFlags", wintypes.DWORD),
+                    ("MinimumWorkingSetSize", ctypes.c_size_t),
+                    ("MaximumWorkingSetSize", ctypes.c_size_t),
+                    ("ActiveProcessLimit", wintypes.DWORD),
+                    ("Affinity", ctypes.c_size_t),
+                    ("PriorityClass", wintypes.DWORD),
+                    ("SchedulingClass", wintypes.DWORD),
+                ]
+
+            class JOBOBJECT_EXTENDED_LIMIT_INFORMATION(ctypes.Structure):
+                _fields_ = [
+                    ("BasicLimitInformation", JOBOBJECT_BASIC_LIMIT_INFORMATION),
+                    ("IoInfo", ctypes.c_uint64 * 6),
+                    ("ProcessMemoryLimit", ctypes.c_size_t),
+                    ("JobMemoryLimit", ctypes.c_size_t),
+                    ("PeakProcessMemoryUsed", ctypes.c_size_t),
+                    ("PeakJobMemoryUsed", ctypes.c_size_t),
+                ]
+
+            kernel32 = ctypes.windll.kernel32
+            kernel32.CreateJobObjectW.restype = wintypes.HANDLE
+            kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+            job = kernel32.CreateJobObjectW(None, None)
+            if not job:
+                return False
+            info = JOBOBJECT_EXTENDED_LIMIT_INFORMATION()
+            # JOB_OBJECT_LIMIT_PROCESS_MEMORY
+            info.BasicLimitInformation.LimitFlags = 0x100
+            info.ProcessMemoryLimit = limit_bytes
+            # JobObjectExtendedLimitInformation
+            if not kernel32.SetInformationJobObject(
+                wintypes.HANDLE(job), 9, ctypes.byref(info), ctypes.sizeof(info)
+            ):
+                return False
+            return bool(kernel32.AssignProcessToJobObject(
+                wintypes.HANDLE(job), wintypes.HANDLE(kernel32.GetCurrentProcess())
+            ))
+        except Exception:
+            return False
+
+    try:
+        import resource
+    except ImportError:
+        return False
+    try:
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        if hard != resource.RLIM_INFINITY:
+            limit_bytes = min(limit_bytes, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (limit_bytes, hard))
+        return True
+    except (ValueError, OSError, AttributeError):
+        return False
+
+
+# /proc/mounts 中表示網絡文件系統的類型
+_REMOTE_FS_TYPES = {"nfs", "nfs4", "cifs", "smbfs", "smb3", "9p", "afs", "fuse.sshfs", "davfs", "fuse.rclone"}
+
+
+def is_remote_path(path):
+    """判斷路徑是否位於網絡驅動器或網絡文件系統上，無法判斷時返回 False"""
+    path = os.path.abspath(path)
+    if sys.platform == "win32":
+        drive = os.path.splitdrive(path)[0]
+        if drive.startswith("\\\\"):
+            return True
+        try:
+            import ctypes
+
+            # DRIVE_REMOTE
+            return ctypes.windll.kernel32.GetDriveTypeW(drive + "\\") == 4
+        except Exception:
+            return False
+
+    try:
+        with open("/proc/mounts", "r") as fh:
+            mounts = [line.split()[1:3] for line in fh]
+    except OSError:
+        return False
+    # 取最長的匹配掛載點
+    best, fs_type = "", None
+    for mount_point, mount_type in mounts:
+        mount_point = mount_point.replace("\\040", " ")
+        if (path == mount_point or path.startswith(mount_point.rstrip("/") + "/")) and len(mount_point) > len(best):
+            best, fs_type = mount_point, mount_type
+    return fs_type in _REMOTE_FS_TYPES
+
+
+def process_start_time(pid=None):
+    """返回進程（默認為當前進程）的啟動時間戳，無法獲取時返回 None"""
+    if sys.platform == "win32":
+        try:
+            import ctypes
+            from ctypes import wintypes
+
+            kernel32 = ctypes.windll.kernel32
+            kernel32.OpenProcess.restype = wintypes.HANDLE
+            kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+            if pid is None:
+                handle = kernel32.GetCurrentProcess()
+            else:
+                # PROCESS_QUERY_LIMITED_INFORMATION
+                handle = kernel32.OpenProcess(0x1000, False, pid)
+                if not handle:
+                    return None
+            creation, exit_time, kernel, user = (wintypes.FILETIME() for _ in range(4))
+            ok = kernel32.GetProcessTimes(
+                wintypes.HANDLE(handle), ctypes.byref(creation), ctypes.byref(exit_time),
+                ctypes.byref(kernel), ctypes.byref(user)
+            )
+            if pid is not None:
+                kernel32.CloseHandle(wintypes.HANDLE(handle))
+            if not ok:
+                return None
+            # FILETIME 是自 1601-01-01 起的 100 納秒數
+            ticks = (creation.dwHighDateTime << 32) | creation.dwLowDateTime
+            return ticks / 1e7 - 11644473600
+        except Exception:
+            return None
+
+    try:
+        import time
+
+        with open(f"/proc/{pid or 'self'}/stat", "r") as fh:
+            # 進程名可能包含空格，從最後一個右括號之後開始分割；starttime 是第 22 個字段
+            fields = fh.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime", "r") as fh:
+            uptime = float(fh.read().split()[0])
+        return time.time() - uptime + int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def ordered_parallel_map(func, items, jobs, *args):
+    """在進程池中執行 func(item, *args)，按輸入順序逐個產出 (item, result, error)
+
+    同時在途的任務數限制為工作進程數的兩倍，避免結果堆積佔用內存。
+    jobs 不大於 1 時直接在當前進程中依次執行。
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    items = list(items)
+    if not jobs or jobs <= 1:
+        for item in items:
+            try:
+                yield item, func(item, *args), None
+            except Exception as e:
+                yield item, None, e
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        pending = deque()
+        next_index = 0
+        try:
+            while next_index < len(items) or pending:
+                while next_index < len(items) and len(pending) < jobs * 2:
+                    item = items[next_index]
+                    pending.append((item, executor.submit(func, item, *args)))
+                    next_index += 1
+                item, future = pending.popleft()
+                try:
+                    yield item, future.result(), None
+                except Exception as e:
+                    yield item, None, e
+        finally:
+            # 調用方提前停止迭代（如取消合併）時，不再等待尚未開始的任務
+            for _, future in pending:
+                future.cancel()
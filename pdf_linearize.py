@@ -0,0 +1,634 @@
+import io
+import os
+import shutil
+import struct
+import hashlib
+import logging
+import tempfile
+from array import array
+from datetime import datetime
+
+from merge_utils import notify, check_cancelled, remove_partial_output
+from pdf_stream import _PdfObjectCopier, open_mapped_pdf
+
+# 這些屬性可以從頁面樹節點繼承；線性化文件要求它們直接寫在頁面上
+INHERITABLE_KEYS = ("/Resources", "/MediaBox", "/CropBox", "/Rotate")
+# 打開文檔時就需要的目錄條目，放在首頁之前
+OPEN_DOCUMENT_KEYS = ("/ViewerPreferences", "/PageMode", "/Threads", "/OpenAction", "/AcroForm")
+# 對象按使用者的分類，與 PDF 規範附錄 F 的文件分段對應
+_ROOT, _OPEN_DOCUMENT, _OUTLINES = "root", "open", "outlines"
+_FIRST_PRIVATE, _FIRST_SHARED = "first-private", "first-shared"
+_OTHER_PRIVATE, _OTHER_SHARED = "other-private", "other-shared"
+_THUMB, _OTHER = "thumb", "other"
+
+
+def _nbits(value):
+    return int(value).bit_length()
+
+
+class _BitWriter:
+    """按位寫出提示表，每組條目結束後對齊到字節邊界"""
+
+    def __init__(self):
+        self._bytes = bytearray()
+        self._value = 0
+        self._bits = 0
+
+    def write(self, value, bits):
+        if not bits:
+            return
+        self._value = (self._value << bits) | value
+        self._bits += bits
+        while self._bits >= 8:
+            self._bits -= 8
+            self._bytes.append((self._value >> self._bits) & 0xFF)
+        self._value &= (1 << self._bits) - 1
+
+    def align(self):
+        if self._bits:
+            self.write(0, 8 - self._bits)
+
+    def getvalue(self):
+        self.align()
+        return bytes(self._bytes)
+
+
+class _Renumberer(_PdfObjectCopier):
+    """按新的編號序列化對象；不在映射中的引用寫成 null"""
+
+    def serialize(self, num, obj, ref_map):
+        buf = io.BytesIO()
+        buf.write(b"%d 0 obj\n" % num)
+        self._serialize(obj, ref_map, buf)
+        buf.write(b"\nendobj\n")
+        return buf.getvalue()
+
+
+class _DocumentGraph:
+    """讀取PDF的頁面樹和對象引用關係，按使用者對全部可達對象分類
+
+    分類方式與 qpdf 檢查線性化文件時的計算一致：只被首頁使用的對象、被首頁和其他頁面共用的對象、
+    只被某一其他頁面使用的對象、被多個其他頁面共用的對象，以及文檔級對象。
+    頁面之間的引用（如鏈接目標）不跨越頁面邊界，頁面的 /Parent 不向上追溯。
+    """
+
+    def __init__(self, reader):
+        from PyPDF2.generic import DictionaryObject, IndirectObject
+
+        self.reader = reader
+        self._DictionaryObject = DictionaryObject
+        self._IndirectObject = IndirectObject
+        self.trailer = reader.trailer
+        self.root = self._key(self.trailer.raw_get("/Root"))
+        self.pages = []
+        self.nodes = set()
+        self._page_inherited = {}
+        self._edges = {}
+        self._walk_page_tree()
+        self.page_set = set(self.pages)
+
+    @staticmethod
+    def _key(ref):
+        return (ref.idnum, ref.generation)
+
+    def get(self, key):
+        return self.reader.get_object(self._IndirectObject(key[0], key[1], self.reader))
+
+    def _walk_page_tree(self):
+        catalog = self.get(self.root)
+        pages_ref = catalog.raw_get("/Pages")
+        stack = [(pages_ref, {})]
+        seen = set()
+        while stack:
+            ref, inherited = stack.pop()
+            if not isinstance(ref, self._IndirectObject):
+                raise ValueError("頁面樹節點必須是間接對象")
+            key = self._key(ref)
+            if key in seen:
+                raise ValueError("頁面樹中有循環引用")
+            seen.add(key)
+            node = self.get(key)
+            if "/Kids" in node:
+                self.nodes.add(key)
+                inherited = dict(inherited)
+                for name, value in node.items():
+                    if name in INHERITABLE_KEYS:
+                        inherited[name] = value
+                # 保持原順序，後壓入的先處理
+                for kid in reversed(node.raw_get("/Kids").get_object()):
+                    stack.append((kid, inherited))
+            else:
+                self.pages.append(key)
+                self._page_inherited[key] = inherited
+
+    def output_object(self, key):
+        """返回要寫出的對象：頁面補上繼承的屬性，頁面樹節點去掉可繼承的屬性"""
+        obj = self.get(key)
+        if key in self._page_inherited:
+            missing = {
+                name: value for name, value in self._page_inherited[key].items() if name not in obj
+            }
+            if missing:
+                obj = self._DictionaryObject(obj)
+                obj.update(missing)
+        elif key in self.nodes and any(name in obj for name in INHERITABLE_KEYS):
+            obj = self._DictionaryObject(
+                (name, value) for name, value in obj.items() if name not in INHERITABLE_KEYS
+            )
+        return obj
+
+    def _collect_refs(self, value, top_page=False):
+        """返回 (引用, 縮略圖引用)；頁面的 /Parent 不計入，/Thumb 單獨返回"""
+        from PyPDF2.generic import ArrayObject, StreamObject
+
+        refs = []
+        thumbs = []
+        pending = [(value, top_page)]
+        while pending:
+            item, at_page = pending.pop()
+            if isinstance(item, self._IndirectObject):
+                refs.append(self._key(item))
+            elif isinstance(item, self._DictionaryObject):
+                is_stream = isinstance(item, StreamObject)
+                for name, child in item.items():
+                    if at_page and name == "/Parent":
+                        continue
+                    if at_page and name == "/Thumb":
+                        thumbs.extend(
+                            self._key(ref) for ref in [child] if isinstance(ref, self._IndirectObject)
+                        )
+                        continue
+                    # 寫出時 /Length 改為直接值，原來的長度對象不再需要
+                    if is_stream and name == "/Length":
+                        continue
+                    pending.append((child, False))
+            elif isinstance(item, ArrayObject):
+                pending.extend((child, False) for child in item)
+        return refs, thumbs
+
+    def edges(self, key):
+        """返回 (是否頁面字典, 引用, 縮略圖引用)，結果緩存，讀取後清空讀取器的對象緩存"""
+        edges = self._edges.get(key)
+        if edges is None:
+            obj = self.output_object(key)
+            is_page = key in self.page_set or (
+                isinstance(obj, self._DictionaryObject) and obj.get("/Type") == "/Page"
+            )
+            refs, thumbs = self._collect_refs(obj, top_page=is_page)
+            edges = (is_page, tuple(refs), tuple(thumbs))
+            self._edges[key] = edges
+            # 只保留引用關係，不在內存中保留對象內容
+            if len(self.reader.resolved_objects) > 4096:
+                self.reader.resolved_objects.clear()
+        return edges
+
+    def _visit(self, users, user, start_refs, top=None):
+        visited = set()
+        stack = [(ref, user) for ref in start_refs]
+        if top is not None:
+            stack.append((top, user))
+        while stack:
+            key, owner = stack.pop()
+            if key in visited:
+                continue
+            is_page, refs, thumbs = self.edges(key)
+            if is_page and key != top:
+                continue
+            visited.add(key)
+            users.setdefault(key, set()).add(owner)
+            stack.extend((ref, owner) for ref in refs)
+            if key == top:
+                stack.extend((ref, (_THUMB, owner[1])) for ref in thumbs)
+
+    def classify(self):
+        """返回 (各對象的使用者, 各對象的分類)"""
+        users = {}
+        for pageno, page in enumerate(self.pages):
+            self._visit(users, ("page", pageno), (), top=page)
+        for name, value in self.trailer.items():
+            if name in ("/Root", "/Size", "/Prev", "/XRefStm", "/ID"):
+                continue
+            self._visit(users, ("trailer", name), self._collect_refs(self.trailer.raw_get(name))[0])
+        catalog = self.get(self.root)
+        for name in list(catalog.keys()):
+            self._visit(users, ("root_key", name), self._collect_refs(catalog.raw_get(name))[0])
+        users.setdefault(self.root, set()).add(("root",))
+
+        classes = {}
+        for key, owners in users.items():
+            in_open = in_first = in_outlines = is_root = False
+            other_pages = thumbs = others = 0
+            for owner in owners:
+                kind = owner[0]
+                if kind == "trailer":
+                    if owner[1] == "/Encrypt":
+                        in_open = True
+                    else:
+                        others += 1
+                elif kind == _THUMB:
+                    thumbs += 1
+                elif kind == "root_key":
+                    if owner[1] in OPEN_DOCUMENT_KEYS:
+                        in_open = True
+                    elif owner[1] == "/Outlines":
+                        in_outlines = True
+                    else:
+                        others += 1
+                elif kind == "page":
+                    if owner[1] == 0:
+                        in_first = True
+                    else:
+                        other_pages += 1
+                else:
+                    is_root = True
+            if is_root:
+                classes[key] = _ROOT
+            elif in_outlines:
+                classes[key] = _OUTLINES
+            elif in_open:
+                classes[key] = _OPEN_DOCUMENT
+            elif in_first and not (others or other_pages or thumbs):
+                classes[key] = _FIRST_PRIVATE
+            elif in_first:
+                classes[key] = _FIRST_SHARED
+            elif other_pages == 1 and not (others or thumbs):
+                classes[key] = _OTHER_PRIVATE
+            elif other_pages > 1:
+                classes[key] = _OTHER_SHARED
+            elif thumbs:
+                classes[key] = _THUMB
+            else:
+                classes[key] = _OTHER
+        return users, classes
+
+
+def _layout(graph, users, classes):
+    """按附錄 F 的分段返回 (part4, part6, part7, part8, part9, 各頁對象數, 書籤對象)"""
+    by_class = {}
+    for key in sorted(classes):
+        by_class.setdefault(classes[key], []).append(key)
+    catalog = graph.get(graph.root)
+    use_outlines = catalog.get("/PageMode") == "/UseOutlines"
+    # 書籤的根字典排在最前，其餘書籤對象緊隨其後，書籤提示表才能用一段連續編號描述
+    outlines = by_class.get(_OUTLINES, [])
+    outlines_ref = catalog.raw_get("/Outlines") if "/Outlines" in catalog else None
+    if isinstance(outlines_ref, graph._IndirectObject) and graph._key(outlines_ref) in outlines:
+        outlines.remove(graph._key(outlines_ref))
+        outlines.insert(0, graph._key(outlines_ref))
+    else:
+        outlines = []
+
+    first_page = graph.pages[0]
+    part4 = [graph.root] + by_class.get(_OPEN_DOCUMENT, [])
+    part6 = [first_page] + [key for key in by_class.get(_FIRST_PRIVATE, []) if key != first_page]
+    part6 += by_class.get(_FIRST_SHARED, [])
+    if use_outlines:
+        part6 += outlines
+    page_objects = [len(part6)]
+
+    # 每個其他頁面：頁面對象本身，後面緊跟只被它使用的對象
+    private = {}
+    for key in by_class.get(_OTHER_PRIVATE, []):
+        if key in graph.page_set:
+            continue
+        pageno = next(owner[1] for owner in users[key] if owner[0] == "page")
+        private.setdefault(pageno, []).append(key)
+    part7 = []
+    for pageno, page in enumerate(graph.pages[1:], 1):
+        objects = [page] + private.get(pageno, [])
+        part7 += objects
+        page_objects.append(len(objects))
+
+    part8 = by_class.get(_OTHER_SHARED, [])
+    others = by_class.get(_OTHER, [])
+    part9 = [key for key in others if key in graph.nodes]
+    part9 += [key for key in others if key not in graph.nodes]
+    part9 += by_class.get(_THUMB, [])
+    if not use_outlines:
+        part9 += outlines
+    return part4, part6, part7, part8, part9, page_objects, outlines
+
+
+def _id_entries(trailer, seed):
+    """返回寫入 trailer 的 /ID；原文件沒有 /ID 時生成一個"""
+    ids = trailer.get("/ID")
+    values = []
+    if ids is not None:
+        for item in ids.get_object():
+            value = getattr(item, "original_bytes", None)
+            if value is None:
+                value = bytes(item) if not isinstance(item, str) else item.encode("latin-1")
+            values.append(value)
+    if len(values) != 2:
+        digest = hashlib.md5(f"{seed}{datetime.now().isoformat()}".encode("utf-8")).digest()
+        values = [digest, digest]
+    return b"[<%s> <%s>]" % (values[0].hex().encode("ascii"), values[1].hex().encode("ascii"))
+
+
+def _hint_stream_data(page_lengths, page_objects, page_shared, shared_lengths, first_page_offset,
+                      first_shared_num, first_shared_offset, nshared_first_page):
+    """生成主提示流：頁面偏移提示表和共享對象提示表，返回 (數據, 共享表的偏移)"""
+    bits = _BitWriter()
+    min_objects, max_objects = min(page_objects), max(page_objects)
+    min_length, max_length = min(page_lengths), max(page_lengths)
+    max_shared = max((len(ids) for ids in page_shared), default=0)
+    max_identifier = max(len(shared_lengths) - 1, 0)
+    nbits_objects = _nbits(max_objects - min_objects)
+    nbits_length = _nbits(max_length - min_length)
+    nbits_shared = _nbits(max_shared)
+    nbits_identifier = _nbits(max_identifier)
+
+    # 頁面偏移提示表的表頭（PDF 1.7 表 F.3）；內容流的偏移和長度按 Acrobat 的做法填寫
+    for value, width in (
+        (min_objects, 32), (first_page_offset, 32), (nbits_objects, 16),
+        (min_length, 32), (nbits_length, 16), (0, 32), (0, 16),
+        (min_length, 32), (nbits_length, 16), (nbits_shared, 16),
+        (nbits_identifier, 16), (0, 16), (4, 16),
+    ):
+        bits.write(value, width)
+    # 每一項按頁面依次寫出，每項結束後對齊到字節
+    for count in page_objects:
+        bits.write(count - min_objects, nbits_objects)
+    bits.align()
+    for length in page_lengths:
+        bits.write(length - min_length, nbits_length)
+    bits.align()
+    for ids in page_shared:
+        bits.write(len(ids), nbits_shared)
+    bits.align()
+    for ids in page_shared:
+        for identifier in ids:
+            bits.write(identifier, nbits_identifier)
+    bits.align()
+    # 共享對象在頁面中的位置（分子）和內容流的偏移都佔 0 位，內容流長度與頁面長度相同
+    for length in page_lengths:
+        bits.write(length - min_length, nbits_length)
+    bits.align()
+    page_table = bits.getvalue()
+
+    # 共享對象提示表（表 F.5），每組只有一個對象
+    bits = _BitWriter()
+    min_group = min(shared_lengths)
+    nbits_group = _nbits(max(shared_lengths) - min_group)
+    for value, width in (
+        (first_shared_num, 32), (first_shared_offset, 32), (nshared_first_page, 32),
+        (len(shared_lengths), 32), (0, 16), (min_group, 32), (nbits_group, 16),
+    ):
+        bits.write(value, width)
+    for length in shared_lengths:
+        bits.write(length - min_group, nbits_group)
+    bits.align()
+    for _ in shared_lengths:
+        bits.write(0, 1)
+    bits.align()
+    return page_table + bits.getvalue(), len(page_table)
+
+
+def linearize_pdf(path, status_callback=None, cancel_event=None, trace=None):
+    """把 path 重寫為線性化（快速網頁查看）的PDF並原地替換，返回頁數
+
+    首頁及其需要的全部對象、頁面偏移和共享對象提示表寫在文件開頭，
+    閱讀器下載到首頁部分即可顯示第一頁，之後的頁面按提示表按需讀取。
+    可用 check_linearization 或 qpdf --check-linearization 驗證輸出。
+    """
+    from PyPDF2 import PdfReader
+
+    with open_mapped_pdf(path) as stream:
+        header = stream.read(16).split(b"\n", 1)[0].split(b"\r", 1)[0]
+        stream.seek(0)
+        if not header.startswith(b"%PDF-1.") or header[7:8] < b"4":
+            header = b"%PDF-1.7"
+        reader = PdfReader(stream)
+        if reader.is_encrypted:
+            raise ValueError("不支持線性化加密的PDF")
+
+        graph = _DocumentGraph(reader)
+        if not graph.pages:
+            raise ValueError("PDF 沒有頁面，無法線性化")
+        users, classes = graph.classify()
+        check_cancelled(cancel_event)
+        part4, part6, part7, part8, part9, page_objects, outlines = _layout(graph, users, classes)
+
+        # 後半部分（第 7-9 段）編號 1..n-1；前半部分依次為線性化字典、第 4 段、第 6 段和提示流
+        second_half = part7 + part8 + part9
+        n = len(second_half) + 1
+        ref_map = {key: num for num, key in enumerate(second_half, 1)}
+        for num, key in enumerate(part4 + part6, n + 1):
+            ref_map[key] = num
+        layout = _Layout(n, len(part4), len(part6), len(part7), len(part8))
+
+        # 按文件中的順序把對象寫入臨時文件，記錄每個對象的長度
+        writer = _Renumberer()
+        ordered = part4 + part6 + second_half
+        if outlines:
+            layout.outline_start = ordered.index(outlines[0])
+            layout.outline_count = len(outlines)
+        lengths = array("q")
+        with tempfile.TemporaryFile() as spool:
+            for index, key in enumerate(ordered):
+                if index % 256 == 0:
+                    check_cancelled(cancel_event)
+                    reader.resolved_objects.clear()
+                data = writer.serialize(ref_map[key], graph.output_object(key), ref_map)
+                spool.write(data)
+                lengths.append(len(data))
+
+            trailer_refs = b" /Root %d 0 R" % ref_map[graph.root]
+            info = graph.trailer.raw_get("/Info") if "/Info" in graph.trailer else None
+            if isinstance(info, graph._IndirectObject) and graph._key(info) in ref_map:
+                trailer_refs += b" /Info %d 0 R" % ref_map[graph._key(info)]
+            trailer_refs += b" /ID " + _id_entries(graph.trailer, path)
+
+            shared = part6 + part8
+            shared_index = {key: index for index, key in enumerate(shared)}
+            page_shared = [[]]
+            for pageno in range(1, len(graph.pages)):
+                owner = ("page", pageno)
+                page_shared.append(sorted(
+                    shared_index[key] for key, owners in users.items()
+                    if owner in owners and len(owners) > 1 and key in shared_index
+                ))
+            _write_linearized(
+                path, header, spool, lengths, ordered, ref_map, layout, page_objects, page_shared,
+                trailer_refs, len(graph.pages), cancel_event,
+            )
+    if trace is not None:
+        trace.count("linearized_objects", len(ordered))
+    notify(
+        f"已線性化PDF（快速網頁查看）: {len(graph.pages)} 頁，首頁部分 {len(part4) + len(part6)} 個對象",
+        status_callback,
+    )
+    return len(graph.pages)
+
+
+class _Layout:
+    """各段在按文件順序排列的對象列表中的位置，以及前半部分的對象編號"""
+
+    def __init__(self, n, part4, part6, part7, part8):
+        self.n = n
+        self.lin_num = n
+        self.hint_num = n + 1 + part4 + part6
+        self.total = self.hint_num + 1
+        self.part6_start = part4
+        self.part7_start = part4 + part6
+        self.part8_start = self.part7_start + part7
+        self.part8_count = part8
+        self.outline_start = None
+        self.outline_count = 0
+
+
+def _write_linearized(path, header, spool, lengths, ordered, ref_map, layout, page_objects,
+                      page_shared, trailer_refs, npages, cancel_event):
+    header = header + b"\n%\xe2\xe3\xcf\xd3\n"
+    n, total = layout.n, layout.total
+    first_page_num = ref_map[ordered[layout.part6_start]]
+    # 定寬數字讓字典和 trailer 的長度與填入的值無關，可以先計算布局再填值
+    lin_template = (
+        b"%d 0 obj\n<< /Linearized 1 /L %010d /H [ %010d %010d ] /O %d /E %010d /N %d /T %010d >>\n"
+        b"endobj\n"
+    )
+    lin_size = len(lin_template % (layout.lin_num, 0, 0, 0, first_page_num, 0, npages, 0))
+    first_xref_header = b"xref\n%d %d\n" % (n, total - n)
+    trailer1_template = b"trailer\n<< /Size %d%s /Prev %010d >>\nstartxref\n0\n%%%%EOF\n"
+    first_xref_pos = len(header) + lin_size
+    part4_pos = (
+        first_xref_pos + len(first_xref_header) + 20 * (total - n)
+        + len(trailer1_template % (total, trailer_refs, 0))
+    )
+
+    # 不計提示流時各對象的位置；提示表中的偏移按規範不包括提示流本身
+    positions = array("q")
+    position = part4_pos
+    for length in lengths:
+        positions.append(position)
+        position += length
+    end_without_hint = position
+
+    page_lengths = [sum(lengths[layout.part6_start:layout.part7_start])]
+    cursor = layout.part7_start
+    for count in page_objects[1:]:
+        page_lengths.append(sum(lengths[cursor:cursor + count]))
+        cursor += count
+    shared_lengths = list(lengths[layout.part6_start:layout.part7_start])
+    shared_lengths += lengths[layout.part8_start:layout.part8_start + layout.part8_count]
+    if layout.part8_count:
+        first_shared_num = ref_map[ordered[layout.part8_start]]
+        first_shared_offset = positions[layout.part8_start]
+    else:
+        first_shared_num = first_shared_offset = 0
+    hint_data, shared_table_offset = _hint_stream_data(
+        page_lengths, page_objects, page_shared, shared_lengths, positions[layout.part6_start],
+        first_shared_num, first_shared_offset, layout.part7_start - layout.part6_start,
+    )
+    hint_keys = b"/S %d" % shared_table_offset
+    if layout.outline_count:
+        # 書籤提示表（表 F.6 的通用提示表）：第一個書籤對象的編號和位置、對象數和總長度
+        start = layout.outline_start
+        hint_keys += b" /O %d" % len(hint_data)
+        hint_data += struct.pack(
+            ">IIII", ref_map[ordered[start]], positions[start], layout.outline_count,
+            sum(lengths[start:start + layout.outline_count]),
+        )
+    hint = (
+        b"%d 0 obj\n<< %s /Length %d >>\nstream\n" % (layout.hint_num, hint_keys, len(hint_data))
+        + hint_data + b"\nendstream\nendobj\n"
+    )
+    # 提示流緊接在第 4 段之後、首頁之前
+    hint_pos = positions[layout.part6_start]
+    hint_len = len(hint)
+
+    main_xref_pos = end_without_hint + hint_len
+    main_xref_header = b"xref\n0 %d" % n
+    main_trailer = b"trailer\n<< /Size %d >>\nstartxref\n%d\n%%%%EOF\n" % (n, first_xref_pos)
+    file_length = main_xref_pos + len(main_xref_header) + 1 + 20 * n + len(main_trailer)
+    first_page_end = positions[layout.part7_start - 1] + lengths[layout.part7_start - 1] + hint_len
+
+    offsets = array("q", [0]) * total
+    offsets[layout.lin_num] = len(header)
+    offsets[layout.hint_num] = hint_pos
+    for index, key in enumerate(ordered):
+        position = positions[index]
+        offsets[ref_map[key]] = position + hint_len if index >= layout.part6_start else position
+
+    temp_file = path + ".linearizing"
+    try:
+        with open(temp_file, "wb") as out:
+            out.write(header)
+            out.write(lin_template % (
+                layout.lin_num, file_length, hint_pos, hint_len, first_page_num, first_page_end,
+                npages, main_xref_pos + len(main_xref_header),
+            ))
+            out.write(first_xref_header)
+            out.write(b"".join(b"%010d 00000 n \n" % offsets[num] for num in range(n, total)))
+            out.write(trailer1_template % (total, trailer_refs, main_xref_pos))
+
+            spool.seek(0)
+            _copy_bytes(spool, out, hint_pos - part4_pos)
+            out.write(hint)
+            while True:
+                check_cancelled(cancel_event)
+                chunk = spool.read(1024 * 1024)
+                if not chunk:
+                    break
+                out.write(chunk)
+
+            if out.tell() != main_xref_pos:
+                raise ValueError("線性化布局計算錯誤")
+            out.write(main_xref_header + b"\n")
+            out.write(b"0000000000 65535 f \n")
+            out.write(b"".join(b"%010d 00000 n \n" % offsets[num] for num in range(1, n)))
+            out.write(main_trailer)
+    except BaseException:
+        remove_partial_output(temp_file)
+        raise
+    os.replace(temp_file, path)
+
+
+def _copy_bytes(source, target, count):
+    while count > 0:
+        chunk = source.read(min(count, 1024 * 1024))
+        if not chunk:
+            raise ValueError("臨時文件不完整")
+        target.write(chunk)
+        count -= len(chunk)
+
+
+def linearize_output(format_name, path, status_callback=None, cancel_event=None, trace=None):
+    """對合併輸出執行線性化；只適用於PDF，其他格式提示並跳過，返回頁數或 None"""
+    if format_name != "pdf":
+        notify("線性化只適用於PDF輸出，已跳過", status_callback, logging.WARNING)
+        return None
+    if trace is not None:
+        with trace.span("linearize"):
+            return linearize_pdf(path, status_callback, cancel_event, trace)
+    return linearize_pdf(path, status_callback, cancel_event, trace)
+
+
+def check_linearization(path):
+    """用本地工具檢查文件是否正確線性化，返回 (是否通過, 說明)；沒有可用工具時返回 (None, 說明)
+
+    優先使用 pikepdf（qpdf 的 Python 綁定），其次是 PATH 中的 qpdf 命令。
+    """
+    try:
+        import pikepdf
+    except ImportError:
+        pikepdf = None
+    if pikepdf is not None:
+        # qpdf 的警告保存在文檔對象上，不寫入傳入的流
+        with pikepdf.open(path) as pdf:
+            if not pdf.is_linearized:
+                return False, "文件沒有線性化"
+            ok = pdf.check_linearization(io.StringIO())
+            warnings = pdf.get_warnings()
+        return ok, "\n".join(warnings) or ("線性化檢查通過" if ok else "線性化檢查未通過")
+
+    qpdf = shutil.which("qpdf")
+    if qpdf is None:
+        return None, "沒有找到檢查工具，請安裝 pikepdf（pip install pikepdf）或 qpdf"
+    import subprocess
+
+    result = subprocess.run(
+        [qpdf, "--check-linearization", path], capture_output=True, text=True
+    )
+    output = (result.stdout + result.stderr).strip()
+    return result.returncode == 0, output or "線性化檢查通過"
@@ -0,0 +1,948 @@
+import io
+import os
+import logging
+import hashlib
+import zlib
+import shutil
+import tempfile
+from array import array
+from contextlib import contextmanager
+from datetime import datetime
+
+from merge_utils import (
+    notify, ensure_parent_dir, peak_rss_mb, ordered_parallel_map,
+    check_cancelled, remove_partial_output, MergeCancelled,
+    split_input_spec, select_pages,
+)
+from merge_trace import MergeTrace
+
+# 對象編號 1 固定為文檔目錄（Catalog），2 固定為頁面樹根節點
+CATALOG_NUM = 1
+PAGES_NUM = 2
+# 緊湊模式下每個對象流最多打包的對象數和內容大小；閱讀器讀取其中一個對象時要解壓整個對象流
+OBJSTM_OBJECTS = 200
+OBJSTM_BYTES = 256 * 1024
+# 檢查點中保存的寫入器狀態，恢復後寫入器與寫下檢查點時完全相同
+WRITER_STATE = (
+    "_pos", "_offsets", "_kids", "_digests", "_alias", "_ref_count", "_packed", "_packed_bytes",
+    "pages_written", "objects_written", "objects_deduplicated", "bytes_deduplicated",
+    "object_streams", "objects_packed",
+)
+
+
+@contextmanager
+def open_mapped_pdf(path):
+    """以內存映射方式打開輸入PDF，返回可交給 PdfReader 的只讀流
+
+    PdfReader 按 xref 表定位對象後直接從映射中讀取，不會把整個文件讀入內存，
+    也不需要為每次讀取發起系統調用；退出時立即解除映射並關閉文件句柄，
+    不依賴垃圾回收（被映射的文件在 Windows 上不能被刪除或覆蓋）。
+    """
+    import mmap
+
+    with open(path, "rb") as fh:
+        try:
+            mapped = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            # 空文件或不支持映射的文件（如部分網絡驅動器）退回到普通文件讀取
+            yield fh
+            return
+    # 映射持有自己的句柄，原文件句柄此時已經關閉
+    try:
+        yield mapped
+    finally:
+        mapped.close()
+
+
+class _PdfObjectCopier:
+    """把 PdfReader 中的頁面及其依賴對象重新編號後寫出的公共邏輯"""
+
+    def __init__(self, trace=None):
+        from PyPDF2.generic import (
+            ArrayObject, DictionaryObject, IndirectObject, StreamObject,
+        )
+        self._ArrayObject = ArrayObject
+        self._DictionaryObject = DictionaryObject
+        self._IndirectObject = IndirectObject
+        self._StreamObject = StreamObject
+
+        self._pos = 0
+        # 下標即對象編號，0 號保留給 xref 的空閒鏈表頭，-1 表示尚未寫出
+        self._offsets = array("q", [0])
+        self._kids = array("q")
+        self.pages_written = 0
+        self.objects_written = 0
+
+        # 內容相同的流對象（字體、圖片、ICC 配置等）只寫出一次：
+        # _digests 為內容哈希 -> 已寫出的對象編號，_alias 為被去重的編號 -> 保留的編號
+        self._digests = {}
+        self._alias = {}
+        self._ref_count = 0
+        self.objects_deduplicated = 0
+        self.bytes_deduplicated = 0
+
+        self.trace = trace if trace is not None else MergeTrace()
+
+    def _write(self, data):
+        raise NotImplementedError
+
+    def _write_num(self, buf, num):
+        buf.write(b"%d" % num)
+
+    def _allocate(self):
+        self._offsets.append(-1)
+        return len(self._offsets) - 1
+
+    def append(self, pdf_file):
+        """將一個PDF文件的頁面追加到輸出，pdf_file 可以帶範圍，如 report.pdf:1-5,9"""
+        from PyPDF2 import PdfReader
+
+        path, ranges = split_input_spec(pdf_file)
+        self.trace.count("input_bytes", os.path.getsize(path))
+        # 傳入映射而不是路徑，PyPDF2 只讀取被引用的對象，不會一次讀入整個文件
+        with open_mapped_pdf(path) as stream:
+            with self.trace.span("open", file=pdf_file):
+                reader = PdfReader(stream)
+                if reader.is_encrypted:
+                    reader.decrypt("")
+            with self.trace.span("copy", file=pdf_file) as attrs:
+                pages_before = self.pages_written
+                objects_before = self.objects_written
+                self.append_reader(reader, ranges)
+                attrs["pages"] = self.pages_written - pages_before
+                attrs["objects"] = self.objects_written - objects_before
+
+    def append_reader(self, reader, ranges=None):
+        """將一個已打開的 PdfReader 的頁面追加到輸出，ranges 為範圍文本"""
+        ref_map = {}
+        all_pages = reader.pages
+        indices = select_pages(ranges, len(all_pages))
+        pages = [all_pages[index] for index in indices]
+        if ranges is not None:
+            # 未選中的頁面映射為 null：指向它們的鏈接不會把整頁連同頁面樹一起複製進來，
+            # 這些頁面的內容和資源也不會被解析
+            selected = set(indices)
+            for index, page in enumerate(all_pages):
+                ref = page.indirect_reference
+                if index not in selected and ref is not None:
+                    ref_map[(ref.idnum, ref.generation)] = None
+
+        # 先為所有頁面分配編號，這樣頁面之間的相互引用（如鏈接目標）不會被展開複製
+        page_nums = []
+        for page in pages:
+            num = self._allocate()
+            ref = page.indirect_reference
+            if ref is not None:
+                ref_map[(ref.idnum, ref.generation)] = num
+            page_nums.append(num)
+
+        for page, num in zip(pages, page_nums):
+            self._copy_tree(reader, page, num, ref_map, is_page=True)
+            self._kids.append(num)
+            self.pages_written += 1
+            # 已寫出的對象不再需要，清空讀取器緩存以限制內存
+            reader.resolved_objects.clear()
+
+    def _copy_tree(self, reader, root, root_num, ref_map, is_page=False):
+        # 迭代的後序遍歷：子對象先寫出，父對象後寫出。
+        # 已分配編號但尚未展開的子對象（如被兩個對象共用的 ICC 配置）再次入棧，
+        # 保證引用它的對象寫出之前它已經寫出或已確定被去重，引用能改寫為保留的編號
+        pending = {root_num}
+        stack = [(root, root_num, False)]
+        while stack:
+            obj, num, expanded = stack.pop()
+            if expanded:
+                self._emit(num, obj, ref_map, is_page=(is_page and num == root_num))
+                continue
+            if num not in pending:
+                # 已經從另一個引用處展開過
+                continue
+            pending.discard(num)
+            stack.append((obj, num, True))
+            skip_parent = is_page and num == root_num
+            for ref in self._iter_refs(obj, skip_parent):
+                key = (ref.idnum, ref.generation)
+                if key not in ref_map:
+                    child_num = self._allocate()
+                    ref_map[key] = child_num
+                    pending.add(child_num)
+                else:
+                    child_num = ref_map[key]
+                    if child_num not in pending:
+                        # 已經寫出、是正在展開的祖先（循環引用），或是映射為 null 的未選中頁面
+                        continue
+                stack.append((reader.get_object(ref), child_num, False))
+
+    def _iter_refs(self, obj, skip_parent=False):
+        pending = [obj]
+        while pending:
+            item = pending.pop()
+            if isinstance(item, self._IndirectObject):
+                yield item
+            elif isinstance(item, self._DictionaryObject):
+                is_stream = isinstance(item, self._StreamObject)
+                for key, value in item.items():
+                    if skip_parent and item is obj and key == "/Parent":
+                        continue
+                    if is_stream and key == "/Length":
+                        continue
+                    pending.append(value)
+            elif isinstance(item, self._ArrayObject):
+                pending.extend(item)
+
+    def _emit(self, num, obj, ref_map, is_page=False):
+        buf = io.BytesIO()
+        refs_before = self._ref_count
+        if is_page:
+            buf.write(b"<<")
+            for key, value in obj.items():
+                if key == "/Parent":
+                    continue
+                buf.write(b"\n")
+                key.write_to_stream(buf, None)
+                buf.write(b" ")
+                self._serialize(value, ref_map, buf)
+            # 頁面樹根節點的編號固定，不參與重新編號
+            buf.write(b"\n/Parent %d 0 R\n>>" % PAGES_NUM)
+        else:
+            self._serialize(obj, ref_map, buf)
+        buf.write(b"\nendobj\n")
+
+        # 只對不引用其他對象的流去重，其內容完全由自身字節決定
+        if not is_page and isinstance(obj, self._StreamObject) and self._ref_count == refs_before:
+            digest = hashlib.sha256(buf.getbuffer()).digest()
+            existing = self._digests.get(digest)
+            if existing is not None:
+                self._alias[num] = existing
+                self.objects_deduplicated += 1
+                self.bytes_deduplicated += buf.tell()
+                return
+            self._digests[digest] = num
+            self._record_digest(num, digest)
+
+        self._offsets[num] = self._pos
+        # 流對象不能放進對象流
+        self._write_object(num, buf, packable=not isinstance(obj, self._StreamObject))
+        self.objects_written += 1
+
+    def _record_digest(self, num, digest):
+        pass
+
+    def _write_object(self, num, buf, packable=False):
+        self._write(b"%d 0 obj\n" % num)
+        self._write(buf.getvalue())
+
+    def _serialize(self, obj, ref_map, buf):
+        if isinstance(obj, self._IndirectObject):
+            num = ref_map.get((obj.idnum, obj.generation))
+            if num is None:
+                buf.write(b"null")
+            else:
+                self._ref_count += 1
+                self._write_num(buf, self._alias.get(num, num))
+                buf.write(b" 0 R")
+        elif isinstance(obj, self._StreamObject):
+            data = obj._data or b""
+            if isinstance(data, str):
+                data = data.encode("latin-1")
+            buf.write(b"<<")
+            for key, value in obj.items():
+                if key == "/Length":
+                    continue
+                buf.write(b"\n")
+                key.write_to_stream(buf, None)
+                buf.write(b" ")
+                self._serialize(value, ref_map, buf)
+            buf.write(b"\n/Length %d\n>>\nstream\n" % len(data))
+            buf.write(data)
+            buf.write(b"\nendstream")
+        elif isinstance(obj, self._DictionaryObject):
+            buf.write(b"<<")
+            for key, value in obj.items():
+                buf.write(b"\n")
+                key.write_to_stream(buf, None)
+                buf.write(b" ")
+                self._serialize(value, ref_map, buf)
+            buf.write(b"\n>>")
+        elif isinstance(obj, self._ArrayObject):
+            buf.write(b"[")
+            for index, value in enumerate(obj):
+                if index:
+                    buf.write(b" ")
+                self._serialize(value, ref_map, buf)
+            buf.write(b"]")
+        elif obj is None:
+            buf.write(b"null")
+        else:
+            obj.write_to_stream(buf, None)
+
+
+class PdfFragment:
+    """一個輸入文件預處理後得到的可重定位對象片段
+
+    片段文件中的對象從 1 開始編號且不帶 "N 0 obj" 頭，offsets 記錄每個對象
+    內容的起始位置；對象引用中的編號寫成固定寬度的字段，relocations 記錄
+    這些字段的位置。拼接時只需補上對象頭並改寫編號，不需要重新解析PDF。
+    digests 記錄不引用其他對象的流的內容哈希，供拼接時跨文件去重。
+    packable 記錄不是流的對象，緊湊模式下拼接時把它們打包進對象流。
+    """
+
+    def __init__(self, source, path):
+        self.source = source
+        self.path = path
+        self.object_count = 0
+        self.offsets = array("q")
+        self.page_nums = array("q")
+        self.relocations = array("q")
+        self.digests = {}
+        # 不是流的對象，緊湊模式拼接時可以打包進對象流
+        self.packable = array("q")
+        self.error = None
+        # 工作進程中記錄的耗時區間，併入主進程的追蹤記錄後清空，不寫入緩存
+        self.spans = []
+
+
+# 片段中對象編號字段的寬度，足夠容納任意合法的對象編號
+RELOC_WIDTH = 10
+
+
+class PdfFragmentBuilder(_PdfObjectCopier):
+    """把單個PDF文件寫成可重定位片段，供工作進程使用"""
+
+    def __init__(self, source, fragment_path):
+        super().__init__()
+        self.fragment = PdfFragment(source, fragment_path)
+        self._fh = open(fragment_path, "wb")
+        self._buf_relocations = []
+
+    def _write(self, data):
+        self._fh.write(data)
+        self._pos += len(data)
+
+    def _write_num(self, buf, num):
+        self._buf_relocations.append(buf.tell())
+        buf.write(b"%0*d" % (RELOC_WIDTH, num))
+
+    def _record_digest(self, num, digest):
+        self.fragment.digests[num] = digest
+
+    def _write_object(self, num, buf, packable=False):
+        # 對象頭由拼接方按最終編號寫出
+        if packable:
+            self.fragment.packable.append(num)
+        start = self._pos
+        for offset in self._buf_relocations:
+            self.fragment.relocations.append(start + offset)
+        self._buf_relocations = []
+        self._write(buf.getvalue())
+
+    def close(self):
+        self._fh.close()
+        fragment = self.fragment
+        fragment.object_count = len(self._offsets) - 1
+        fragment.offsets = self._offsets[1:]
+        fragment.page_nums = self._kids
+        return fragment
+
+
+def build_pdf_fragment(pdf_file, fragment_dir):
+    """工作進程入口：校驗、解密並讀取一個PDF文件，寫出可重定位片段"""
+    fd, fragment_path = tempfile.mkstemp(suffix=".frag", dir=fragment_dir)
+    os.close(fd)
+    builder = PdfFragmentBuilder(pdf_file, fragment_path)
+    # 只把整個文件的解析區間交給主進程，工作進程內部的 open/copy 不與主進程的拼接重複統計
+    trace = MergeTrace()
+    try:
+        with trace.span("parse", file=pdf_file) as attrs:
+            builder.append(pdf_file)
+            attrs["pages"] = builder.pages_written
+    except Exception as e:
+        builder.close()
+        fragment = builder.fragment
+        fragment.error = str(e)
+        fragment.object_count = 0
+        fragment.page_nums = array("q")
+        return fragment
+    fragment = builder.close()
+    fragment.spans = trace.export_spans()
+    return fragment
+
+
+class StreamingPdfWriter(_PdfObjectCopier):
+    """流式PDF合併寫入器
+
+    每處理完一頁就把該頁及其引用的對象直接寫入輸出文件，
+    內存中只保留對象偏移量和頁面編號，與輸入文件的數量和大小無關。
+    compress_level（0-9）不為 None 時使用緊湊模式：不是流的對象（頁面、字體描述、注釋等）
+    打包進壓縮的對象流，交叉引用表寫成壓縮的交叉引用流，頁數很多時輸出明顯變小。
+    resume 為 checkpoint_state 返回的狀態，傳入時把輸出截斷到當時的位置後繼續寫出。
+    """
+
+    def __init__(self, output_file, trace=None, write_buffer=0, compress_level=None, resume=None):
+        super().__init__(trace)
+        if compress_level is not None and not 0 <= compress_level <= 9:
+            raise ValueError("壓縮級別必須在 0 到 9 之間")
+        self.output_file = output_file
+        self.compress_level = compress_level
+        # 等待打包進下一個對象流的 (編號, 對象內容)
+        self._packed = []
+        self._packed_bytes = 0
+        self.object_streams = 0
+        self.objects_packed = 0
+        # 設置後文件標識由它生成，不再包含當前時間，同樣的輸入得到同樣的輸出
+        self.file_id_seed = None
+        if resume is None:
+            self._fh = open(output_file, "wb")
+        else:
+            # 檢查點之後寫出的內容可能不完整，從檢查點的位置重新寫
+            self._fh = open(output_file, "r+b")
+            self._fh.truncate(resume["_pos"])
+            self._fh.seek(resume["_pos"])
+            for name in WRITER_STATE:
+                setattr(self, name, resume[name])
+        if write_buffer:
+            # 由後台線程寫入磁盤，複製對象時不必等待寫入完成
+            from merge_pipeline import BackgroundWriter
+            self._fh = BackgroundWriter(self._fh, write_buffer, self.trace)
+        if resume is None:
+            # 1 號和 2 號對象留給文檔目錄和頁面樹，在 close 時寫出
+            self._offsets.extend([-1, -1])
+            self._write(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+
+    def _write(self, data):
+        self._fh.write(data)
+        self._pos += len(data)
+
+    def _write_object(self, num, buf, packable=False):
+        if packable and self.compress_level is not None:
+            self._pack(num, _strip_endobj(buf.getvalue()))
+        else:
+            super()._write_object(num, buf)
+
+    def _pack(self, num, body):
+        self._packed.append((num, body))
+        self._packed_bytes += len(body)
+        if len(self._packed) >= OBJSTM_OBJECTS or self._packed_bytes >= OBJSTM_BYTES:
+            self._flush_object_stream()
+
+    def _flush_object_stream(self):
+        """把等待打包的對象寫成一個對象流"""
+        if not self._packed:
+            return
+        stm = self._allocate()
+        header = []
+        offset = 0
+        for index, (num, body) in enumerate(self._packed):
+            header.append(b"%d %d" % (num, offset))
+            offset += len(body) + 1
+            # 對象流中的對象在偏移表中記為負數，與尚未寫出的 -1 區分
+            self._offsets[num] = -2 - ((stm << 16) | index)
+        head = b" ".join(header) + b"\n"
+        data = zlib.compress(
+            head + b"".join(body + b"\n" for _, body in self._packed), self.compress_level
+        )
+        self._offsets[stm] = self._pos
+        self._write(
+            b"%d 0 obj\n<< /Type /ObjStm /N %d /First %d /Filter /FlateDecode /Length %d >>\nstream\n"
+            % (stm, len(self._packed), len(head), len(data))
+        )
+        self._write(data)
+        self._write(b"\nendstream\nendobj\n")
+        self.object_streams += 1
+        self.objects_packed += len(self._packed)
+        self._packed = []
+        self._packed_bytes = 0
+
+    def append_fragment(self, fragment):
+        """拼接工作進程生成的片段，只補寫對象頭、改寫對象編號並複製字節"""
+        base = len(self._offsets) - 1
+        self._offsets.extend([-1] * fragment.object_count)
+
+        # 與之前已寫出的流內容相同的對象不再複製，引用改寫為已有的編號
+        skipped = set()
+        for local, digest in fragment.digests.items():
+            existing = self._digests.get(digest)
+            if existing is None:
+                self._digests[digest] = base + local
+            else:
+                self._alias[base + local] = existing
+                skipped.add(local)
+
+        # 緊湊模式下可打包的對象先收集完整內容再放進對象流；舊版緩存中的片段沒有這項記錄，直接複製
+        packable = ()
+        if self.compress_level is not None:
+            packable = set(getattr(fragment, "packable", ()))
+        packing = None
+
+        def out(data):
+            if packing is None:
+                self._write(data)
+            else:
+                packing[1].append(data)
+
+        def finish_packing():
+            if packing is not None:
+                self._pack(packing[0], _strip_endobj(b"".join(packing[1])))
+            return None
+
+        # 按在片段中的位置合併對象起點和重定位字段兩類事件
+        starts = sorted(
+            (offset, local) for local, offset in enumerate(fragment.offsets, 1) if offset >= 0
+        )
+        # 對象在片段中連續存放，下一個對象的起點即當前對象的終點
+        ends = {local: end for (_, local), (end, _) in zip(starts, starts[1:])}
+        if starts:
+            ends[starts[-1][1]] = os.path.getsize(fragment.path)
+        events = list(starts)
+        events.extend((offset, 0) for offset in fragment.relocations)
+        events.sort()
+
+        with open(fragment.path, "rb") as fh:
+            position = 0
+            for offset, local in events:
+                while position < offset:
+                    data = fh.read(min(offset - position, 1024 * 1024))
+                    if not data:
+                        raise ValueError(f"片段文件 {fragment.path} 不完整")
+                    out(data)
+                    position += len(data)
+                if local:
+                    packing = finish_packing()
+                if local in skipped:
+                    position = ends[local]
+                    fh.seek(position)
+                    self.objects_deduplicated += 1
+                    self.bytes_deduplicated += position - offset
+                elif local in packable:
+                    packing = (base + local, [])
+                elif local:
+                    self._offsets[base + local] = self._pos
+                    self._write(b"%d 0 obj\n" % (base + local))
+                else:
+                    target = int(fh.read(RELOC_WIDTH)) + base
+                    out(b"%d" % self._alias.get(target, target))
+                    position += RELOC_WIDTH
+            while True:
+                data = fh.read(1024 * 1024)
+                if not data:
+                    break
+                out(data)
+            finish_packing()
+        self._kids.extend(num + base for num in fragment.page_nums)
+        self.pages_written += len(fragment.page_nums)
+        self.objects_written += len(starts) - len(skipped)
+
+    def close(self):
+        """寫出頁面樹、文檔目錄和交叉引用表並關閉文件"""
+        if self._fh.closed:
+            return
+        if self.compress_level is not None:
+            kids = b"".join(b"\n%d 0 R" % kid for kid in self._kids)
+            self._pack(PAGES_NUM, b"<< /Type /Pages /Count %d /Kids [%s\n] >>" % (len(self._kids), kids))
+            self._pack(CATALOG_NUM, b"<< /Type /Catalog /Pages %d 0 R >>" % PAGES_NUM)
+            self._flush_object_stream()
+            self._write_xref_stream()
+            self._fh.close()
+            return
+
+        self._offsets[PAGES_NUM] = self._pos
+        self._write(b"%d 0 obj\n<< /Type /Pages /Count %d /Kids [" % (PAGES_NUM, len(self._kids)))
+        for start in range(0, len(self._kids), 1024):
+            chunk = self._kids[start:start + 1024]
+            self._write(b"".join(b"\n%d 0 R" % kid for kid in chunk))
+        self._write(b"\n] >>\nendobj\n")
+
+        self._offsets[CATALOG_NUM] = self._pos
+        self._write(b"%d 0 obj\n<< /Type /Catalog /Pages %d 0 R >>\nendobj\n" % (CATALOG_NUM, PAGES_NUM))
+
+        self._write_xref()
+        self._fh.close()
+
+    def checkpoint_state(self):
+        """把已寫出的內容刷到磁盤，返回可以傳給 resume 的寫入器狀態"""
+        if hasattr(self._fh, "sync"):
+            self._fh.sync()
+        else:
+            self._fh.flush()
+            os.fsync(self._fh.fileno())
+        return {name: getattr(self, name) for name in WRITER_STATE}
+
+    def abort(self):
+        """放棄合併，關閉並刪除不完整的輸出文件"""
+        if not self._fh.closed:
+            self._fh.close()
+        remove_partial_output(self.output_file)
+
+    def _free_list(self, size):
+        # 未寫出的編號作為空閒對象，按規範串成鏈表
+        free = [num for num in range(1, size) if self._offsets[num] == -1]
+        return dict(zip([0] + free, free + [0]))
+
+    def _file_id(self):
+        seed = self.file_id_seed if self.file_id_seed is not None else datetime.now().isoformat()
+        return hashlib.md5(
+            f"{self.output_file}{seed}{self._pos}".encode("utf-8")
+        ).hexdigest().encode("ascii")
+
+    def _write_xref(self):
+        size = len(self._offsets)
+        next_free = self._free_list(size)
+
+        xref_pos = self._pos
+        self._write(b"xref\n0 %d\n" % size)
+        for start in range(0, size, 1024):
+            lines = []
+            for num in range(start, min(start + 1024, size)):
+                if num in next_free:
+                    lines.append(b"%010d 65535 f \n" % next_free[num])
+                else:
+                    lines.append(b"%010d 00000 n \n" % self._offsets[num])
+            self._write(b"".join(lines))
+
+        file_id = self._file_id()
+        self._write(
+            b"trailer\n<< /Size %d /Root %d 0 R /ID [<%s> <%s>] >>\nstartxref\n%d\n%%%%EOF\n"
+            % (size, CATALOG_NUM, file_id, file_id, xref_pos)
+        )
+
+    def _write_xref_stream(self):
+        """寫出壓縮的交叉引用流（PDF 1.5），對象流中的對象記為第 2 類條目"""
+        xref_num = self._allocate()
+        xref_pos = self._pos
+        self._offsets[xref_num] = xref_pos
+        size = len(self._offsets)
+        next_free = self._free_list(size)
+
+        # 第二個字段存放偏移量或對象流編號，第三個字段存放生成號或在對象流中的序號
+        width = max((max(xref_pos, size).bit_length() + 7) // 8, 1)
+        compressor = zlib.compressobj(self.compress_level)
+        chunks = []
+        for start in range(0, size, 1024):
+            rows = []
+            for num in range(start, min(start + 1024, size)):
+                offset = self._offsets[num]
+                if num in next_free:
+                    rows.append(b"\x00" + next_free[num].to_bytes(width, "big") + b"\xff\xff")
+                elif offset >= 0:
+                    rows.append(b"\x01" + offset.to_bytes(width, "big") + b"\x00\x00")
+                else:
+                    location = -2 - offset
+                    rows.append(
+                        b"\x02" + (location >> 16).to_bytes(width, "big")
+                        + (location & 0xFFFF).to_bytes(2, "big")
+                    )
+            chunks.append(compressor.compress(b"".join(rows)))
+        chunks.append(compressor.flush())
+        data = b"".join(chunks)
+
+        file_id = self._file_id()
+        self._write(
+            b"%d 0 obj\n<< /Type /XRef /Size %d /W [1 %d 2] /Root %d 0 R /ID [<%s> <%s>] "
+            b"/Filter /FlateDecode /Length %d >>\nstream\n"
+            % (xref_num, size, width, CATALOG_NUM, file_id, file_id, len(data))
+        )
+        self._write(data)
+        self._write(b"\nendstream\nendobj\nstartxref\n%d\n%%%%EOF\n" % xref_pos)
+
+
+def _strip_endobj(data):
+    """去掉對象內容末尾的 endobj，用於放入對象流"""
+    if not data.endswith(b"\nendobj\n"):
+        raise ValueError("對象內容格式不正確")
+    return data[:-len(b"\nendobj\n")]
+
+
+def _record_writer_counters(trace, writer, output_file):
+    trace.count("pages", writer.pages_written)
+    trace.count("objects_written", writer.objects_written)
+    trace.count("objects_deduplicated", writer.objects_deduplicated)
+    if writer.object_streams:
+        trace.count("object_streams", writer.object_streams)
+        trace.count("objects_packed", writer.objects_packed)
+    trace.count("output_bytes", os.path.getsize(output_file))
+
+
+def _report_writer(writer, status_callback):
+    if writer.objects_deduplicated:
+        notify(
+            f"去除重複資源: {writer.objects_deduplicated} 個對象, "
+            f"節省 {writer.bytes_deduplicated / (1024 * 1024):.2f} MB",
+            status_callback,
+        )
+    if writer.object_streams:
+        notify(
+            f"緊湊輸出: {writer.objects_packed} 個對象打包進 {writer.object_streams} 個對象流"
+            f"（壓縮級別 {writer.compress_level}），交叉引用表寫成交叉引用流",
+            status_callback,
+        )
+
+
+def _open_writer(output_file, trace, write_buffer, compress_level, checkpoint, status_callback):
+    """創建寫入器，有可以使用的檢查點時從中恢復，返回 (寫入器, 已處理的輸入數)"""
+    if checkpoint is None:
+        return StreamingPdfWriter(output_file, trace, write_buffer, compress_level), 0
+    processed = 0
+    restored = checkpoint.load(status_callback)
+    if restored is None:
+        writer = StreamingPdfWriter(output_file, trace, write_buffer, compress_level)
+    else:
+        processed, state, extra = restored
+        writer = StreamingPdfWriter(output_file, trace, write_buffer, compress_level, resume=state)
+        if extra.get("files_failed"):
+            trace.count("files_failed", extra["files_failed"])
+        notify(
+            f"從檢查點恢復: 已處理 {processed} 個文件（{writer.pages_written} 頁），"
+            f"從第 {processed + 1} 個文件繼續",
+            status_callback,
+        )
+    writer.file_id_seed = checkpoint.fingerprint
+    return writer, processed
+
+
+def _save_checkpoint(writer, checkpoint, processed, trace, status_callback):
+    """處理完 processed 個輸入後按間隔寫檢查點，寫入失敗時只提示，不中斷合併"""
+    if checkpoint is None or not checkpoint.due(processed):
+        return
+    try:
+        with trace.span("checkpoint"):
+            checkpoint.save(
+                processed, writer.checkpoint_state(),
+                {"files_failed": trace.counters.get("files_failed", 0)},
+            )
+    except OSError as e:
+        notify(f"無法寫入檢查點 {checkpoint.path}: {e}", status_callback, logging.WARNING)
+
+
+def _finish_checkpoint(checkpoint, status_callback):
+    if checkpoint is not None:
+        checkpoint.discard()
+        if checkpoint.saved:
+            notify(f"合併期間共寫入 {checkpoint.saved} 次檢查點，已刪除檢查點文件", status_callback)
+
+
+def stream_merge_pdfs(pdf_files, output_file, status_callback=None, cancel_event=None,
+                      trace=None, compress_level=None, checkpoint=None):
+    """使用流式寫入器合併PDF文件，返回是否成功
+
+    cancel_event 被設置後在下一個文件開始前停止，刪除不完整的輸出並拋出 MergeCancelled；
+    傳入 MergeTrace 時記錄各階段的耗時和計數；compress_level 不為 None 時寫出緊湊的對象流和交叉引用流；
+    傳入 merge_checkpoint.MergeCheckpoint 時按間隔寫檢查點，進程中途退出後再次運行從檢查點繼續
+    """
+    ensure_parent_dir(output_file)
+    trace = trace if trace is not None else MergeTrace()
+
+    writer, processed = _open_writer(output_file, trace, 0, compress_level, checkpoint, status_callback)
+    try:
+        for index, pdf_file in enumerate(pdf_files[processed:], processed + 1):
+            check_cancelled(cancel_event)
+            notify(f"正在處理: {pdf_file}", status_callback)
+            with trace.span("file", file=pdf_file):
+                try:
+                    writer.append(pdf_file)
+                except Exception as e:
+                    trace.count("files_failed")
+                    notify(f"處理文件 {pdf_file} 時出錯: {e}", status_callback, logging.ERROR)
+            _save_checkpoint(writer, checkpoint, index, trace, status_callback)
+    except MergeCancelled:
+        writer.abort()
+        if checkpoint is not None:
+            checkpoint.discard()
+        raise
+    finally:
+        with trace.span("write"):
+            writer.close()
+    _finish_checkpoint(checkpoint, status_callback)
+    _record_writer_counters(trace, writer, output_file)
+
+    size_mb = os.path.getsize(output_file) / (1024 * 1024)
+    notify(
+        f"流式合併完成: {writer.pages_written} 頁, {writer.objects_written} 個對象, "
+        f"輸出 {size_mb:.1f} MB",
+        status_callback,
+    )
+    _report_writer(writer, status_callback)
+    peak = peak_rss_mb()
+    if peak is not None:
+        notify(f"進程內存峰值: {peak:.1f} MB", status_callback)
+    return True
+
+
+def pipelined_merge_pdfs(pdf_files, output_file, status_callback=None, cancel_event=None,
+                         trace=None, config=None, compress_level=None, checkpoint=None):
+    """讀取、解析和寫出重疊進行的流式PDF合併，返回是否成功
+
+    後台線程按 config（merge_pipeline.PipelineConfig）的隊列深度和內存預算提前讀入後面的文件，
+    另一個線程解析交叉引用表，主線程按原順序複製頁面，輸出由寫出線程寫入磁盤。
+    輸入在網絡驅動器上時，讀取延遲被處理時間掩蓋。cancel_event、trace、compress_level 和 checkpoint
+    的用法與 stream_merge_pdfs 相同。
+    """
+    from PyPDF2 import PdfReader
+    from merge_pipeline import PipelineConfig, prefetch_inputs
+
+    ensure_parent_dir(output_file)
+    trace = trace if trace is not None else MergeTrace()
+    config = config or PipelineConfig()
+
+    def parse(item):
+        # 在讀取線程中解析交叉引用表，對象內容在主線程複製時才按需解析
+        with trace.span("parse", file=item.spec):
+            reader = PdfReader(io.BytesIO(item.data))
+            if reader.is_encrypted:
+                reader.decrypt("")
+        return reader
+
+    writer, processed = _open_writer(
+        output_file, trace, config.write_bytes, compress_level, checkpoint, status_callback
+    )
+    prefetched = prefetch_inputs(pdf_files[processed:], config, cancel_event, trace, parse)
+    try:
+        while True:
+            with trace.span("wait"):
+                item = next(prefetched, None)
+            if item is None:
+                break
+            pdf_file = item.spec
+            notify(f"正在處理: {pdf_file}", status_callback)
+            with trace.span("file", file=pdf_file):
+                try:
+                    if item.error is not None:
+                        raise item.error
+                    reader = item.result
+                    if reader is None:
+                        # 超出預讀預算的大文件按需從磁盤讀取
+                        writer.append(pdf_file)
+                    else:
+                        trace.count("input_bytes", item.size)
+                        with trace.span("copy", file=pdf_file) as attrs:
+                            pages_before = writer.pages_written
+                            writer.append_reader(reader, split_input_spec(pdf_file)[1])
+                            attrs["pages"] = writer.pages_written - pages_before
+                except Exception as e:
+                    trace.count("files_failed")
+                    notify(f"處理文件 {pdf_file} 時出錯: {e}", status_callback, logging.ERROR)
+                finally:
+                    item.release()
+            processed += 1
+            _save_checkpoint(writer, checkpoint, processed, trace, status_callback)
+    except MergeCancelled:
+        writer.abort()
+        if checkpoint is not None:
+            checkpoint.discard()
+        raise
+    finally:
+        prefetched.close()
+        with trace.span("write"):
+            writer.close()
+    _finish_checkpoint(checkpoint, status_callback)
+    _record_writer_counters(trace, writer, output_file)
+
+    size_mb = os.path.getsize(output_file) / (1024 * 1024)
+    notify(
+        f"流水線合併完成: {writer.pages_written} 頁, {writer.objects_written} 個對象, "
+        f"輸出 {size_mb:.1f} MB",
+        status_callback,
+    )
+    _report_writer(writer, status_callback)
+    peak = peak_rss_mb()
+    if peak is not None:
+        notify(f"進程內存峰值: {peak:.1f} MB", status_callback)
+    return True
+
+
+def parallel_merge_pdfs(pdf_files, output_file, jobs=None, status_callback=None, cache=None,
+                        cancel_event=None, trace=None, compress_level=None, checkpoint=None):
+    """在進程池中並行預處理PDF文件，主進程只按原順序拼接片段
+
+    傳入 MergeCache 時，內容未變化的文件直接使用緩存中的片段，
+    只有新增或修改過的文件會被重新解析。cancel_event、trace、compress_level 和 checkpoint 的用法與
+    stream_merge_pdfs 相同，工作進程中的解析耗時也會併入 trace。
+    """
+    ensure_parent_dir(output_file)
+    jobs = jobs or os.cpu_count() or 1
+    trace = trace if trace is not None else MergeTrace()
+
+    writer, processed = _open_writer(output_file, trace, 0, compress_level, checkpoint, status_callback)
+
+    # 先在主進程中查詢緩存，只把未命中的文件交給工作進程；從檢查點恢復時跳過已處理的文件
+    keys = [None] * len(pdf_files)
+    cached = {}
+    misses = []
+    for index, pdf_file in enumerate(pdf_files):
+        if index < processed:
+            continue
+        if cache is not None:
+            path, ranges = split_input_spec(pdf_file)
+            with trace.span("cache", file=pdf_file):
+                try:
+                    keys[index] = cache.key("pdf-fragment", path, ranges)
+                except OSError:
+                    keys[index] = None
+            fragment = cache.get(keys[index]) if keys[index] else None
+            if fragment is not None:
+                fragment.path = cache.attachment_path(keys[index])
+                cached[index] = fragment
+                trace.count("cache_hits")
+                continue
+            trace.count("cache_misses")
+        misses.append(pdf_file)
+
+    if jobs > 1:
+        notify(f"使用 {jobs} 個工作進程並行處理 {len(misses)} 個PDF文件", status_callback)
+
+    # 有緩存時片段寫在緩存目錄下，成功後可以原子地移入緩存
+    scratch_dir = cache.cache_dir if cache is not None else os.path.dirname(os.path.abspath(output_file))
+    fragment_dir = tempfile.mkdtemp(prefix="pdf_fragments_", dir=scratch_dir)
+    built = ordered_parallel_map(build_pdf_fragment, misses, jobs, fragment_dir)
+    try:
+        for index, pdf_file in enumerate(pdf_files[processed:], processed):
+            check_cancelled(cancel_event)
+            notify(f"正在處理: {pdf_file}", status_callback)
+            with trace.span("file", file=pdf_file):
+                if index in cached:
+                    with trace.span("copy", file=pdf_file, cached=True):
+                        writer.append_fragment(cached[index])
+                    _save_checkpoint(writer, checkpoint, index + 1, trace, status_callback)
+                    continue
+
+                with trace.span("wait", file=pdf_file):
+                    _, fragment, error = next(built)
+                if error is None:
+                    error = fragment.error
+                if fragment is not None:
+                    trace.merge_spans(getattr(fragment, "spans", ()))
+                    fragment.spans = []
+                if error is None:
+                    trace.count("input_bytes", os.path.getsize(split_input_spec(pdf_file)[0]))
+                    if keys[index] is not None:
+                        temp_path = fragment.path
+                        fragment.path = cache.attachment_path(keys[index])
+                        cache.put(keys[index], fragment, attachment=temp_path)
+                    with trace.span("copy", file=pdf_file):
+                        writer.append_fragment(fragment)
+                else:
+                    trace.count("files_failed")
+                    notify(f"處理文件 {pdf_file} 時出錯: {error}", status_callback, logging.ERROR)
+                if fragment is not None and keys[index] is None and os.path.exists(fragment.path):
+                    os.remove(fragment.path)
+            _save_checkpoint(writer, checkpoint, index + 1, trace, status_callback)
+    except MergeCancelled:
+        writer.abort()
+        if checkpoint is not None:
+            checkpoint.discard()
+        raise
+    finally:
+        with trace.span("write"):
+            writer.close()
+        built.close()
+        shutil.rmtree(fragment_dir, ignore_errors=True)
+    _finish_checkpoint(checkpoint, status_callback)
+    _record_writer_counters(trace, writer, output_file)
+
+    size_mb = os.path.getsize(output_file) / (1024 * 1024)
+    notify(
+        f"並行合併完成: {writer.pages_written} 頁, {writer.objects_written} 個對象, "
+        f"輸出 {size_mb:.1f} MB",
+        status_callback,
+    )
+    _report_writer(writer, status_callback)
+    return True
@@ -0,0 +1,175 @@
+import os
+import atexit
+import logging
+import threading
+
+from merge_utils import notify, ensure_parent_dir, check_cancelled, split_input_spec, select_pages
+from merge_trace import MergeTrace
+
+# PowerPoint 的 MsoTriState 取值
+MSO_TRUE = -1
+MSO_FALSE = 0
+
+
+def _dispatch_powerpoint():
+    """啟動（或連接到已運行的）PowerPoint 應用程序"""
+    import pythoncom
+    import win32com.client
+
+    # 在非主線程中使用 COM 之前必須先初始化，重複調用是安全的
+    pythoncom.CoInitialize()
+    return win32com.client.Dispatch("PowerPoint.Application")
+
+
+class PowerPointComBackend:
+    """通過 COM 驅動 PowerPoint 合併演示文稿
+
+    每個源文件只調用一次 Slides.InsertFromFile 批量插入全部幻燈片，
+    不再逐張經過剪貼板複製粘貼；PowerPoint 實例在多次合併之間保持運行。
+    app_factory 返回一個具有 PowerPoint.Application 接口的對象，
+    測試時可以傳入本地的假 COM 對象。
+    """
+
+    def __init__(self, app_factory=None):
+        self._app_factory = app_factory or _dispatch_powerpoint
+        self._app = None
+
+    def _get_app(self):
+        if self._app is not None:
+            try:
+                # 訪問任意屬性以確認實例仍然存活（用戶可能已手動關閉 PowerPoint）
+                self._app.Presentations.Count
+            except Exception:
+                self._app = None
+        if self._app is None:
+            self._app = self._app_factory()
+        return self._app
+
+    def _open(self, app, path):
+        # 以只讀、無標題、無窗口方式打開，避免鎖定源文件和界面重繪
+        return app.Presentations.Open(os.path.abspath(path), MSO_TRUE, MSO_TRUE, MSO_FALSE)
+
+    def _select_base_slides(self, presentation, ranges):
+        """刪除基礎文件中未選中的幻燈片，並按範圍中的順序排列其餘幻燈片"""
+        slides = presentation.Slides
+        indices = select_pages(ranges, slides.Count)
+        slide_ids = [slides(index + 1).SlideID for index in indices]
+        selected = set(indices)
+        for index in range(slides.Count - 1, -1, -1):
+            if index not in selected:
+                slides(index + 1).Delete()
+        for position, slide_id in enumerate(slide_ids, 1):
+            slides.FindBySlideID(slide_id).MoveTo(position)
+
+    def _insert_slides(self, app, merged, ppt_file):
+        path, ranges = split_input_spec(ppt_file)
+        path = os.path.abspath(path)
+        if ranges is None:
+            merged.Slides.InsertFromFile(path, merged.Slides.Count, 1, -1)
+            return
+
+        # InsertFromFile 只能插入連續的幻燈片，把選中的序號拆成連續的升序段分別插入
+        source = self._open(app, path)
+        try:
+            count = source.Slides.Count
+        finally:
+            source.Close()
+        runs = []
+        for index in select_pages(ranges, count):
+            if runs and index == runs[-1][1] + 1:
+                runs[-1][1] = index
+            else:
+                runs.append([index, index])
+        for first, last in runs:
+            merged.Slides.InsertFromFile(path, merged.Slides.Count, first + 1, last + 1)
+
+    def merge(self, ppt_files, output_file, status_callback=None, cancel_event=None, trace=None):
+        """以第一個文件為基礎，把其餘文件的幻燈片插入到末尾並另存
+
+        文件可以帶範圍（如 "deck.pptx:3-12"），只合併選中的幻燈片。
+        cancel_event 被設置後在下一個文件開始前停止並拋出 MergeCancelled，不保存輸出；
+        傳入 MergeTrace 時記錄各階段的耗時和計數
+        """
+        ensure_parent_dir(output_file)
+        trace = trace if trace is not None else MergeTrace()
+        with trace.span("open", target="PowerPoint"):
+            app = self._get_app()
+
+        notify(f"正在使用第一個文件作為基礎: {ppt_files[0]}", status_callback)
+        base_path, base_ranges = split_input_spec(ppt_files[0])
+        with trace.span("file", file=ppt_files[0]), trace.span("open", file=ppt_files[0]):
+            merged = self._open(app, base_path)
+        try:
+            if base_ranges is not None:
+                self._select_base_slides(merged, base_ranges)
+            for ppt_file in ppt_files[1:]:
+                check_cancelled(cancel_event)
+                notify(f"正在處理: {ppt_file}", status_callback)
+                with trace.span("file", file=ppt_file), trace.span("copy", file=ppt_file) as attrs:
+                    slides_before = merged.Slides.Count
+                    try:
+                        self._insert_slides(app, merged, ppt_file)
+                    except Exception as e:
+                        trace.count("files_failed")
+                        notify(f"處理文件 {ppt_file} 時出錯: {e}", status_callback, logging.ERROR)
+                    attrs["slides"] = merged.Slides.Count - slides_before
+                    trace.count("slides_added", attrs["slides"])
+
+            with trace.span("save"):
+                merged.SaveAs(os.path.abspath(output_file))
+        finally:
+            merged.Close()
+        return True
+
+    def quit(self):
+        """關閉由本程序使用的 PowerPoint 實例"""
+        if self._app is None:
+            return
+        try:
+            # 用戶自己打開的演示文稿仍在時不退出，以免關閉用戶的 PowerPoint
+            if self._app.Presentations.Count == 0:
+                self._app.Quit()
+        except Exception:
+            pass
+        self._app = None
+
+
+_local = threading.local()
+_backends = []
+_backends_lock = threading.Lock()
+
+
+def get_com_backend():
+    """返回當前線程共享的 COM 後端，未安裝 pywin32 時拋出 ImportError
+
+    COM 對象不能跨線程使用，因此每個線程各自保留一個實例。
+    """
+    import win32com.client  # noqa: F401
+
+    backend = getattr(_local, "backend", None)
+    if backend is None:
+        backend = PowerPointComBackend()
+        _local.backend = backend
+        with _backends_lock:
+            _backends.append(backend)
+    return backend
+
+
+def release_com_backend():
+    """關閉當前線程的 COM 後端，供長期運行的工作線程退出前調用"""
+    backend = getattr(_local, "backend", None)
+    if backend is None:
+        return
+    backend.quit()
+    _local.backend = None
+    with _backends_lock:
+        if backend in _backends:
+            _backends.remove(backend)
+
+
+@atexit.register
+def _quit_backends():
+    with _backends_lock:
+        for backend in _backends:
+            backend.quit()
+        _backends.clear()
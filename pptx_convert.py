@@ -0,0 +1,141 @@
+import os
+import sys
+import shutil
+import logging
+import pathlib
+import tempfile
+import subprocess
+from contextlib import nullcontext
+
+from merge_utils import notify, check_cancelled, ordered_parallel_map, split_input_spec
+
+# 可以由 LibreOffice 轉換為PDF後參與PDF合併的演示文稿格式
+CONVERTIBLE_EXTENSIONS = (".pptx", ".ppt", ".pptm", ".ppsx", ".pps", ".potx", ".pot", ".odp")
+# 單個文件的轉換時間上限（秒），超時的文件按轉換失敗處理
+CONVERT_TIMEOUT = 300
+# 不在 PATH 中時按默認安裝位置查找
+_WINDOWS_SOFFICE = (
+    r"C:\Program Files\LibreOffice\program\soffice.exe",
+    r"C:\Program Files (x86)\LibreOffice\program\soffice.exe",
+)
+_MAC_SOFFICE = "/Applications/LibreOffice.app/Contents/MacOS/soffice"
+
+
+def is_convertible(spec):
+    """輸入（可帶頁碼範圍）是否是需要先轉換為PDF的演示文稿"""
+    return os.path.splitext(split_input_spec(spec)[0])[1].lower() in CONVERTIBLE_EXTENSIONS
+
+
+def find_converter():
+    """返回本機 LibreOffice（soffice）的路徑，未安裝時返回 None"""
+    for name in ("soffice", "libreoffice"):
+        path = shutil.which(name)
+        if path:
+            return path
+    candidates = _WINDOWS_SOFFICE if sys.platform == "win32" else (_MAC_SOFFICE,)
+    for path in candidates:
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def convert_deck(path, work_dir, soffice):
+    """工作進程入口：用無界面的 LibreOffice 把一個演示文稿轉換為PDF，返回PDF路徑"""
+    # 每次轉換使用獨立的用戶配置目錄和輸出目錄，多個 soffice 進程才能同時運行
+    profile_dir = tempfile.mkdtemp(prefix="soffice_profile_", dir=work_dir)
+    out_dir = tempfile.mkdtemp(prefix="converted_", dir=work_dir)
+    command = [
+        soffice, f"-env:UserInstallation={pathlib.Path(profile_dir).resolve().as_uri()}",
+        "--headless", "--norestore", "--nolockcheck",
+        "--convert-to", "pdf", "--outdir", out_dir, os.path.abspath(path),
+    ]
+    try:
+        result = subprocess.run(command, capture_output=True, timeout=CONVERT_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        raise RuntimeError(f"LibreOffice 轉換超時（{CONVERT_TIMEOUT} 秒）")
+    finally:
+        shutil.rmtree(profile_dir, ignore_errors=True)
+    pdf_path = os.path.join(out_dir, os.path.splitext(os.path.basename(path))[0] + ".pdf")
+    if result.returncode != 0 or not os.path.exists(pdf_path):
+        message = result.stderr.decode("utf-8", "replace").strip() or f"退出代碼 {result.returncode}"
+        raise RuntimeError(f"LibreOffice 轉換失敗: {message}")
+    return pdf_path
+
+
+def _stage(pdf_path, work_dir, source, index):
+    """把轉換結果放到合併用的臨時目錄中，優先使用硬鏈接，不複製數據"""
+    name = f"{index:04d}_{os.path.splitext(os.path.basename(source))[0]}.pdf"
+    target = os.path.join(work_dir, name)
+    try:
+        os.link(pdf_path, target)
+    except OSError:
+        shutil.copyfile(pdf_path, target)
+    return target
+
+
+def convert_mixed_inputs(files, work_dir, jobs=1, cache=None, status_callback=None,
+                         cancel_event=None, trace=None):
+    """把輸入列表中的演示文稿轉換為PDF，返回按原順序排列、全部為PDF的輸入列表
+
+    轉換在進程池中並行執行（每個文件一個 soffice 進程），PDF 輸入原樣保留；
+    頁碼範圍保留在轉換後的文件上，幻燈片序號即頁碼。傳入 MergeCache 時轉換結果按
+    文件內容哈希緩存，未變化的文稿不會被再次轉換。轉換失敗的文件被跳過並提示，
+    與合併時出錯的文件處理方式相同。轉換結果放在 work_dir 中，由調用方刪除。
+    """
+    results = list(files)
+    pending = []
+    for index, spec in enumerate(files):
+        if not is_convertible(spec):
+            continue
+        path, ranges = split_input_spec(spec)
+        key = None
+        if cache is not None:
+            with trace.span("cache", file=spec) if trace is not None else nullcontext():
+                try:
+                    key = cache.key("pptx-pdf", path)
+                except OSError:
+                    key = None
+            if key is not None and cache.get(key) is not None and os.path.exists(cache.attachment_path(key)):
+                staged = _stage(cache.attachment_path(key), work_dir, path, index)
+                results[index] = f"{staged}:{ranges}" if ranges else staged
+                if trace is not None:
+                    trace.count("conversions_cached")
+                continue
+        pending.append((index, spec, path, ranges, key))
+
+    if pending:
+        soffice = find_converter()
+        if soffice is None:
+            notify(
+                f"有 {len(pending)} 個演示文稿需要 LibreOffice 才能轉換為PDF（未找到 soffice），已跳過",
+                status_callback, logging.ERROR,
+            )
+            for index, *_ in pending:
+                results[index] = None
+        else:
+            notify(f"正在用 LibreOffice 把 {len(pending)} 個演示文稿轉換為PDF", status_callback)
+            converted = ordered_parallel_map(
+                convert_deck, [path for _, _, path, _, _ in pending], jobs, work_dir, soffice
+            )
+            try:
+                for index, spec, path, ranges, key in pending:
+                    check_cancelled(cancel_event)
+                    with trace.span("convert", file=spec) if trace is not None else nullcontext():
+                        _, pdf_path, error = next(converted)
+                    if error is not None:
+                        results[index] = None
+                        if trace is not None:
+                            trace.count("files_failed")
+                        notify(f"轉換文件 {spec} 時出錯: {error}", status_callback, logging.ERROR)
+                        continue
+                    if trace is not None:
+                        trace.count("conversions")
+                    notify(f"已轉換: {spec}", status_callback)
+                    if key is not None:
+                        cache.put(key, {"source": os.path.basename(path)}, attachment=pdf_path)
+                        pdf_path = cache.attachment_path(key)
+                    staged = _stage(pdf_path, work_dir, path, index)
+                    results[index] = f"{staged}:{ranges}" if ranges else staged
+            finally:
+                converted.close()
+    return [spec for spec in results if spec is not None]
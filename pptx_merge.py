@@ -0,0 +1,744 @@
+import os
+import re
+import hashlib
+import logging
+import posixpath
+import zipfile
+
+from lxml import etree
+
+from merge_utils import (
+    notify, ensure_parent_dir, ordered_parallel_map,
+    check_cancelled, remove_partial_output, MergeCancelled,
+    split_input_spec, select_pages,
+)
+from merge_trace import MergeTrace
+
+RT = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+RT_OFFICE_DOCUMENT = RT + "/officeDocument"
+RT_SLIDE = RT + "/slide"
+RT_SLIDE_LAYOUT = RT + "/slideLayout"
+RT_SLIDE_MASTER = RT + "/slideMaster"
+RT_NOTES_SLIDE = RT + "/notesSlide"
+RT_NOTES_MASTER = RT + "/notesMaster"
+RT_COMMENTS = RT + "/comments"
+
+NS_PKG_RELS = "http://schemas.openxmlformats.org/package/2006/relationships"
+NS_CONTENT_TYPES = "http://schemas.openxmlformats.org/package/2006/content-types"
+NS_P = "http://schemas.openxmlformats.org/presentationml/2006/main"
+NS_R = RT
+NS_P14 = "http://schemas.microsoft.com/office/powerpoint/2010/main"
+
+# 幻燈片上這些關係依賴演示文稿級別的數據（如批註作者），跨文件複製會損壞輸出
+SKIPPED_SLIDE_RELS = (RT_COMMENTS,)
+
+
+def _rels_name(partname):
+    """返回部件對應的 .rels 文件在壓縮包中的路徑"""
+    directory, name = posixpath.split(partname)
+    return posixpath.join(directory, "_rels", name + ".rels").lstrip("/")
+
+
+def _resolve_target(source_partname, target):
+    directory = posixpath.dirname(source_partname)
+    return posixpath.normpath(posixpath.join(directory, target))
+
+
+def _is_xml(content_type):
+    return content_type.endswith("xml")
+
+
+def _remove_relationship_refs(blob, rids):
+    """刪除部件 XML 中對已丟棄關係的引用，返回新的內容；沒有引用時原樣返回
+
+    超鏈接和動作（a:hlinkClick、a:hlinkHover 等）的目標被丟棄時整個元素刪除，
+    其他元素只去掉引用該關係的屬性，輸出中不留下沒有對應關係的 r:id。
+    """
+    if not any(rid.encode("utf-8") in blob for rid in rids):
+        return blob
+    root = etree.fromstring(blob)
+    changed = False
+    for element in list(root.iter(etree.Element)):
+        for name, value in list(element.attrib.items()):
+            if value not in rids or not name.startswith(f"{{{NS_R}}}"):
+                continue
+            changed = True
+            parent = element.getparent()
+            if etree.QName(element).localname.startswith("hlink") and parent is not None:
+                parent.remove(element)
+                break
+            del element.attrib[name]
+    if not changed:
+        return blob
+    return etree.tostring(root, xml_declaration=True, encoding="UTF-8", standalone=True)
+
+
+def _is_media(content_type):
+    # 只對圖片、音頻和視頻去重；嵌入的工作簿等對象被多處共享時 PowerPoint 會提示修復
+    return content_type.split("/", 1)[0] in ("image", "audio", "video")
+
+
+class _ZipPackage:
+    """只讀的 OPC 壓縮包視圖，按需讀取部件內容"""
+
+    def __init__(self, path):
+        self.path = path
+        self.zip = zipfile.ZipFile(path)
+        self.names = set(self.zip.namelist())
+        self.defaults = {}
+        # 小寫部件名 -> (原始部件名, 內容類型)
+        self.overrides = {}
+        types = etree.fromstring(self.zip.read("[Content_Types].xml"))
+        for node in types:
+            tag = etree.QName(node).localname
+            if tag == "Default":
+                self.defaults[node.get("Extension").lower()] = node.get("ContentType")
+            elif tag == "Override":
+                partname = node.get("PartName")
+                self.overrides[partname.lower()] = (partname, node.get("ContentType"))
+        self._rels_cache = {}
+
+    def content_type(self, partname):
+        override = self.overrides.get(partname.lower())
+        if override is not None:
+            return override[1]
+        ext = partname.rsplit(".", 1)[-1].lower()
+        return self.defaults.get(ext, "application/octet-stream")
+
+    def has_part(self, partname):
+        return partname.lstrip("/") in self.names
+
+    def read(self, partname):
+        return self.zip.read(partname.lstrip("/"))
+
+    def rels(self, partname):
+        """返回部件的關係列表 [(rId, reltype, target, is_external)]，目標已解析為絕對部件名"""
+        if partname in self._rels_cache:
+            return self._rels_cache[partname]
+        rels = []
+        name = _rels_name(partname)
+        if name in self.names:
+            root = etree.fromstring(self.zip.read(name))
+            for node in root:
+                is_external = node.get("TargetMode") == "External"
+                target = node.get("Target")
+                if not is_external:
+                    target = _resolve_target(partname, target)
+                rels.append((node.get("Id"), node.get("Type"), target, is_external))
+        self._rels_cache[partname] = rels
+        return rels
+
+    def main_partname(self):
+        for _, reltype, target, _ in self.rels("/"):
+            if reltype == RT_OFFICE_DOCUMENT:
+                return target
+        raise ValueError(f"{self.path} 不是有效的演示文稿")
+
+    def close(self):
+        self.zip.close()
+
+
+def _master_layouts(package, master_partname, master_blob):
+    """按 sldLayoutIdLst 的順序返回母版下的版式部件名"""
+    root = etree.fromstring(master_blob)
+    rel_targets = {rid: target for rid, _, target, _ in package.rels(master_partname)}
+    layouts = []
+    for node in root.iter(f"{{{NS_P}}}sldLayoutId"):
+        target = rel_targets.get(node.get(f"{{{NS_R}}}id"))
+        if target:
+            layouts.append(target)
+    return layouts
+
+
+def _master_key(master_blob, layout_blobs):
+    digest = hashlib.sha1(master_blob)
+    for blob in layout_blobs:
+        digest.update(blob)
+    return digest.hexdigest()
+
+
+class DeckSnapshot:
+    """從一個演示文稿中提取出的幻燈片及其依賴部件
+
+    只包含原始字節和關係表，可以被 pickle，
+    因此能在進程之間傳遞或寫入磁盤緩存。
+    """
+
+    def __init__(self, source):
+        self.source = source
+        # partname -> (content_type, blob)
+        self.parts = {}
+        # partname -> [(rId, reltype, target, is_external)]
+        self.rels = {}
+        self.slides = []
+        # [(master_partname, [layout_partname, ...])]
+        self.masters = []
+        self.notes_master = None
+
+    @property
+    def size(self):
+        return sum(len(blob) for _, blob in self.parts.values())
+
+    def copy(self):
+        """淺複製，合併時可以修改部件表和關係表而不影響原快照"""
+        clone = DeckSnapshot(self.source)
+        clone.parts = dict(self.parts)
+        clone.rels = dict(self.rels)
+        clone.slides = list(self.slides)
+        clone.masters = list(self.masters)
+        clone.notes_master = self.notes_master
+        return clone
+
+
+def _used_layouts(package, slides):
+    layouts = set()
+    for slide in slides:
+        for _, reltype, target, _ in package.rels(slide):
+            if reltype == RT_SLIDE_LAYOUT:
+                layouts.add(target)
+    return layouts
+
+
+def extract_deck(path):
+    """讀取演示文稿，提取幻燈片、版式、母版和媒體部件
+
+    path 可以帶範圍（如 "deck.pptx:3-12"），此時只讀取選中的幻燈片
+    及其依賴的部件，只被未選中幻燈片使用的母版也不會被提取。
+    """
+    source = path
+    path, ranges = split_input_spec(path)
+    package = _ZipPackage(path)
+    try:
+        snapshot = DeckSnapshot(source)
+        pres_partname = package.main_partname()
+        pres_rels = {rid: target for rid, _, target, _ in package.rels(pres_partname)}
+        pres = etree.fromstring(package.read(pres_partname))
+
+        slides = []
+        for node in pres.iter(f"{{{NS_P}}}sldId"):
+            target = pres_rels.get(node.get(f"{{{NS_R}}}id"))
+            if target and package.has_part(target):
+                slides.append(target)
+        snapshot.slides = [slides[index] for index in select_pages(ranges, len(slides))]
+        used_layouts = _used_layouts(package, snapshot.slides) if ranges is not None else None
+        for node in pres.iter(f"{{{NS_P}}}sldMasterId"):
+            target = pres_rels.get(node.get(f"{{{NS_R}}}id"))
+            if target and package.has_part(target):
+                blob = package.read(target)
+                layouts = _master_layouts(package, target, blob)
+                if used_layouts is not None and used_layouts.isdisjoint(layouts):
+                    continue
+                snapshot.masters.append((target, layouts))
+        for _, reltype, target, _ in package.rels(pres_partname):
+            if reltype == RT_NOTES_MASTER:
+                snapshot.notes_master = target
+
+        # 從幻燈片和母版出發，收集所有可達部件
+        pending = list(snapshot.slides) + [master for master, _ in snapshot.masters]
+        while pending:
+            partname = pending.pop()
+            if partname in snapshot.parts or not package.has_part(partname):
+                continue
+            snapshot.parts[partname] = (package.content_type(partname), package.read(partname))
+            rels = package.rels(partname)
+            snapshot.rels[partname] = rels
+            for _, reltype, target, is_external in rels:
+                # 母版和幻燈片本身已經作為起點加入，備註母版在合併時映射到目標文件的備註母版
+                if is_external or reltype in (RT_NOTES_MASTER, RT_SLIDE, RT_SLIDE_MASTER):
+                    continue
+                pending.append(target)
+        return snapshot
+    finally:
+        package.close()
+
+
+class PptxXmlMerger:
+    """在包/XML層面合併演示文稿
+
+    以第一個文件為基礎，其餘文件的幻燈片部件、版式、母版和媒體
+    直接按字節複製到輸出包中，不經過 python-pptx 的對象模型。
+    相同的母版只導入一次，內容相同的媒體文件只保存一份。
+    """
+
+    def __init__(self, base_file, output_file):
+
+        ensure_parent_dir(output_file)
+        self.output_file = output_file
+        base_file, ranges = split_input_spec(base_file)
+        self.base = _ZipPackage(base_file)
+        self._out = zipfile.ZipFile(output_file, "w", zipfile.ZIP_DEFLATED)
+
+        self._pres_partname = self.base.main_partname()
+        self._pres = etree.fromstring(self.base.read(self._pres_partname))
+        self._pres_rels = list(self.base.rels(self._pres_partname))
+        self._used_names = {name.lower() for name in self.base.names}
+        self._new_overrides = {}
+        self._new_defaults = {}
+        self._name_counters = {}
+
+        # 基礎文件中不再被引用的部件（壓縮包內的名稱）、需要重寫的關係表
+        # 及引用了被刪除關係、需要改寫的部件（壓縮包內的名稱 -> 被刪除的關係編號）
+        self._dropped = set()
+        self._filtered_rels = {}
+        self._rewritten_parts = {}
+        if ranges is not None:
+            self._select_base_slides(ranges)
+
+        # 內容相同的媒體按 (大小 -> 部件名) 建索引，只有大小相同時才計算哈希
+        self._media_by_size = {}
+        self._media_hashes = {}
+        for info in self.base.zip.infolist():
+            partname = "/" + info.filename
+            if info.filename in self._dropped or not _is_media(self.base.content_type(partname)):
+                continue
+            self._media_by_size.setdefault(info.file_size, []).append(partname)
+
+        self._notes_master = None
+        self._next_rid = 1
+        for rid, reltype, target, _ in self._pres_rels:
+            if reltype == RT_NOTES_MASTER:
+                self._notes_master = target
+            if rid.startswith("rId") and rid[3:].isdigit():
+                self._next_rid = max(self._next_rid, int(rid[3:]) + 1)
+
+        self._next_layout_id = 2147483648
+        self._masters = {}
+        for node in self._pres.iter(f"{{{NS_P}}}sldMasterId"):
+            self._next_layout_id = max(self._next_layout_id, int(node.get("id")) + 1)
+            target = self._pres_rel_target(node.get(f"{{{NS_R}}}id"))
+            if not target or not self.base.has_part(target):
+                continue
+            blob = self.base.read(target)
+            master_root = etree.fromstring(blob)
+            for layout_node in master_root.iter(f"{{{NS_P}}}sldLayoutId"):
+                self._next_layout_id = max(self._next_layout_id, int(layout_node.get("id")) + 1)
+            layouts = _master_layouts(self.base, target, blob)
+            key = _master_key(blob, [self.base.read(layout) for layout in layouts])
+            self._masters[key] = layouts
+
+        self._next_slide_id = 256
+        for node in self._pres.iter(f"{{{NS_P}}}sldId"):
+            self._next_slide_id = max(self._next_slide_id, int(node.get("id")) + 1)
+
+        self.slides_added = 0
+        self.media_reused = 0
+        self.bytes_saved = 0
+
+    def _select_base_slides(self, ranges):
+        """只保留基礎文件中選中的幻燈片，並找出因此不再被引用的部件"""
+        sld_list = self._pres.find(f"{{{NS_P}}}sldIdLst")
+        nodes = list(sld_list) if sld_list is not None else []
+        keep = [nodes[index] for index in select_pages(ranges, len(nodes))]
+        keep_ids = {node.get("id") for node in keep}
+        removed_rids = {node.get(f"{{{NS_R}}}id") for node in nodes if node.get("id") not in keep_ids}
+        for node in nodes:
+            sld_list.remove(node)
+        for node in keep:
+            sld_list.append(node)
+        for node in list(self._pres.iter(f"{{{NS_P14}}}sldId")):
+            if node.get("id") not in keep_ids:
+                node.getparent().remove(node)
+        self._pres_rels = [rel for rel in self._pres_rels if rel[0] not in removed_rids]
+
+        # 從包的根關係和演示文稿的關係出發收集可達部件；
+        # 幻燈片之間的超鏈接不算引用，否則未選中的幻燈片會被一併保留
+        reachable = {self._pres_partname}
+        pending = [target for _, _, target, external in self.base.rels("/") if not external]
+        pending.extend(target for _, _, target, external in self._pres_rels if not external)
+        while pending:
+            partname = pending.pop()
+            if partname in reachable or not self.base.has_part(partname):
+                continue
+            reachable.add(partname)
+            for _, reltype, target, external in self.base.rels(partname):
+                if not external and reltype != RT_SLIDE:
+                    pending.append(target)
+
+        for name in self.base.names:
+            if name == "[Content_Types].xml" or ("_rels/" in name and name.endswith(".rels")):
+                continue
+            if "/" + name not in reachable:
+                self._dropped.add(name)
+                self._dropped.add(_rels_name("/" + name))
+        for partname in reachable:
+            rels = self.base.rels(partname)
+            kept = [rel for rel in rels if rel[3] or rel[2].lstrip("/") not in self._dropped]
+            if len(kept) != len(rels):
+                self._filtered_rels[_rels_name(partname)] = (partname, kept)
+                # 如指向未選中幻燈片的超鏈接，部件中對應的 r:id 也要刪除
+                removed = {rel[0] for rel in rels} - {rel[0] for rel in kept}
+                if _is_xml(self.base.content_type(partname)):
+                    self._rewritten_parts[partname.lstrip("/")] = removed
+
+    def _pres_rel_target(self, rid):
+        for rel_id, _, target, _ in self._pres_rels:
+            if rel_id == rid:
+                return target
+        return None
+
+    def _add_pres_rel(self, reltype, target):
+        rid = f"rId{self._next_rid}"
+        self._next_rid += 1
+        self._pres_rels.append((rid, reltype, target, False))
+        return rid
+
+    def _new_partname(self, template):
+        directory, name = posixpath.split(template)
+        match = re.match(r"^(.*?)(\d*)(\.[^.]+)$", name)
+        if match:
+            stem, ext = match.group(1), match.group(3)
+        else:
+            stem, ext = name, ""
+        counter_key = (directory, stem, ext)
+        index = self._name_counters.get(counter_key, 1)
+        while True:
+            candidate = posixpath.join(directory, f"{stem}{index}{ext}")
+            if candidate.lstrip("/").lower() not in self._used_names:
+                break
+            index += 1
+        self._name_counters[counter_key] = index + 1
+        self._used_names.add(candidate.lstrip("/").lower())
+        return candidate
+
+    def _register_content_type(self, partname, content_type):
+        ext = partname.rsplit(".", 1)[-1].lower()
+        default = self.base.defaults.get(ext, self._new_defaults.get(ext))
+        if default == content_type:
+            return
+        if default is None and not _is_xml(content_type):
+            self._new_defaults[ext] = content_type
+            return
+        self._new_overrides[partname] = content_type
+
+    def _find_duplicate(self, blob):
+        candidates = self._media_by_size.get(len(blob))
+        if not candidates:
+            return None
+        digest = hashlib.sha1(blob).digest()
+        for partname in candidates:
+            known = self._media_hashes.get(partname)
+            if known is None:
+                # 只有基礎文件中的媒體會延遲計算哈希
+                known = hashlib.sha1(self.base.read(partname)).digest()
+                self._media_hashes[partname] = known
+            if known == digest:
+                return partname
+        return None
+
+    def _write_part(self, partname, content_type, blob, rels):
+        self._out.writestr(partname.lstrip("/"), blob)
+        self._register_content_type(partname, content_type)
+        if rels:
+            self._out.writestr(_rels_name(partname), self._rels_xml(partname, rels))
+
+    def _rels_xml(self, partname, rels):
+        directory = posixpath.dirname(partname)
+        lines = [
+            "<?xml version='1.0' encoding='UTF-8' standalone='yes'?>\n",
+            f'<Relationships xmlns="{NS_PKG_RELS}">',
+        ]
+        for rid, reltype, target, is_external in rels:
+            if is_external:
+                target_attr = self._escape(target) + '" TargetMode="External'
+            else:
+                target_attr = self._escape(posixpath.relpath(target, directory or "/"))
+            lines.append(f'<Relationship Id="{rid}" Type="{reltype}" Target="{target_attr}"/>')
+        lines.append("</Relationships>")
+        return "".join(lines).encode("utf-8")
+
+    @staticmethod
+    def _escape(value):
+        return (value.replace("&", "&amp;").replace('"', "&quot;")
+                .replace("<", "&lt;").replace(">", "&gt;"))
+
+    def _import_parts(self, snapshot, roots, mapping):
+        """把快照中的部件（連同其依賴）複製到輸出包
+
+        mapping 記錄源部件名到新部件名的映射，起點部件可以預先分配好名字。
+        """
+        pending = list(roots)
+        queued = set(roots)
+        order = []
+        while pending:
+            partname = pending.pop()
+            content_type, blob = snapshot.parts[partname]
+            if mapping.get(partname) is None:
+                if _is_media(content_type):
+                    duplicate = self._find_duplicate(blob)
+                    if duplicate is not None:
+                        mapping[partname] = duplicate
+                        self.media_reused += 1
+                        self.bytes_saved += len(blob)
+                        continue
+                mapping[partname] = self._new_partname(partname)
+            order.append(partname)
+            for _, reltype, target, is_external in snapshot.rels.get(partname, ()):
+                if is_external or target in mapping or target in queued:
+                    continue
+                if target not in snapshot.parts:
+                    continue
+                queued.add(target)
+                pending.append(target)
+
+        for partname in order:
+            content_type, blob = snapshot.parts[partname]
+            new_partname = mapping[partname]
+            rels = []
+            removed = set()
+            for rid, reltype, target, is_external in snapshot.rels.get(partname, ()):
+                if not is_external:
+                    if reltype == RT_NOTES_MASTER:
+                        target = self._notes_master
+                    else:
+                        target = mapping.get(target)
+                    if target is None:
+                        # 目標未被導入（如範圍外的幻燈片），部件中引用它的元素一併刪除
+                        removed.add(rid)
+                        continue
+                rels.append((rid, reltype, target, is_external))
+            if removed and _is_xml(content_type):
+                blob = _remove_relationship_refs(blob, removed)
+            self._write_part(new_partname, content_type, blob, rels)
+            if _is_media(content_type):
+                self._media_by_size.setdefault(len(blob), []).append(new_partname)
+                self._media_hashes[new_partname] = hashlib.sha1(blob).digest()
+        return mapping
+
+    def _import_master(self, snapshot, master_partname, layouts, mapping):
+        layout_blobs = [snapshot.parts[layout][1] for layout in layouts]
+        key = _master_key(snapshot.parts[master_partname][1], layout_blobs)
+        existing = self._masters.get(key)
+        if existing is not None:
+            # 相同模板的母版已存在，直接把版式映射到已有版式
+            for source_layout, target_layout in zip(layouts, existing):
+                mapping[source_layout] = target_layout
+            return
+
+        # 母版中的版式編號必須在整個演示文稿中唯一，導入前重新編號（快照已在 append 中複製）
+        content_type, blob = snapshot.parts[master_partname]
+        master_root = etree.fromstring(blob)
+        for node in master_root.iter(f"{{{NS_P}}}sldLayoutId"):
+            node.set("id", str(self._next_layout_id))
+            self._next_layout_id += 1
+        snapshot.parts[master_partname] = (
+            content_type,
+            etree.tostring(master_root, xml_declaration=True, encoding="UTF-8", standalone=True),
+        )
+        self._import_parts(snapshot, [master_partname], mapping)
+
+        rid = self._add_pres_rel(RT_SLIDE_MASTER, mapping[master_partname])
+        master_list = self._pres.find(f"{{{NS_P}}}sldMasterIdLst")
+        entry = etree.SubElement(master_list, f"{{{NS_P}}}sldMasterId")
+        entry.set("id", str(self._next_layout_id))
+        entry.set(f"{{{NS_R}}}id", rid)
+        self._next_layout_id += 1
+        self._masters[key] = [mapping[layout] for layout in layouts]
+
+    def append(self, snapshot):
+        """追加一個 DeckSnapshot 中的全部幻燈片"""
+        snapshot = snapshot.copy()
+        mapping = {}
+        for master_partname, layouts in snapshot.masters:
+            self._import_master(snapshot, master_partname, layouts, mapping)
+
+        if self._notes_master is None:
+            # 目標演示文稿沒有備註母版，無法保留備註頁
+            for partname, rels in snapshot.rels.items():
+                snapshot.rels[partname] = [rel for rel in rels if rel[1] != RT_NOTES_SLIDE]
+        for partname in snapshot.slides:
+            snapshot.rels[partname] = [
+                rel for rel in snapshot.rels.get(partname, ()) if rel[1] not in SKIPPED_SLIDE_RELS
+            ]
+
+        # 先為所有幻燈片分配部件名，幻燈片之間的超鏈接才能指向新位置
+        for partname in snapshot.slides:
+            mapping[partname] = self._new_partname(partname)
+        self._import_parts(snapshot, snapshot.slides, mapping)
+
+        sld_list = self._pres.find(f"{{{NS_P}}}sldIdLst")
+        if sld_list is None:
+            sld_list = etree.Element(f"{{{NS_P}}}sldIdLst")
+            master_list = self._pres.find(f"{{{NS_P}}}sldMasterIdLst")
+            anchor = master_list
+            for tag in ("notesMasterIdLst", "handoutMasterIdLst"):
+                node = self._pres.find(f"{{{NS_P}}}{tag}")
+                if node is not None:
+                    anchor = node
+            anchor.addnext(sld_list)
+        section_ids = self._last_section_ids()
+
+        for partname in snapshot.slides:
+            rid = self._add_pres_rel(RT_SLIDE, mapping[partname])
+            entry = etree.SubElement(sld_list, f"{{{NS_P}}}sldId")
+            entry.set("id", str(self._next_slide_id))
+            entry.set(f"{{{NS_R}}}id", rid)
+            if section_ids is not None:
+                etree.SubElement(section_ids, f"{{{NS_P14}}}sldId").set("id", str(self._next_slide_id))
+            self._next_slide_id += 1
+            self.slides_added += 1
+
+    def _last_section_ids(self):
+        sections = list(self._pres.iter(f"{{{NS_P14}}}section"))
+        if not sections:
+            return None
+        return sections[-1].find(f"{{{NS_P14}}}sldIdLst")
+
+    def close(self):
+        """寫出修改後的 presentation.xml、關係表、內容類型及基礎文件的其餘部件"""
+        skip = {
+            self._pres_partname.lstrip("/"),
+            _rels_name(self._pres_partname),
+            "[Content_Types].xml",
+        }
+        for info in self.base.zip.infolist():
+            if info.filename in skip or info.filename in self._dropped:
+                continue
+            if info.filename in self._filtered_rels:
+                partname, rels = self._filtered_rels[info.filename]
+                self._out.writestr(info.filename, self._rels_xml(partname, rels))
+                continue
+            if info.filename in self._rewritten_parts:
+                blob = _remove_relationship_refs(
+                    self.base.zip.read(info), self._rewritten_parts[info.filename]
+                )
+                self._out.writestr(info.filename, blob)
+                continue
+            with self.base.zip.open(info) as src, self._out.open(info.filename, "w") as dst:
+                while True:
+                    chunk = src.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+
+        self._out.writestr(
+            self._pres_partname.lstrip("/"),
+            etree.tostring(self._pres, xml_declaration=True, encoding="UTF-8", standalone=True),
+        )
+        self._out.writestr(_rels_name(self._pres_partname), self._rels_xml(self._pres_partname, self._pres_rels))
+        self._out.writestr("[Content_Types].xml", self._content_types_xml())
+        self._out.close()
+        self.base.close()
+
+    def abort(self):
+        """放棄合併，關閉並刪除不完整的輸出文件"""
+        self._out.close()
+        self.base.close()
+        remove_partial_output(self.output_file)
+
+    def _content_types_xml(self):
+        lines = [
+            "<?xml version='1.0' encoding='UTF-8' standalone='yes'?>\n",
+            f'<Types xmlns="{NS_CONTENT_TYPES}">',
+        ]
+        defaults = dict(self.base.defaults)
+        defaults.update(self._new_defaults)
+        for ext, content_type in sorted(defaults.items()):
+            lines.append(f'<Default Extension="{self._escape(ext)}" ContentType="{content_type}"/>')
+        overrides = {
+            partname: content_type for partname, content_type in self.base.overrides.values()
+            if partname.lstrip("/") not in self._dropped
+        }
+        overrides.update(self._new_overrides)
+        for partname, content_type in overrides.items():
+            lines.append(f'<Override PartName="{self._escape(partname)}" ContentType="{content_type}"/>')
+        lines.append("</Types>")
+        return "".join(lines).encode("utf-8")
+
+
+def xml_merge_pptx(ppt_files, output_file, status_callback=None, jobs=1, cache=None,
+                   cancel_event=None, trace=None):
+    """在包/XML層面合併 PPTX 文件，返回是否成功
+
+    jobs 大於 1 時在進程池中並行解析和提取各個文件，主進程只按順序拼接。
+    傳入 MergeCache 時，內容未變化的文件直接使用緩存中的幻燈片快照。
+    cancel_event 被設置後在下一個文件開始前停止，刪除不完整的輸出並拋出 MergeCancelled。
+    傳入 MergeTrace 時記錄各階段的耗時和計數。
+    """
+    trace = trace if trace is not None else MergeTrace()
+
+    # 第一個可以打開的文件作為基礎，保留其全部內容
+    merger = None
+    remaining = list(ppt_files)
+    while remaining and merger is None:
+        check_cancelled(cancel_event)
+        ppt_file = remaining.pop(0)
+        notify(f"正在處理: {ppt_file}", status_callback)
+        with trace.span("file", file=ppt_file), trace.span("open", file=ppt_file):
+            try:
+                merger = PptxXmlMerger(ppt_file, output_file)
+                trace.count("input_bytes", os.path.getsize(split_input_spec(ppt_file)[0]))
+            except Exception as e:
+                trace.count("files_failed")
+                notify(f"處理文件 {ppt_file} 時出錯: {e}", status_callback, logging.ERROR)
+
+    if merger is None:
+        notify("沒有可以合併的 PPTX 文件", status_callback, logging.WARNING)
+        return False
+
+    keys = [None] * len(remaining)
+    cached = {}
+    misses = []
+    for index, ppt_file in enumerate(remaining):
+        if cache is not None:
+            path, ranges = split_input_spec(ppt_file)
+            with trace.span("cache", file=ppt_file):
+                try:
+                    keys[index] = cache.key("pptx-deck", path, ranges)
+                except OSError:
+                    keys[index] = None
+            snapshot = cache.get(keys[index]) if keys[index] else None
+            if snapshot is not None:
+                cached[index] = snapshot
+                trace.count("cache_hits")
+                continue
+            trace.count("cache_misses")
+        misses.append(ppt_file)
+
+    if jobs and jobs > 1:
+        notify(f"使用 {jobs} 個工作進程並行解析 {len(misses)} 個PPTX文件", status_callback)
+    extracted = ordered_parallel_map(extract_deck, misses, jobs)
+    # 單進程時提取就在 next() 中進行，並行時 next() 只是等待工作進程的結果
+    extract_stage = "wait" if jobs and jobs > 1 else "open"
+    try:
+        for index, ppt_file in enumerate(remaining):
+            check_cancelled(cancel_event)
+            notify(f"正在處理: {ppt_file}", status_callback)
+            with trace.span("file", file=ppt_file):
+                if index in cached:
+                    snapshot, error = cached[index], None
+                else:
+                    with trace.span(extract_stage, file=ppt_file):
+                        _, snapshot, error = next(extracted)
+                    if error is None:
+                        trace.count("input_bytes", os.path.getsize(split_input_spec(ppt_file)[0]))
+                        if keys[index] is not None:
+                            cache.put(keys[index], snapshot)
+                if error is None:
+                    with trace.span("copy", file=ppt_file) as attrs:
+                        slides_before = merger.slides_added
+                        try:
+                            merger.append(snapshot)
+                        except Exception as e:
+                            error = e
+                        attrs["slides"] = merger.slides_added - slides_before
+                if error is not None:
+                    trace.count("files_failed")
+                    notify(f"處理文件 {ppt_file} 時出錯: {error}", status_callback, logging.ERROR)
+    except MergeCancelled:
+        merger.abort()
+        raise
+    finally:
+        extracted.close()
+
+    with trace.span("write"):
+        merger.close()
+    trace.count("slides_added", merger.slides_added)
+    trace.count("media_reused", merger.media_reused)
+    trace.count("output_bytes", os.path.getsize(output_file))
+    size_mb = os.path.getsize(output_file) / (1024 * 1024)
+    notify(
+        f"XML合併完成: 新增 {merger.slides_added} 張幻燈片, 重用媒體 {merger.media_reused} 個 "
+        f"(節省 {merger.bytes_saved / 1024:.1f} KB), 輸出 {size_mb:.1f} MB",
+        status_callback,
+    )
+    return True
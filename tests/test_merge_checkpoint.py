@@ -0,0 +1,61 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("PyPDF2")
+
+from merge_checkpoint import CheckpointConfig, MergeCheckpoint, checkpoint_path  # noqa: E402
+from pdf_stream import parallel_merge_pdfs, pipelined_merge_pdfs, stream_merge_pdfs  # noqa: E402
+
+
+class _Crash(Exception):
+    """模擬合併進程中途退出"""
+
+
+def _merge(merge, inputs, output, status_callback=None, compress_level=None):
+    checkpoint = MergeCheckpoint(output, inputs, CheckpointConfig(every_files=2), variant=(merge, compress_level))
+    kwargs = {"status_callback": status_callback, "compress_level": compress_level, "checkpoint": checkpoint}
+    if merge == "stream":
+        return stream_merge_pdfs(inputs, output, **kwargs)
+    if merge == "pipeline":
+        return pipelined_merge_pdfs(inputs, output, **kwargs)
+    return parallel_merge_pdfs(inputs, output, jobs=1, **kwargs)
+
+
+@pytest.mark.parametrize("compress_level", [None, 6])
+@pytest.mark.parametrize("merge", ["stream", "pipeline", "parallel"])
+def test_resume_from_checkpoint_matches_uninterrupted_merge(tmp_path, merge, compress_level):
+    from benchmark import write_synthetic_pdf
+
+    inputs = []
+    for number in range(1, 6):
+        inputs.append(str(tmp_path / f"in{number}.pdf"))
+        write_synthetic_pdf(inputs[-1], number, label=f"in{number}")
+    output = str(tmp_path / "out.pdf")
+
+    assert _merge(merge, inputs, output, compress_level=compress_level)
+    with open(output, "rb") as fh:
+        expected = fh.read()
+    assert not os.path.exists(checkpoint_path(output))
+    os.remove(output)
+
+    # 每 2 個文件寫一次檢查點，開始處理第 4 個文件時退出：檢查點記錄前 2 個文件
+    def crash_at_fourth(message):
+        if message == f"正在處理: {inputs[3]}":
+            raise _Crash()
+
+    with pytest.raises(_Crash):
+        _merge(merge, inputs, output, crash_at_fourth, compress_level)
+    assert os.path.exists(checkpoint_path(output))
+
+    messages = []
+    assert _merge(merge, inputs, output, messages.append, compress_level)
+    assert any(message.startswith("從檢查點恢復: 已處理 2 個文件") for message in messages)
+    processed = [message for message in messages if message.startswith("正在處理: ")]
+    assert processed == [f"正在處理: {path}" for path in inputs[2:]]
+    with open(output, "rb") as fh:
+        assert fh.read() == expected
+    assert not os.path.exists(checkpoint_path(output))
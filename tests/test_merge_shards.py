@@ -0,0 +1,106 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from merge_shards import ShardConfig, manifest_path, plan_shards, run_sharded_merge  # noqa: E402
+
+
+def _entry(pages, size):
+    return {"pages": pages, "size": size, "sha256": "0" * 64, "error": None}
+
+
+def test_plan_splits_oversized_input_into_ranges():
+    files = ["a.pdf", "big.pdf", "b.pdf:1-3,9", "c.pdf"]
+    entries = [_entry(1, 100), _entry(10, 1000), _entry(10, 1000), _entry(1, 100)]
+    shards = plan_shards(files, entries, ShardConfig(max_pages=4))
+    assert [[spec for spec, _, _ in shard] for shard in shards] == [
+        ["a.pdf"], ["big.pdf:1-4"], ["big.pdf:5-8"], ["big.pdf:9-10"], ["b.pdf:1-3,9"], ["c.pdf"],
+    ]
+    assert all(sum(pages for _, pages, _ in shard) <= 4 for shard in shards)
+
+
+def test_plan_splits_by_estimated_bytes():
+    files = ["big.pdf", "c.pdf"]
+    entries = [_entry(10, 1000), _entry(1, 100)]
+    shards = plan_shards(files, entries, ShardConfig(max_bytes=300))
+    assert [[spec for spec, _, _ in shard] for shard in shards] == [
+        ["big.pdf:1-3"], ["big.pdf:4-6"], ["big.pdf:7-9"], ["big.pdf:10", "c.pdf"],
+    ]
+    assert all(sum(size for _, _, size in shard) <= 300 for shard in shards)
+
+
+def test_oversized_input_recorded_as_ranges_in_manifest(tmp_path):
+    PyPDF2 = pytest.importorskip("PyPDF2")
+    from benchmark import write_synthetic_pdf
+
+    source = str(tmp_path / "big.pdf")
+    write_synthetic_pdf(source, 5)
+    output = str(tmp_path / "out" / "merged.pdf")
+    assert run_sharded_merge("pdf", [source], output, ShardConfig(max_pages=2))
+
+    with open(manifest_path(output), encoding="utf-8") as fh:
+        manifest = json.load(fh)
+    assert [shard["inputs"][0]["input"] for shard in manifest["shards"]] == [
+        source + ":1-2", source + ":3-4", source + ":5",
+    ]
+    for shard, pages in zip(manifest["shards"], (2, 2, 1)):
+        assert shard["pages"] == pages
+        assert len(PyPDF2.PdfReader(str(tmp_path / "out" / shard["file"])).pages) == pages
+
+
+def _read_shards(output_dir):
+    import re
+
+    contents = {}
+    for name in sorted(os.listdir(output_dir)):
+        if name.endswith(".pdf"):
+            with open(os.path.join(output_dir, name), "rb") as fh:
+                # 沒有檢查點時文件標識包含當前時間，比較時去掉
+                contents[name] = re.sub(rb"/ID \[<[0-9a-f]+> <[0-9a-f]+>\]", b"", fh.read())
+    return contents
+
+
+def test_interrupted_shards_resume_from_manifest(tmp_path):
+    import shutil
+    import threading
+
+    pytest.importorskip("PyPDF2")
+    from benchmark import write_synthetic_pdf
+    from merge_utils import MergeCancelled
+
+    inputs = []
+    for name in ("a.pdf", "b.pdf", "c.pdf"):
+        inputs.append(str(tmp_path / name))
+        write_synthetic_pdf(inputs[-1], 2, label=name)
+    output_dir = tmp_path / "out"
+    output = str(output_dir / "merged.pdf")
+    config = ShardConfig(max_pages=2)
+
+    assert run_sharded_merge("pdf", inputs, output, config)
+    expected = _read_shards(str(output_dir))
+    assert len(expected) == 3
+    shutil.rmtree(output_dir)
+
+    # 第 2 個分片完成後取消，模擬中途退出
+    cancel_event = threading.Event()
+
+    def stop_after_two(message):
+        if message.startswith("已完成分片 2/"):
+            cancel_event.set()
+
+    with pytest.raises(MergeCancelled):
+        run_sharded_merge("pdf", inputs, output, config, stop_after_two, cancel_event=cancel_event)
+    done = {name: os.stat(output_dir / name).st_mtime_ns for name in ("merged_part001.pdf", "merged_part002.pdf")}
+    assert not os.path.exists(output_dir / "merged_part003.pdf")
+
+    messages = []
+    assert run_sharded_merge("pdf", inputs, output, config, messages.append)
+    assert "分片輸出: 共 3 個分片，2 個已完成，跳過" in messages
+    assert not any(message.startswith(("[分片 1]", "[分片 2]")) for message in messages)
+    for name, mtime in done.items():
+        assert os.stat(output_dir / name).st_mtime_ns == mtime
+    assert _read_shards(str(output_dir)) == expected
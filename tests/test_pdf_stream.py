@@ -0,0 +1,164 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PyPDF2 = pytest.importorskip("PyPDF2")
+
+from merge_cache import MergeCache  # noqa: E402
+from pdf_stream import parallel_merge_pdfs, stream_merge_pdfs  # noqa: E402
+
+
+def _merge(merge, inputs, output, **kwargs):
+    if merge == "stream":
+        return stream_merge_pdfs(inputs, output, **kwargs)
+    return parallel_merge_pdfs(inputs, output, jobs=1, **kwargs)
+
+
+def _write_pdf(path, group_first):
+    """寫出一個頁面透明組和圖片共用同一個 ICC 配置流的單頁PDF"""
+    icc = b"\x00" * 64 + b"shared icc profile"
+    image = b"\xff\x00\x00" * 4
+    content = b"q 10 0 0 10 0 0 cm /Im0 Do Q"
+    group = b"/Group << /S /Transparency /CS [/ICCBased 6 0 R] >>"
+    resources = b"/Resources << /XObject << /Im0 4 0 R >> >>"
+    entries = [group, resources] if group_first else [resources, group]
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Count 1 /Kids [3 0 R] >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 10 10] " + b" ".join(entries)
+        + b" /Contents 5 0 R >>",
+        b"<< /Type /XObject /Subtype /Image /Width 2 /Height 2 /BitsPerComponent 8 "
+        b"/ColorSpace [/ICCBased 6 0 R] /Length %d >>\nstream\n" % len(image) + image + b"\nendstream",
+        b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream",
+        b"<< /N 3 /Length %d >>\nstream\n" % len(icc) + icc + b"\nendstream",
+    ]
+    _write_objects(path, objects)
+
+
+def _write_labelled_pdf(path, pages):
+    """寫出 pages 頁的PDF，每頁內容為 (page N)，第一頁帶一個指向最後一頁的鏈接"""
+    # 對象編號：1 目錄，2 頁面樹，之後每頁依次為頁面、內容流，最後是鏈接註釋
+    link_num = 3 + 2 * pages
+    kids = b" ".join(b"%d 0 R" % (3 + 2 * i) for i in range(pages))
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Count %d /Kids [%s] >>" % (pages, kids),
+    ]
+    for i in range(pages):
+        content = b"BT (page %d) Tj ET" % (i + 1)
+        annots = b" /Annots [%d 0 R]" % link_num if i == 0 else b""
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 10 10] /Contents %d 0 R%s >>" % (4 + 2 * i, annots)
+        )
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+    objects.append(
+        b"<< /Type /Annot /Subtype /Link /Rect [0 0 5 5] /Dest [%d 0 R /Fit] >>" % (3 + 2 * (pages - 1))
+    )
+    _write_objects(path, objects)
+
+
+def _write_objects(path, objects):
+    """把按編號排列的對象寫成帶 xref 表的PDF"""
+    data = bytearray(b"%PDF-1.7\n")
+    offsets = []
+    for num, body in enumerate(objects, 1):
+        offsets.append(len(data))
+        data += b"%d 0 obj\n" % num + body + b"\nendobj\n"
+    xref = len(data)
+    data += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        data += b"%010d 00000 n \n" % offset
+    data += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as fh:
+        fh.write(data)
+
+
+def _assert_icc_resolved(path):
+    from PyPDF2.generic import StreamObject
+
+    reader = PyPDF2.PdfReader(path)
+    assert len(reader.pages) == 2
+    for page in reader.pages:
+        image = page["/Resources"]["/XObject"]["/Im0"].get_object()
+        assert isinstance(image["/ColorSpace"][1].get_object(), StreamObject)
+        assert isinstance(page["/Group"]["/CS"][1].get_object(), StreamObject)
+
+
+@pytest.mark.parametrize("group_first", [True, False])
+@pytest.mark.parametrize("merge", ["stream", "parallel"])
+def test_shared_icc_stream_deduplicated_before_referrers(tmp_path, merge, group_first):
+    inputs = []
+    for name in ("a.pdf", "b.pdf"):
+        _write_pdf(str(tmp_path / name), group_first)
+        inputs.append(str(tmp_path / name))
+    output = str(tmp_path / "out.pdf")
+    assert _merge(merge, inputs, output)
+    _assert_icc_resolved(output)
+
+
+def test_parallel_output_matches_stream_output(tmp_path):
+    import re
+
+    inputs = []
+    for name, group_first in (("a.pdf", True), ("b.pdf", False), ("c.pdf", True)):
+        _write_pdf(str(tmp_path / name), group_first)
+        inputs.append(str(tmp_path / name))
+    outputs = [str(tmp_path / "stream.pdf"), str(tmp_path / "parallel.pdf")]
+    assert stream_merge_pdfs(inputs, outputs[0])
+    assert parallel_merge_pdfs(inputs, outputs[1], jobs=1)
+    # 文件標識包含當前時間，比較時去掉
+    contents = []
+    for path in outputs:
+        with open(path, "rb") as fh:
+            contents.append(re.sub(rb"/ID \[<[0-9a-f]+> <[0-9a-f]+>\]", b"", fh.read()))
+    assert contents[0] == contents[1]
+
+
+def _page_labels(path):
+    reader = PyPDF2.PdfReader(path)
+    return [page.get_contents().get_data().decode("latin-1") for page in reader.pages]
+
+
+@pytest.mark.parametrize("merge", ["stream", "parallel"])
+def test_page_ranges_select_and_order_pages(tmp_path, merge):
+    source = str(tmp_path / "a.pdf")
+    _write_labelled_pdf(source, 5)
+    output = str(tmp_path / "out.pdf")
+    assert _merge(merge, [source + ":3,1-2", source + ":5"], output)
+    assert _page_labels(output) == ["BT (page %d) Tj ET" % n for n in (3, 1, 2, 5)]
+
+
+@pytest.mark.parametrize("merge", ["stream", "parallel"])
+def test_link_to_unselected_page_is_not_copied(tmp_path, merge):
+    import re
+
+    from PyPDF2.generic import NullObject
+
+    from merge_trace import MergeTrace
+
+    source = str(tmp_path / "src.pdf")
+    _write_labelled_pdf(source, 5)
+    output = str(tmp_path / "out.pdf")
+    trace = MergeTrace()
+    assert _merge(merge, [source + ":1"], output, trace=trace)
+
+    with open(output, "rb") as fh:
+        data = fh.read()
+    assert len(re.findall(rb"/Type\s*/Page\b", data)) == 1
+    # 只寫出頁面、內容流和鏈接註釋，鏈接目標寫為 null
+    assert trace.counters["objects_written"] == 3
+    reader = PyPDF2.PdfReader(output)
+    assert len(reader.pages) == 1
+    link = reader.pages[0]["/Annots"][0].get_object()
+    assert isinstance(link["/Dest"][0], NullObject)
+
+
+def test_cache_key_includes_page_ranges(tmp_path):
+    source = str(tmp_path / "a.pdf")
+    _write_labelled_pdf(source, 3)
+    cache = MergeCache(str(tmp_path / "cache"))
+    keys = {cache.key("pdf-fragment", source, ranges) for ranges in (None, "1-2", "2-3")}
+    assert len(keys) == 3
@@ -0,0 +1,73 @@
+import os
+import posixpath
+import sys
+import zipfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pptx = pytest.importorskip("pptx")
+etree = pytest.importorskip("lxml.etree")
+
+from pptx_merge import NS_PKG_RELS, NS_R, xml_merge_pptx  # noqa: E402
+
+
+def _write_linked_deck(path):
+    """寫出三張幻燈片的演示文稿，第一張上的形狀點擊後跳到第三張"""
+    from pptx.util import Inches
+
+    presentation = pptx.Presentation()
+    layout = presentation.slide_layouts[5]
+    slides = []
+    for index in range(3):
+        slide = presentation.slides.add_slide(layout)
+        slide.shapes.title.text = f"slide {index + 1}"
+        slides.append(slide)
+    button = slides[0].shapes.add_textbox(Inches(1), Inches(2), Inches(2), Inches(1))
+    button.text_frame.text = "go to slide 3"
+    button.click_action.target_slide = slides[2]
+    presentation.save(path)
+
+
+def _dangling_rids(output):
+    """返回輸出中 XML 部件引用了但關係表中沒有的 r:id，形如 [(部件名, r:id)]"""
+    dangling = []
+    with zipfile.ZipFile(output) as package:
+        names = set(package.namelist())
+        for name in names:
+            if not name.endswith(".xml") or "_rels/" in name or name == "[Content_Types].xml":
+                continue
+            directory, base = posixpath.split(name)
+            rels_name = posixpath.join(directory, "_rels", base + ".rels")
+            rids = set()
+            if rels_name in names:
+                rels = etree.fromstring(package.read(rels_name))
+                rids = {rel.get("Id") for rel in rels.iter(f"{{{NS_PKG_RELS}}}Relationship")}
+            for element in etree.fromstring(package.read(name)).iter():
+                for attr, value in element.attrib.items():
+                    if attr.startswith(f"{{{NS_R}}}") and value and value not in rids:
+                        dangling.append((name, value))
+    return dangling
+
+
+def test_links_to_dropped_slides_are_removed(tmp_path):
+    deck = str(tmp_path / "deck.pptx")
+    _write_linked_deck(deck)
+    output = str(tmp_path / "out.pptx")
+    # 基礎文件和追加的文件都只選中前兩張，第三張（超鏈接的目標）被丟棄
+    assert xml_merge_pptx([f"{deck}:1-2", f"{deck}:1-2"], output)
+    assert _dangling_rids(output) == []
+    assert len(pptx.Presentation(output).slides) == 4
+
+
+def test_links_to_kept_slides_are_preserved(tmp_path):
+    deck = str(tmp_path / "deck.pptx")
+    _write_linked_deck(deck)
+    output = str(tmp_path / "out.pptx")
+    assert xml_merge_pptx([deck, deck], output)
+    assert _dangling_rids(output) == []
+    merged = pptx.Presentation(output)
+    for first in (merged.slides[0], merged.slides[3]):
+        button = first.shapes[-1]
+        assert button.click_action.target_slide is not None
@@ -0,0 +1,251 @@
+import os
+import time
+import logging
+import threading
+
+from merge_utils import notify, split_input_spec, MergeCancelled
+
+# 沒有安裝 watchdog 時按此間隔掃描文件夾；有文件系統事件時只作為兜底
+POLL_INTERVAL = 1.0
+FALLBACK_INTERVAL = 30.0
+# 合併失敗（如輸出文件被佔用）後等待多久再試
+RETRY_INTERVAL = 10.0
+
+
+class FolderWatcher:
+    """監視輸入文件夾，文件變化穩定後增量更新合併輸出
+
+    安裝了 watchdog 時由文件系統事件喚醒，否則定期比較文件的大小和修改時間。
+    一批變化在 debounce 秒內沒有新的變化後才合併，避免文件還在複製時就開始處理。
+    合併通過 MergeCache 進行，未變化的文件直接使用緩存結果，只有新增和修改過的文件
+    會被重新解析；輸出先寫入臨時文件再替換，讀取方不會看到寫了一半的文件。
+    """
+
+    def __init__(self, format_name, output_file, docs_dir="docs", cache=None, jobs=1,
+                 ranges=None, debounce=2.0, status_callback=None, order="name"):
+        self.format_name = format_name
+        self.output_file = output_file
+        self.docs_dir = docs_dir
+        self.cache = cache
+        self.jobs = jobs
+        self.ranges = ranges
+        self.order = order
+        self.debounce = debounce
+        self.status_callback = status_callback
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._observer = None
+        # 上次掃描和上次成功合併時的文件狀態：{路徑: (大小, 修改時間)}
+        self._seen = None
+        self._merged = None
+        self._changed_at = None
+        self._retry_at = 0.0
+        self._behind_since = None
+        self.merges = 0
+        self.last_merged_at = None
+        self.last_merge_seconds = None
+        self.failed_files = 0
+
+    def _scan(self):
+        from merge_backends import discover_inputs
+
+        snapshot = {}
+        for spec in discover_inputs(self.format_name, self.docs_dir, self.ranges, order=self.order):
+            path = split_input_spec(spec)[0]
+            # 跳過 Office 打開文件時創建的鎖文件
+            if os.path.basename(path).startswith("~$"):
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            snapshot[spec] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+    def _diff(self, snapshot):
+        """返回 (新增, 修改, 刪除) 的文件數"""
+        merged = self._merged or {}
+        added = sum(1 for path in snapshot if path not in merged)
+        changed = sum(1 for path, state in snapshot.items() if path in merged and merged[path] != state)
+        removed = sum(1 for path in merged if path not in snapshot)
+        return added, changed, removed
+
+    def lag(self):
+        """返回輸出落後於文件夾的程度"""
+        with self._lock:
+            added, changed, removed = self._diff(self._seen or {})
+            behind_since = self._behind_since
+            return {
+                "pending_files": added + changed + removed,
+                "added": added,
+                "changed": changed,
+                "removed": removed,
+                "seconds_behind": round(time.time() - behind_since, 1) if behind_since else 0.0,
+                "merged_files": len(self._merged or {}),
+                "merges": self.merges,
+                "last_merged_at": self.last_merged_at,
+                "last_merge_seconds": self.last_merge_seconds,
+                "failed_files": self.failed_files,
+            }
+
+    def describe_lag(self):
+        lag = self.lag()
+        if self._merged is None:
+            return "正在進行首次合併..."
+        if not lag["pending_files"]:
+            return f"輸出已是最新（{lag['merged_files']} 個文件，已更新 {lag['merges']} 次）"
+        return (
+            f"輸出落後 {lag['pending_files']} 個文件（新增 {lag['added']}，修改 {lag['changed']}，"
+            f"刪除 {lag['removed']}），已落後 {lag['seconds_behind']:.0f} 秒"
+        )
+
+    def _start_observer(self):
+        """有 watchdog 時用文件系統事件喚醒監視循環，返回是否成功"""
+        try:
+            from watchdog.observers import Observer
+            from watchdog.events import FileSystemEventHandler
+        except ImportError:
+            return False
+
+        wake = self._wake
+
+        class _Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                wake.set()
+
+        observer = Observer()
+        observer.schedule(_Handler(), self.docs_dir, recursive=False)
+        observer.daemon = True
+        observer.start()
+        self._observer = observer
+        return True
+
+    def _stop_observer(self):
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join(timeout=5)
+            self._observer = None
+
+    def merge_now(self, snapshot, cancel_event=None):
+        """按 snapshot 中的文件重新生成輸出，返回是否成功"""
+        from docs_index import order_inputs
+        from merge_backends import run_merge
+        from merge_trace import MergeTrace
+
+        root, extension = os.path.splitext(self.output_file)
+        # 保留擴展名，PowerPoint 根據擴展名決定保存格式
+        partial_file = f"{root}.partial{extension}"
+        added, changed, removed = self._diff(snapshot)
+        trace = MergeTrace(f"watch-{self.format_name}")
+        started = time.perf_counter()
+        try:
+            success = run_merge(
+                self.format_name, order_inputs(list(snapshot), self.order, self.docs_dir),
+                partial_file, None, jobs=self.jobs, cache=self.cache, cancel_event=cancel_event,
+                trace=trace
+            )
+        except MergeCancelled:
+            if os.path.exists(partial_file):
+                os.remove(partial_file)
+            raise
+        if not success:
+            return False
+        try:
+            os.replace(partial_file, self.output_file)
+        except OSError as e:
+            # Windows 上輸出文件被其他程序打開時無法替換，稍後再試
+            notify(f"無法更新輸出文件 {self.output_file}: {e}，{RETRY_INTERVAL:g} 秒後重試",
+                   self.status_callback, logging.WARNING)
+            return False
+
+        seconds = time.perf_counter() - started
+        with self._lock:
+            self._merged = snapshot
+            self.merges += 1
+            self.last_merged_at = time.time()
+            self.last_merge_seconds = round(seconds, 3)
+            self.failed_files = trace.counters.get("files_failed", 0)
+            self._behind_since = time.time() if self._diff(self._seen) != (0, 0, 0) else None
+        hits = trace.counters.get("cache_hits", 0)
+        notify(
+            f"已更新輸出 ({len(snapshot)} 個文件，新增 {added}，修改 {changed}，刪除 {removed}，"
+            f"緩存命中 {hits}，耗時 {seconds:.2f} 秒): {self.output_file}",
+            self.status_callback,
+        )
+        if self.failed_files:
+            notify(f"{self.failed_files} 個文件處理失敗，修改這些文件後會重新合併",
+                   self.status_callback, logging.WARNING)
+        return True
+
+    def run(self, stop_event):
+        """監視文件夾直到 stop_event 被設置"""
+        if not os.path.isdir(self.docs_dir):
+            os.makedirs(self.docs_dir)
+        event_driven = self._start_observer()
+        notify(
+            f"開始監視 {os.path.abspath(self.docs_dir)}"
+            f"（{'文件系統事件' if event_driven else f'每 {POLL_INTERVAL:g} 秒掃描'}，"
+            f"變化穩定 {self.debounce:g} 秒後合併），輸出: {self.output_file}",
+            self.status_callback,
+        )
+        idle_interval = FALLBACK_INTERVAL if event_driven else POLL_INTERVAL
+        try:
+            while not stop_event.is_set():
+                now = time.time()
+                snapshot = self._scan()
+                detected = False
+                with self._lock:
+                    if self._seen is None:
+                        # 啟動時的第一次掃描不需要等待防抖
+                        self._seen = snapshot
+                    elif snapshot != self._seen:
+                        self._seen = snapshot
+                        self._changed_at = now
+                        detected = True
+                    if self._diff(snapshot) != (0, 0, 0) or self._merged is None:
+                        self._behind_since = self._behind_since or now
+                    else:
+                        self._behind_since = None
+                    pending = self._behind_since is not None
+                    ready_at = max(
+                        (self._changed_at or 0.0) + self.debounce, self._retry_at
+                    )
+                if detected and self._merged is not None:
+                    notify(f"檢測到文件變化: {self.describe_lag()}", self.status_callback)
+
+                if pending and now >= ready_at:
+                    if not snapshot:
+                        with self._lock:
+                            self._merged = snapshot
+                            self._behind_since = None
+                    elif not self.merge_now(snapshot, stop_event):
+                        self._retry_at = time.time() + RETRY_INTERVAL
+                    continue
+
+                # 有待合併的變化時在防抖期滿時醒來，否則等待下一個事件或掃描
+                timeout = idle_interval
+                if pending:
+                    timeout = max(ready_at - now, 0.05)
+                    if not event_driven:
+                        timeout = min(timeout, POLL_INTERVAL)
+                self._wake.wait(timeout)
+                self._wake.clear()
+                if stop_event.is_set():
+                    break
+        except MergeCancelled:
+            pass
+        finally:
+            self._stop_observer()
+            notify("已停止監視", self.status_callback)
+
+
+def watch_folder(format_name, output_file, stop_event=None, status_callback=None, **options):
+    """在當前線程中監視 docs 文件夾並持續更新 output_file，按 Ctrl+C 或設置 stop_event 停止"""
+    stop_event = stop_event or threading.Event()
+    watcher = FolderWatcher(format_name, output_file, status_callback=status_callback, **options)
+    try:
+        watcher.run(stop_event)
+    except KeyboardInterrupt:
+        stop_event.set()
+    return watcher